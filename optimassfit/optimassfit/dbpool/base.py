@@ -0,0 +1,122 @@
+"""
+Бэкенд PostgreSQL с пулом соединений в процессе (psycopg2).
+
+Django 4.2 умеет только постоянные соединения (CONN_MAX_AGE): у каждого
+потока своё, и простаивающие потоки держат соединения с базой. Здесь
+соединение берётся из общего пула процесса на время запроса и
+возвращается в него при закрытии (CONN_MAX_AGE = 0), так что число
+соединений ограничено POOL['MAX_SIZE'] независимо от числа потоков.
+
+Настройки в DATABASES: ENGINE = 'optimassfit.optimassfit.dbpool',
+POOL = {'MAX_SIZE': 10, 'TIMEOUT': 10} — размер пула и сколько секунд
+ждать свободного соединения. При CONN_HEALTH_CHECKS соединение из пула
+проверяется перед выдачей; оборванное заменяется новым.
+"""
+import functools
+import os
+import threading
+
+import psycopg2.extensions
+import psycopg2.extras
+
+from django.db.backends.postgresql import base
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Простаивающие соединения процесса и семафор на MAX_SIZE выданных;
+    новые соединения открываются лениво. Если свободных нет, запрос ждёт
+    до timeout секунд, затем получает OperationalError.
+    """
+
+    def __init__(self, connect, max_size, timeout):
+        self._connect = connect
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._timeout = timeout
+
+    def checkout(self):
+        if not self._slots.acquire(timeout=self._timeout):
+            raise base.Database.OperationalError(f"Нет свободного соединения в пуле за {self._timeout} с")
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        try:
+            return connection or self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, connection, discard=False):
+        """Возвращает соединение; незавершённая транзакция откатывается, сломанное закрывается"""
+        try:
+            if not discard and not connection.closed:
+                status = connection.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            if discard or connection.closed:
+                connection.close()
+            else:
+                with self._lock:
+                    self._idle.append(connection)
+        except base.Database.Error:
+            connection.close()
+        finally:
+            self._slots.release()
+
+
+def get_pool(alias, settings_dict, conn_params):
+    # ключ с pid: пул, созданный до fork (preload в gunicorn), не делится между процессами;
+    # с параметрами: create_test_db меняет NAME у того же алиаса
+    key = (os.getpid(), alias, repr(sorted(conn_params.items())))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                options = settings_dict.get('POOL', {})
+                pool = _pools[key] = ConnectionPool(
+                    functools.partial(base.Database.connect, **conn_params),
+                    options.get('MAX_SIZE', 10), options.get('TIMEOUT', 10),
+                )
+    return pool
+
+
+def _is_alive(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+        return True
+    except base.Database.Error:
+        return False
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        pool = self.pool = get_pool(self.alias, self.settings_dict, conn_params)
+        connection = pool.checkout()
+        if self.settings_dict['CONN_HEALTH_CHECKS'] and not _is_alive(connection):
+            pool.checkin(connection, discard=True)
+            connection = pool.checkout()
+
+        # как в postgresql.DatabaseWrapper.get_new_connection
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = base.IsolationLevel(
+            base.IsolationLevel.READ_COMMITTED if isolation_level is None else isolation_level
+        )
+        if isolation_level is not None:
+            connection.isolation_level = self.isolation_level
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection)
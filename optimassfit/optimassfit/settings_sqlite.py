@@ -0,0 +1,47 @@
+"""
+Профиль для локальных тестов и бенчмарков без PostgreSQL: всё приложение
+работает на SQLite, сервисы не нужны.
+
+    DJANGO_SETTINGS_MODULE=optimassfit.optimassfit.settings_sqlite python manage.py check_query_plans
+
+SQLITE_PATH — файл базы (по умолчанию db.sqlite3 рядом с manage.py) или
+:memory: — общая база в памяти процесса: тесты и check_query_plans создают
+её сами, бенчмарки — через users.sqlite.prepare_memory_database. Пул соединений, statement_timeout и реплика
+в этом профиле отключены.
+"""
+import os
+
+from django.db.backends.signals import connection_created
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+from .users.sqlite import configure_connection
+
+# WAL и synchronous=NORMAL для файловой базы — только в этом профиле
+connection_created.connect(configure_connection, dispatch_uid='users.sqlite')
+
+SQLITE_PATH = os.getenv('SQLITE_PATH', str(BASE_DIR.parent / 'db.sqlite3'))
+# Сколько секунд соединение ждёт блокировку записи другого процесса или потока
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 20))
+
+if SQLITE_PATH == ':memory:':
+    # именованная база с общим кэшем видна всем соединениям процесса, а не только первому
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': 'file:optimassfit?mode=memory&cache=shared',
+            'OPTIONS': {'uri': True, 'timeout': SQLITE_BUSY_TIMEOUT},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+            'OPTIONS': {'timeout': SQLITE_BUSY_TIMEOUT},
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,  # noqa: F405
+        }
+    }
+
+# команды bench_* ходят в API тестовым клиентом Django (хост testserver)
+ALLOWED_HOSTS = ['localhost', '127.0.0.1', '[::1]', 'testserver']
@@ -0,0 +1,21 @@
+"""
+Настройки тестов: профиль SQLite (settings_sqlite), сервисы не нужны.
+
+    DJANGO_SETTINGS_MODULE=optimassfit.optimassfit.settings_test python manage.py test optimassfit.optimassfit.users
+"""
+from .settings_sqlite import *  # noqa: F401,F403
+
+# пароли в тестах не проверяют стойкость хеша, PBKDF2 только замедлил бы прогон
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# тесты идут в одном процессе — кэш процесса для них общий (runner выставляет DEBUG=False,
+# и users.E001 сработал бы; users.E002 — из-за реплики ниже)
+SILENCED_SYSTEM_CHECKS = ['users.E001', 'users.E002']
+
+# Реплика — второй файл SQLite; в тестах она зеркало тестовой базы (TEST MIRROR),
+# поэтому видит её данные, а запросы роутера к ней можно отличить по алиасу
+DATABASES['replica'] = {  # noqa: F405
+    **DATABASES['default'],  # noqa: F405
+    'NAME': str(BASE_DIR.parent / 'db_replica.sqlite3'),  # noqa: F405
+    'TEST': {'MIRROR': 'default'},
+}
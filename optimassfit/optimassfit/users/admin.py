@@ -1,8 +1,11 @@
 from django.contrib import admin, messages
 from django.utils.translation import ngettext
-from .models import Plan, User
+from .models import DeletionTask, Plan, PlanArchiveChunk, User
+from . import deletion
 
 # ───── PlanAdmin ─────
+
+
 @admin.register(Plan)
 class PlanAdmin(admin.ModelAdmin):
     list_display   = ['user', 'date_created', 'calories']
@@ -11,13 +14,23 @@ class PlanAdmin(admin.ModelAdmin):
 
 
 # ───── UserAdmin ─────
+def _queue_deletion(modeladmin, request, user_ids, delete_users):
+    task = deletion.start_deletion_task(user_ids, delete_users=delete_users)
+    modeladmin.message_user(
+        request,
+        f'Удаление {task.total_plans} планов запущено в фоне (задача {task.id}). '
+        f'Прогресс: /api/admin/deletions/{task.id}/',
+        level=messages.INFO
+    )
+
+
 @admin.action(description='Удалить все планы выбранных пользователей')
 def delete_all_plans(modeladmin, request, queryset):
-    total_plans = 0
-    for user in queryset:
-        cnt = user.plans.count()
-        user.plans.all().delete()
-        total_plans += cnt
+    user_ids = list(queryset.values_list('id', flat=True))
+    if Plan.objects.filter(user_id__in=user_ids).count() > deletion.BACKGROUND_THRESHOLD:
+        return _queue_deletion(modeladmin, request, user_ids, delete_users=False)
+
+    total_plans = deletion.delete_plans(user_ids)
 
     modeladmin.message_user(
         request,
@@ -29,15 +42,14 @@ def delete_all_plans(modeladmin, request, queryset):
         level=messages.SUCCESS
     )
 
+
 @admin.action(description='Удалить пользователей и все их планы')
 def delete_users_and_plans(modeladmin, request, queryset):
-    total_users = queryset.count()
-    total_plans = sum(u.plans.count() for u in queryset)
-
-    for user in queryset:
-        user.plans.all().delete()
+    user_ids = list(queryset.values_list('id', flat=True))
+    if Plan.objects.filter(user_id__in=user_ids).count() > deletion.BACKGROUND_THRESHOLD:
+        return _queue_deletion(modeladmin, request, user_ids, delete_users=True)
 
-    deleted, _ = queryset.delete()
+    total_users, total_plans = deletion.delete_users(user_ids)
 
     modeladmin.message_user(
         request,
@@ -49,6 +61,7 @@ def delete_users_and_plans(modeladmin, request, queryset):
         level=messages.SUCCESS
     )
 
+
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display   = [
@@ -58,7 +71,29 @@ class UserAdmin(admin.ModelAdmin):
     ]
     search_fields  = ['username', 'email']
     list_filter    = ['goal', 'training_level']
+    # денормализацию ведут services и сигналы Plan: без <select> на все планы и без перезаписи счётчика
+    readonly_fields = ['current_plan', 'plans_count']
     actions        = [
         delete_all_plans,
         delete_users_and_plans,
     ]
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # только изменённые в форме поля: прочие могли обновиться после загрузки формы
+            obj.save(update_fields=form.changed_data)
+        else:
+            obj.save()
+
+
+@admin.register(DeletionTask)
+class DeletionTaskAdmin(admin.ModelAdmin):
+    list_display    = ['id', 'status', 'delete_users', 'deleted_plans', 'total_plans', 'date_created', 'date_finished']
+    list_filter     = ['status']
+    readonly_fields = [f.name for f in DeletionTask._meta.fields]
+
+
+@admin.register(PlanArchiveChunk)
+class PlanArchiveChunkAdmin(admin.ModelAdmin):
+    list_display    = ['user', 'oldest_created', 'plans_count', 'date_updated']
+    readonly_fields = [f.name for f in PlanArchiveChunk._meta.fields]
@@ -0,0 +1,53 @@
+"""
+Аналитика по планам для админа.
+
+Агрегаты считаются по числовым столбцам БЖУ (Plan.proteins и т. д.),
+а не извлечением ключей из JSON в каждой строке; период отбирается
+по индексу users_plan_created_idx.
+"""
+from django.db.models import Avg, Count, F, Max, Min
+from django.db.models.functions import TruncMonth
+
+from .exports import filter_period
+from .models import Plan
+
+GROUP_BY = {
+    'goal': F('goal_snapshot'),
+    'training_level': F('training_level_snapshot'),
+    'month': TruncMonth('date_created'),
+}
+GRAM_FIELDS = ('proteins', 'fats', 'carbs')
+RATIO_FIELDS = ('protein_ratio', 'fat_ratio', 'carb_ratio')
+
+
+def macro_aggregates():
+    aggregates = {'plans': Count('id'), 'calories_avg': Avg('calories')}
+    for field in GRAM_FIELDS:
+        aggregates[f'{field}_avg'] = Avg(field)
+        aggregates[f'{field}_min'] = Min(field)
+        aggregates[f'{field}_max'] = Max(field)
+    for field in RATIO_FIELDS:
+        aggregates[f'{field}_avg'] = Avg(field)
+    return aggregates
+
+
+def macro_stats(date_from=None, date_to=None, goal=None, group_by=None):
+    """
+    Средние/минимальные/максимальные БЖУ планов за период одним запросом.
+    group_by — ключ GROUP_BY или None (одна строка на всю выборку).
+    ValueError — неверный период или группировка.
+    """
+    if group_by is not None and group_by not in GROUP_BY:
+        raise ValueError(f'group_by: ожидается одно из {", ".join(GROUP_BY)}')
+    queryset = filter_period(Plan.objects.filter(proteins__isnull=False), 'date_created', date_from, date_to)
+    if goal:
+        queryset = queryset.filter(goal_snapshot=goal)
+
+    if group_by is None:
+        return [{'group': None, **queryset.aggregate(**macro_aggregates())}]
+    return list(
+        queryset.order_by()
+        .values(group=GROUP_BY[group_by])
+        .annotate(**macro_aggregates())
+        .order_by('group')
+    )
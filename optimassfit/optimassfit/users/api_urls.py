@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework_nested import routers
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
-from . import api_views
+from . import api_views, async_views
 
 
 router = routers.SimpleRouter()
@@ -22,12 +22,18 @@ urlpatterns = [
     path('login/', api_views.api_login),
     path('token/', api_views.CustomObtainAuthToken.as_view()),
     path('logout/', api_views.api_logout),
+    path('async/register/', async_views.api_register),
+    path('async/login/', async_views.api_login),
+    path('async/', async_views.api_index),
+    path('async/dashboard/', async_views.api_user_dashboard),
+    path('async/plans/', async_views.api_user_plans),
 
     # User profile & plans
     path('dashboard/', api_views.api_user_dashboard),
     path('plans/', api_views.api_user_plans),
     path('profile/update/', api_views.api_profile_update),
     path('profile/update_snapshot/', api_views.api_update_snapshot),
+    path('profile/jobs/<int:job_id>/', api_views.api_plan_job_status, name='plan-job-status'),
 
     # Admin functional endpoints
     path('admin/dashboard/', api_views.api_custom_admin_dashboard),
@@ -46,6 +52,12 @@ urlpatterns = [
 
     path('admin/dashboard/',          api_views.api_custom_admin_dashboard),
     path('admin/users/<int:user_id>/', api_views.api_admin_delete_user),
+    path('admin/deletions/<int:task_id>/', api_views.api_admin_deletion_status, name='deletion-task-status'),
+    path('admin/cache-stats/',        api_views.api_admin_cache_stats),
+    path('admin/analytics/macros/',   api_views.api_admin_macro_stats),
+    path('admin/export/users/',       api_views.api_admin_export_users),
+    path('admin/export/plans/',       api_views.api_admin_export_plans),
+    path('admin/import/users/',       api_views.api_admin_import_users),
     path('', include(router.urls)),
     path('', include(plans_router.urls)),
 
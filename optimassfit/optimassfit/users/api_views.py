@@ -1,32 +1,48 @@
-from rest_framework.decorators import api_view, authentication_classes, permission_classes
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from .authentication import CachedTokenAuthentication, forget_token
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.authtoken.models import Token
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
 from django.contrib.auth import login, logout, authenticate
 from .forms import RegisterForm, ProfileUpdateForm
-from .models import User, Plan, Workout, RecommendationTemplate, WorkoutTemplate
-from .utils import calculate_calories, calculate_macros, get_age_category, get_training_recommendations
+from .models import User, Plan, PlanJob, DeletionTask, Workout, RecommendationTemplate, WorkoutTemplate
+from .services import generate_plan, enqueue_plan, materialize_workouts
+from .recommendations import apply_workout_diff, upsert_templates
+from .exercises import exercise_dictionary
+from . import analytics, deletion, exports, imports
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, get_page_size, keyset_page
+from .archive import extend_with_archive
+from .routers import replica_reads
+from .dashboard import get_cached_dashboard, record_not_modified, dashboard_cache_stats, bump_dashboard_version
 from drf_spectacular.utils import (
-    extend_schema, OpenApiResponse, OpenApiTypes, OpenApiExample)
+    extend_schema, extend_schema_view, OpenApiResponse, OpenApiTypes, OpenApiExample, OpenApiParameter)
 from .serializers import (
     LoginRequestSerializer, LoginResponseSerializer,
     RegisterRequestSerializer, RegisterResponseSerializer,
-    CSRFResponseSerializer, LogoutResponseSerializer,
+    LogoutResponseSerializer,
     ProfileUpdateRequestSerializer, GenericStatusSerializer,
     DashboardSerializer, PlansListSerializer,
-    UsersListSerializer, AdminUserSerializer, WorkoutSerializer,
-    PlanSerializer,RecommendationTemplateSerializer, RegisterDetailSerializer )
-from drf_spectacular.utils import extend_schema_view, extend_schema
+    AdminUserSerializer, AdminUsersPageSerializer, WorkoutSerializer,
+    PlanSerializer, RecommendationTemplateSerializer, RegisterDetailSerializer,
+    PlanJobSerializer, PlanJobQueuedSerializer, CacheStatsSerializer,
+    PlanListItemSerializer, PlanCompactSerializer,
+    DeletionQueuedSerializer, DeletionTaskSerializer, ImportResultSerializer,
+    TemplateBulkUpsertSerializer, TemplateUpsertResultSerializer, MacroStatsSerializer)
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.response import Response
 from rest_framework import viewsets
-from django.db import IntegrityError
+from rest_framework.pagination import PageNumberPagination
+from django.db.models import F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
+from django.db import IntegrityError, transaction
+from django.conf import settings
+from django.urls import reverse
 from rest_framework import status
 from drf_spectacular.views import SpectacularAPIView
-from drf_spectacular.utils import extend_schema
 
 
 @extend_schema(
@@ -37,8 +53,9 @@ from drf_spectacular.utils import extend_schema
 class CustomObtainAuthToken(ObtainAuthToken):
     pass
 
+
 @extend_schema(
-tags=["csrf"],
+    tags=["csrf"],
     examples=[
         OpenApiExample(
             name="Cookie set",
@@ -56,6 +73,7 @@ def api_get_csrf(request):
     """Установка CSRF-cookie для клиента"""
     return JsonResponse({'detail': 'CSRF cookie set'})
 
+
 @extend_schema(
     tags=["Auth"],
     request=RegisterRequestSerializer,
@@ -103,6 +121,7 @@ def api_register(request):
         return JsonResponse({'token': token.key, 'user': user_data}, status=201)
     return JsonResponse({'errors': form.errors}, status=400)
 
+
 @extend_schema(
     tags=["Auth"],
     request=LoginRequestSerializer,
@@ -131,11 +150,20 @@ def api_login(request):
         'password_hash': user.password,
     })
 
+
 @extend_schema(
     tags=["Profile"],
     request=ProfileUpdateRequestSerializer,
+    parameters=[
+        OpenApiParameter(
+            "mode", str, enum=["sync", "async"], required=False,
+            description="sync — план создаётся в запросе; async — ставится в очередь "
+                        "(по умолчанию берётся из настройки PLAN_GENERATION_MODE)",
+        )
+    ],
     responses={
         200: GenericStatusSerializer,
+        202: PlanJobQueuedSerializer,
         400: OpenApiResponse(description="Invalid form")
     },
     examples=[
@@ -155,7 +183,7 @@ def api_login(request):
     ]
 )
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def api_profile_update(request):
     """Обновление профиля и создание нового снимка плана"""
@@ -164,43 +192,22 @@ def api_profile_update(request):
     if not form.is_valid():
         return JsonResponse({'error': 'Invalid form'}, status=400)
 
+    mode = request.query_params.get('mode', settings.PLAN_GENERATION_MODE)
+    if mode == 'async':
+        # сохраняем только профиль и ставим план в очередь (см. run_plan_worker)
+        with transaction.atomic():
+            form.save()
+            job = enqueue_plan(user)
+        return JsonResponse({
+            'status': 'queued',
+            'job_id': job.id,
+            'status_url': reverse('plan-job-status', args=[job.id]),
+        }, status=202)
+
     form.save()
-    user.refresh_from_db()
 
-    # расчёт
-    age_cat  = get_age_category(user.age)
-    calories = calculate_calories(user, user.training_level)
-    macros   = calculate_macros(user.weight, age_cat, user.goal, user.gender)
-
-    # ищем шаблон/фолбэк
-    try:
-        tpl = RecommendationTemplate.objects.get(
-            gender=user.gender,
-            age_category=age_cat,
-            goal=user.goal
-        )
-        description = tpl.description
-        workouts    = [wt.name for wt in tpl.workouts.all()]
-    except RecommendationTemplate.DoesNotExist:
-        rec = get_training_recommendations(user.gender, age_cat, user.goal)
-        description = rec.get('description', '')
-        workouts    = rec.get('workouts', [])
-
-    # создаём план
-    plan = Plan.objects.create(
-        user=user,
-        goal_snapshot=user.goal,
-        age_snapshot=user.age,
-        height_snapshot=user.height,
-        weight_snapshot=user.weight,
-        training_level_snapshot=user.training_level,
-        calories=calories,
-        macros=macros,
-        training_recommendations=description
-    )
-    # сохраняем тренировки
-    for name in workouts:
-        Workout.objects.create(plan=plan, name=name)
+    # расчёт, шаблон/фолбэк и запись плана с тренировками — одной транзакцией
+    plan = generate_plan(user)
 
     # возвращаем статус + текущий снимок
     return JsonResponse({
@@ -216,53 +223,84 @@ def api_profile_update(request):
     })
 
 
+@extend_schema(
+    tags=["Profile"],
+    responses={200: PlanJobSerializer, 404: OpenApiResponse(description="Not found")},
+)
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def api_plan_job_status(request, job_id):
+    """Статус фоновой генерации плана (для опроса клиентом)"""
+    job = get_object_or_404(PlanJob, id=job_id, user=request.user)
+    return Response(PlanJobSerializer(job).data)
+
+
 @extend_schema(
     tags=["Plans"],
-    responses=DashboardSerializer
+    responses={200: DashboardSerializer, 304: OpenApiResponse(description="Not modified")}
 )
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def api_user_dashboard(request):
-    """Возвращает текущий план и информацию по питанию и тренировкам для авторизованного пользователя"""
-    user = request.user
-    plan_history = user.plans.all().order_by('-date_created')
-    current = plan_history[0] if plan_history else None
-
-    if current:
-        calories = current.calories
-        macros = current.macros
-        # Описание рекомендаций, сохранённое при создании плана
-        description = current.training_recommendations
-        workouts = list(current.workouts.values_list('name', flat=True))
+    """
+    Возвращает текущий план и информацию по питанию и тренировкам для авторизованного пользователя.
+    Ответ кэшируется по версии пользователя и отдаётся со строгим ETag;
+    при совпадении If-None-Match возвращается 304 без обращения к планам.
+    """
+    etag, body = get_cached_dashboard(request.user)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        record_not_modified()
+        response = HttpResponseNotModified()
     else:
-        age_cat = get_age_category(user.age)
-        calories = calculate_calories(user, user.training_level)
-        macros = calculate_macros(user.weight, age_cat, user.goal, user.gender)
-        description = ''
-        workouts = []
-
-    return JsonResponse({
-        'calories': calories,
-        'macros': macros,
-        'training_description': description,
-        'workouts': workouts,
-        'age_category': get_age_category(user.age),
-        'training_level': user.training_level,
-        'plans_count': plan_history.count()
-    })
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
 
 
-@extend_schema(tags=["Plans"], responses=PlansListSerializer)
+@extend_schema(
+    tags=["Plans"],
+    parameters=[
+        OpenApiParameter("cursor", str, required=False, description="Курсор next_cursor из предыдущего ответа"),
+        OpenApiParameter("page_size", int, required=False,
+                         description=f"Планов на странице (по умолчанию {DEFAULT_PAGE_SIZE}, "
+                                     f"максимум {MAX_PAGE_SIZE})"),
+        OpenApiParameter("view", str, enum=["full", "compact"], required=False,
+                         description="compact — только id, дата, цель, вес и калории"),
+    ],
+    responses=PlansListSerializer,
+)
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def api_user_plans(request):
-    user = request.user
-    plans = user.plans.all().order_by('-date_created')
-    serializer = PlansListSerializer({'plans': plans})
-
-    return Response(serializer.data)
+    """История планов пользователя: keyset-пагинация от новых к старым, включая архив"""
+    params = request.query_params
+    plans = Plan.objects.filter(user_id=request.user.id)
+    compact = params.get('view') == 'compact'
+    if compact:
+        plans = plans.values(*PlanCompactSerializer.Meta.fields)
+    else:
+        plans = plans.select_related('template_version')
+
+    page_size = get_page_size(params.get('page_size'))
+    rows, next_cursor = keyset_page(plans, params.get('cursor'), page_size)
+    if next_cursor is None:
+        # горячие планы закончились — продолжаем по архиву тем же курсором
+        rows, next_cursor = extend_with_archive(
+            rows, request.user.id, params.get('cursor'), page_size,
+            PlanCompactSerializer.Meta.fields if compact else None,
+        )
+    item_serializer = PlanCompactSerializer if compact else PlanListItemSerializer
+    return Response({
+        'plans': item_serializer(rows, many=True).data,
+        'next_cursor': next_cursor,
+    })
 
 
 @extend_schema(tags=["Misc"], responses=OpenApiTypes.OBJECT)
@@ -272,38 +310,229 @@ def api_index(request):
     """Точка входа в API"""
     return JsonResponse({'message': 'Welcome to OptiMassFit API'})
 
+
 @extend_schema(tags=["Auth"], responses=LogoutResponseSerializer)
 @api_view(['POST'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def api_logout(request):
     """Выход пользователя из сессии API"""
     logout(request)
+    if request.auth is not None:
+        forget_token(request.auth.key)
     return JsonResponse({'status': 'logged out'})
 
+
+class AdminUserPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+ADMIN_PLAN_HISTORY_DEFAULT = 5
+ADMIN_PLAN_HISTORY_MAX = 50
+
+
 @extend_schema(
     tags=["Admin"],
-    responses={200: AdminUserSerializer(many=True)},
+    parameters=[
+        OpenApiParameter("page", int, required=False),
+        OpenApiParameter("page_size", int, required=False, description="До 200 пользователей на странице"),
+        OpenApiParameter("search", str, required=False, description="Поиск по логину или email"),
+        OpenApiParameter("goal", str, required=False),
+        OpenApiParameter("training_level", str, required=False),
+        OpenApiParameter("date_joined_from", str, required=False, description="YYYY-MM-DD или ISO 8601"),
+        OpenApiParameter("date_joined_to", str, required=False, description="Включительно"),
+        OpenApiParameter("history", int, required=False,
+                         description=f"Сколько последних планов вернуть (по умолчанию {ADMIN_PLAN_HISTORY_DEFAULT}, "
+                                     f"максимум {ADMIN_PLAN_HISTORY_MAX}, не меньше 0)"),
+    ],
+    responses={200: AdminUsersPageSerializer, 400: OpenApiResponse(description="Invalid filter")},
 )
 @api_view(['GET'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated, IsAdminUser])
+@replica_reads
 def api_custom_admin_dashboard(request):
-    """Список всех пользователей для админа"""
-    qs = User.objects.prefetch_related("plans").order_by("username")
-    return Response(AdminUserSerializer(qs, many=True).data)
+    """
+    Список пользователей для админа: страница, фильтры и поиск.
+    На страницу уходит фиксированное число запросов — COUNT, выборка
+    пользователей с текущим планом (JOIN по current_plan) и последние
+    N планов всех пользователей страницы одним запросом с оконной функцией.
+    """
+    params = request.query_params
+    try:
+        qs = exports.filter_period(User.objects.all(), 'date_joined',
+                                   params.get('date_joined_from'), params.get('date_joined_to'))
+        history = int(params.get('history', ADMIN_PLAN_HISTORY_DEFAULT))
+        if history < 0:
+            raise ValueError(f'Некорректное значение history: {history}')
+        history = min(history, ADMIN_PLAN_HISTORY_MAX)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    for field in ('goal', 'training_level'):
+        if params.get(field):
+            qs = qs.filter(**{field: params[field]})
+    if params.get('search'):
+        qs = qs.filter(Q(username__icontains=params['search']) | Q(email__icontains=params['search']))
+
+    recent_plans = (
+        Plan.objects
+        .annotate(rank=Window(RowNumber(), partition_by=F('user_id'),
+                              order_by=[F('date_created').desc(), F('id').desc()]))
+        .filter(rank__lte=history)
+        .order_by('-date_created', '-id')
+    )
+    qs = (
+        qs.select_related('current_plan')
+        .prefetch_related(Prefetch('plans', queryset=recent_plans, to_attr='recent_plans'))
+        .order_by('username', 'id')
+    )
 
-@extend_schema(tags=["Admin"], responses=GenericStatusSerializer)
+    paginator = AdminUserPagination()
+    page = paginator.paginate_queryset(qs, request)
+    return paginator.get_paginated_response(AdminUserSerializer(page, many=True).data)
+
+
+@extend_schema(tags=["Admin"], responses={200: GenericStatusSerializer, 202: DeletionQueuedSerializer})
 @api_view(['DELETE'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def api_admin_delete_user(request, user_id):
-    """Удаление пользователя (только админ)"""
+    """Удаление пользователя (только админ); при большом числе планов — в фоне"""
     u = get_object_or_404(User, id=user_id)
-    u.delete()
+    if u.plans_count > deletion.BACKGROUND_THRESHOLD:
+        task = deletion.start_deletion_task([u.id], delete_users=True)
+        return Response({
+            'status': 'queued',
+            'task_id': task.id,
+            'status_url': reverse('deletion-task-status', args=[task.id]),
+        }, status=status.HTTP_202_ACCEPTED)
+    deletion.delete_users([u.id])
     return JsonResponse({'status': 'deleted'})
 
 
+@extend_schema(
+    tags=["Admin"],
+    responses={200: DeletionTaskSerializer, 404: OpenApiResponse(description="Not found")},
+)
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def api_admin_deletion_status(request, task_id):
+    """Прогресс фонового массового удаления"""
+    task = get_object_or_404(DeletionTask, id=task_id)
+    return Response(DeletionTaskSerializer(task).data)
+
+
+_EXPORT_PARAMETERS = [
+    OpenApiParameter("fmt", str, enum=list(exports.FORMATS), required=False,
+                     description="ndjson (по умолчанию) или csv"),
+    OpenApiParameter("date_from", str, required=False, description="Начало периода (YYYY-MM-DD или ISO 8601)"),
+    OpenApiParameter("date_to", str, required=False, description="Конец периода включительно"),
+    OpenApiParameter("goal", str, required=False, description="Фильтр по цели"),
+]
+
+
+def _export_response(request, rows_for, fields, name):
+    """Потоковый ответ с выгрузкой: память не зависит от числа строк"""
+    params = request.query_params
+    fmt = params.get('fmt', 'ndjson')
+    if fmt not in exports.FORMATS:
+        return JsonResponse({'error': f'fmt: ожидается одно из {", ".join(exports.FORMATS)}'}, status=400)
+    try:
+        # фильтры разбираются сразу, чтобы ошибка вернулась 400, а не оборвала поток
+        rows = rows_for(params.get('date_from'), params.get('date_to'), params.get('goal'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    response = StreamingHttpResponse(exports.render(rows, fields, fmt), content_type=exports.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
+
+
+@extend_schema(tags=["Admin"], parameters=_EXPORT_PARAMETERS,
+               responses={(200, 'application/x-ndjson'): OpenApiTypes.STR})
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def api_admin_export_users(request):
+    """Потоковая выгрузка пользователей (NDJSON/CSV)"""
+    return _export_response(request, exports.user_rows, exports.USER_FIELDS, 'users')
+
+
+@extend_schema(tags=["Admin"], parameters=_EXPORT_PARAMETERS,
+               responses={(200, 'application/x-ndjson'): OpenApiTypes.STR})
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def api_admin_export_plans(request):
+    """Потоковая выгрузка истории планов (NDJSON/CSV)"""
+    return _export_response(request, exports.plan_rows, exports.PLAN_FIELDS, 'plans')
+
+
+@extend_schema(
+    tags=["Admin"],
+    parameters=[OpenApiParameter("fmt", str, enum=list(imports.FORMATS), required=False,
+                                 description="csv или ndjson; по умолчанию по Content-Type")],
+    request={'text/csv': OpenApiTypes.STR, 'application/x-ndjson': OpenApiTypes.STR},
+    responses={200: ImportResultSerializer, 400: OpenApiResponse(description="Bad format")},
+)
+@api_view(['POST'])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def api_admin_import_users(request):
+    """Массовый импорт пользователей из CSV/NDJSON: тело запроса или файл в поле file"""
+    fmt = request.query_params.get('fmt') or ('csv' if 'csv' in request.content_type else 'ndjson')
+    if request.content_type.startswith('multipart/'):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return JsonResponse({'error': 'file: файл не передан'}, status=400)
+        data = upload.read()
+    else:
+        data = request.body
+    try:
+        rows = imports.parse_rows(data, fmt)
+    except (ValueError, UnicodeDecodeError) as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return Response(imports.import_users(rows))
+
+
+@extend_schema(
+    tags=["Admin"],
+    parameters=[
+        OpenApiParameter("date_from", str, required=False, description="Начало периода (YYYY-MM-DD или ISO 8601)"),
+        OpenApiParameter("date_to", str, required=False, description="Конец периода включительно"),
+        OpenApiParameter("goal", str, required=False, description="Фильтр по цели на момент плана"),
+        OpenApiParameter("group_by", str, enum=list(analytics.GROUP_BY), required=False,
+                         description="Группировка; без неё — одна строка на всю выборку"),
+    ],
+    responses={200: MacroStatsSerializer, 400: OpenApiResponse(description="Invalid filter")},
+)
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsAdminUser])
+@replica_reads
+def api_admin_macro_stats(request):
+    """Средние, минимум и максимум БЖУ по планам за период (агрегаты по числовым столбцам)"""
+    params = request.query_params
+    group_by = params.get('group_by') or None
+    try:
+        groups = analytics.macro_stats(params.get('date_from'), params.get('date_to'), params.get('goal'), group_by)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return Response(MacroStatsSerializer({'group_by': group_by, 'groups': groups}).data)
+
+
+@extend_schema(tags=["Admin"], responses=CacheStatsSerializer)
+@api_view(['GET'])
+@authentication_classes([CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def api_admin_cache_stats(request):
+    """Счётчики кэша дашборда (попадания, промахи, ответы 304)"""
+    return Response({'dashboard': dashboard_cache_stats()})
+
 
 @extend_schema(
     tags=["Profile"],
@@ -311,48 +540,23 @@ def api_admin_delete_user(request, user_id):
     responses={"200": GenericStatusSerializer},
 )
 @api_view(['PUT'])
-@authentication_classes([TokenAuthentication])
+@authentication_classes([CachedTokenAuthentication])
 @permission_classes([IsAuthenticated])
 def api_update_snapshot(request):
     """Обновление отдельных полей профиля и создание нового снимка плана"""
     user = request.user
-    # Обновляем профиль
-    for field in ['age', 'height', 'weight', 'goal', 'training_level', 'target_months']:
-        if field in request.data:
-            setattr(user, field, request.data[field])
-    user.save()
-
-    # Расчёт параметров
-    age_cat = get_age_category(user.age)
-    calories = calculate_calories(user, user.training_level)
-    macros = calculate_macros(user.weight, age_cat, user.goal, user.gender)
-
-    # Получаем шаблон рекомендаций
-    tpl = RecommendationTemplate.objects.get(
-        gender=user.gender,
-        age_category=age_cat,
-        goal=user.goal
-    )
+    # Обновляем профиль; request.user — снимок из кэша токенов, поэтому пишем только переданные поля
+    fields = [field for field in ProfileUpdateForm.Meta.fields if field in request.data]
+    for field in fields:
+        setattr(user, field, request.data[field])
+    user.save(update_fields=fields)
 
-    # Создаём новый план
-    plan = Plan.objects.create(
-        user=user,
-        goal_snapshot=user.goal,
-        age_snapshot=user.age,
-        height_snapshot=user.height,
-        weight_snapshot=user.weight,
-        training_level_snapshot=user.training_level,
-        calories=calories,
-        macros=macros,
-        training_recommendations=tpl.description
-    )
-
-    # Создаём Workout-записи
-    for wt in tpl.workouts.all():
-        Workout.objects.create(plan=plan, name=wt.name)
+    # Расчёт параметров и создание нового плана с тренировками
+    plan = generate_plan(user)
 
     return JsonResponse({'new_plan_id': plan.id})
 
+
 @extend_schema(
     tags=["Admin"],
     request=WorkoutSerializer,
@@ -371,15 +575,43 @@ class WorkoutViewSet(viewsets.ModelViewSet):
     CRUD для Workout в рамках плана (Admin only).
     """
     serializer_class = WorkoutSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def get_queryset(self):
-        return Workout.objects.filter(plan_id=self.kwargs["plan_pk"])
+        return Workout.objects.filter(plan_id=self.kwargs['plan_pk'])
+
+    def list(self, request, *args, **kwargs):
+        plan = self._plan()
+        if plan.workouts_customized or not plan.template_version_id:
+            return super().list(request, *args, **kwargs)
+        # план ещё не настраивали: упражнения версии шаблона, строк Workout (и их id) пока нет
+        return Response([{'id': None, 'plan': plan.id, 'name': name} for name in plan.template_version.workouts])
 
     def perform_create(self, serializer):
-        # Привязываем к плану из URL
-        serializer.save(plan_id=self.kwargs['plan_pk'])
+        # добавление упражнения — настройка плана: сначала копируем упражнения из версии шаблона
+        plan = self._plan()
+        materialize_workouts(plan)
+        serializer.save(plan=plan)
+        self._bump_dashboard()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self._bump_dashboard()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self._bump_dashboard()
+
+    def _plan(self):
+        return get_object_or_404(Plan.objects.select_related('template_version'), pk=self.kwargs['plan_pk'])
+
+    def _bump_dashboard(self):
+        # тренировки плана видны в дашборде владельца
+        user_id = Plan.objects.filter(pk=self.kwargs['plan_pk']).values_list('user_id', flat=True).first()
+        if user_id is not None:
+            bump_dashboard_version(user_id)
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -403,7 +635,7 @@ class WorkoutViewSet(viewsets.ModelViewSet):
                     "weight_snapshot": 75.0,
                     "training_level_snapshot": "1",
                     "calories": 1800,
-                    "macros": {"protein": 120, "fat": 60, "carbs": 200}
+                    "macros": {"proteins": 120, "fats": 60, "carbs": 200}
                 },
                 request_only=True
             ),
@@ -418,7 +650,7 @@ class WorkoutViewSet(viewsets.ModelViewSet):
                     "weight_snapshot": 68.0,
                     "training_level_snapshot": "2-3",
                     "calories": 2600,
-                    "macros": {"protein": 140, "fat": 80, "carbs": 300}
+                    "macros": {"proteins": 140, "fats": 80, "carbs": 300}
                 },
                 request_only=True
             ),
@@ -433,7 +665,7 @@ class WorkoutViewSet(viewsets.ModelViewSet):
                     "weight_snapshot": 70.0,
                     "training_level_snapshot": "4-5",
                     "calories": 2200,
-                    "macros": {"protein": 130, "fat": 70, "carbs": 250}
+                    "macros": {"proteins": 130, "fats": 70, "carbs": 250}
                 },
                 request_only=True
             ),
@@ -466,7 +698,7 @@ class PlanViewSet(viewsets.ModelViewSet):
     """
     queryset = Plan.objects.all()
     serializer_class = PlanSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def perform_create(self, serializer):
@@ -475,6 +707,7 @@ class PlanViewSet(viewsets.ModelViewSet):
         user = get_object_or_404(User, pk=user_id)
         serializer.save(user=user)
 
+
 @extend_schema_view(
     list=extend_schema(tags=["Admin"]),
     retrieve=extend_schema(tags=["Admin"]),
@@ -489,9 +722,10 @@ class RecommendationTemplateViewSet(viewsets.ModelViewSet):
     При POST, если шаблон с такими полями уже есть,
     просто добавляем к нему новые упражнения.
     """
-    queryset = RecommendationTemplate.objects.all()
+    # упражнения всех шаблонов страницы — одним запросом
+    queryset = RecommendationTemplate.objects.prefetch_related('workouts')
     serializer_class = RecommendationTemplateSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def create(self, request, *args, **kwargs):
@@ -509,12 +743,16 @@ class RecommendationTemplateViewSet(viewsets.ModelViewSet):
         ).first()
 
         if tpl:
-            # 2) Добавляем к нему новые упражнения
-            created_names = set(tpl.workouts.values_list('name', flat=True))
-            for w in workouts:
-                name = w.get('name')
-                if name and name not in created_names:
-                    WorkoutTemplate.objects.create(recommendation=tpl, name=name)
+            # 2) Добавляем к нему новые упражнения (одним INSERT)
+            created_ids = set(tpl.workouts.values_list('exercise_id', flat=True))
+            exercise_ids = exercise_dictionary.intern(w.get('name') for w in workouts if w.get('name'))
+            new_ids = dict.fromkeys(
+                exercise_ids[w['name']] for w in workouts
+                if w.get('name') and exercise_ids[w['name']] not in created_ids
+            )
+            apply_workout_diff([], [
+                WorkoutTemplate(recommendation=tpl, exercise_id=exercise_id) for exercise_id in new_ids
+            ])
             # 3) Вернём обновленный объект
             serializer = self.get_serializer(tpl)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -529,6 +767,25 @@ class RecommendationTemplateViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @extend_schema(
+        request=TemplateBulkUpsertSerializer,
+        responses={200: TemplateUpsertResultSerializer, 400: OpenApiResponse(description="Invalid payload")},
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-upsert')
+    def bulk_upsert(self, request):
+        """
+        Загрузка каталога шаблонов одним запросом: новые создаются,
+        у существующих обновляется описание, а упражнения приводятся
+        к переданному списку по разнице. Всё в одной транзакции.
+        """
+        serializer = TemplateBulkUpsertSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = [
+            {**item, 'workouts': [w['name'] for w in item['workouts']]}
+            for item in serializer.validated_data['templates']
+        ]
+        return Response(upsert_templates(items))
+
 
 @extend_schema(
     tags=["schema"],
@@ -540,4 +797,3 @@ class CustomSpectacularAPIView(SpectacularAPIView):
     Класс-наследник SpectacularAPIView, чтобы пометить его тегом 'schema'.
     """
     pass
-
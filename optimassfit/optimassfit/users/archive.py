@@ -0,0 +1,279 @@
+"""
+Архив старых снимков планов.
+
+Снимок Plan пишется при каждом обновлении профиля, а читаются в основном
+последние планы. Снимки старше PLAN_RETENTION_DAYS (кроме текущего плана)
+переносятся в PlanArchiveChunk — куски по CHUNK_PLANS снимков пользователя
+списками значений без повторения имён полей; PostgreSQL сжимает такое
+значение в TOAST.
+Горячие таблицы users_plan и users_workout остаются небольшими, поэтому
+их индексы и VACUUM не растут вместе с историей.
+
+Изменённые админом упражнения (Workout) удаляются вместе с планом,
+поэтому у изменённых планов и планов без версии шаблона строка архива
+хранит workouts_customized и названия упражнений последним элементом.
+
+История планов (api_user_plans) сначала читает горячие планы по индексу,
+а архив подгружает только когда они закончились: курсор (date_created, id)
+общий, архивные планы всегда старше горячих. Куски пользователя не
+пересекаются по (date_created, id), и все, кроме самого нового, полные,
+поэтому страница архива читает по индексу один-два куска раньше курсора,
+а не всю историю пользователя.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .exercises import exercise_dictionary
+from .models import Plan, PlanArchiveChunk, PlanJob, TemplateVersion, User, Workout
+from .pagination import decode_cursor, split_page
+
+ARCHIVE_FIELDS = (
+    'id', 'date_created', 'goal_snapshot', 'age_snapshot', 'height_snapshot', 'weight_snapshot',
+    'training_level_snapshot', 'calories', 'macros', 'training_recommendations', 'template_version_id',
+    'workouts_customized',
+)
+# Пользователей на одну транзакцию переноса
+DEFAULT_CHUNK_SIZE = 500
+# Снимков в одном куске архива
+CHUNK_PLANS = 100
+# Порядок кусков пользователя: от новых к старым (индекс users_archive_user_oldest_idx)
+CHUNK_ORDER = ('-oldest_created', '-oldest_plan_id')
+
+
+def retention_cutoff(days=None):
+    """Момент, старше которого планы уходят в архив"""
+    return timezone.now() - timedelta(days=settings.PLAN_RETENTION_DAYS if days is None else days)
+
+
+def archivable_plans(cutoff):
+    """Планы старше cutoff, кроме текущих планов пользователей"""
+    current = User.objects.filter(current_plan__isnull=False).values('current_plan_id')
+    return Plan.objects.filter(date_created__lt=cutoff).exclude(id__in=current)
+
+
+def archive_plans(cutoff, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Переносит планы старше cutoff в архив пачками по chunk_size пользователей,
+    каждая пачка — в своей транзакции. progress(users, plans) вызывается после пачки.
+    Возвращает (пользователей, перенесено планов).
+    """
+    user_ids = list(archivable_plans(cutoff).order_by('user_id').values_list('user_id', flat=True).distinct())
+    archived = 0
+    for start in range(0, len(user_ids), chunk_size):
+        with transaction.atomic():
+            archived += _archive_users(user_ids[start:start + chunk_size], cutoff)
+        if progress:
+            progress(min(start + chunk_size, len(user_ids)), archived)
+    return len(user_ids), archived
+
+
+def _archive_users(user_ids, cutoff):
+    # блокировка пользователей не даёт новому плану стать текущим посреди переноса
+    list(User.objects.select_for_update().filter(pk__in=user_ids).values_list('id', flat=True))
+    old = archivable_plans(cutoff).filter(user_id__in=user_ids)
+
+    rows = list(old.order_by('user_id', 'date_created', 'id').values_list('user_id', *ARCHIVE_FIELDS))
+    if not rows:
+        return 0
+    workouts = _workout_names(old)
+
+    packed = defaultdict(list)
+    for user_id, *values in rows:
+        values[1] = values[1].isoformat()
+        packed[user_id].append(values + [workouts.get(values[0])])
+
+    # новые снимки обычно моложе всего архива: дописываем самый новый кусок и добавляем полные
+    newest = PlanArchiveChunk.objects.filter(user_id=OuterRef('user_id')).order_by(*CHUNK_ORDER).values('id')[:1]
+    newest_chunks = {
+        chunk.user_id: chunk
+        for chunk in PlanArchiveChunk.objects.select_for_update().filter(user_id__in=list(packed), id=Subquery(newest))
+    }
+    created, updated, rebuilt = [], [], []
+    for user_id, rows in packed.items():
+        chunk = newest_chunks.get(user_id)
+        if chunk is not None and _row_key(chunk.plans[-1]) > _row_key(rows[0]):
+            # снимок старше уже заархивированных — куски пользователя собираются заново
+            rebuilt.append(user_id)
+            rows = [row for plans in _user_chunks(user_id) for row in plans] + rows
+            rows.sort(key=_row_key)
+            chunk = None
+        if chunk is not None and chunk.plans_count < CHUNK_PLANS:
+            room = CHUNK_PLANS - chunk.plans_count
+            _fill(chunk, chunk.plans + rows[:room])
+            updated.append(chunk)
+            rows = rows[room:]
+        for start in range(0, len(rows), CHUNK_PLANS):
+            created.append(_fill(PlanArchiveChunk(user_id=user_id), rows[start:start + CHUNK_PLANS]))
+    PlanArchiveChunk.objects.filter(user_id__in=rebuilt)._raw_delete(connection.alias)
+    PlanArchiveChunk.objects.bulk_create(created)
+    PlanArchiveChunk.objects.bulk_update(updated, ['plans', 'plans_count', 'max_plan_id', 'min_plan_id'])
+
+    # ссылки снимаем, строки удаляем одним DELETE на таблицу, как в deletion.delete_plans
+    PlanJob.objects.filter(plan__in=old).update(plan=None)
+    Workout.objects.filter(plan__in=old)._raw_delete(connection.alias)
+    return old._raw_delete(connection.alias)
+
+
+def _row_key(row):
+    return parse_datetime(row[1]), row[0]
+
+
+def _fill(chunk, rows):
+    """Записывает в кусок снимки rows (от старых к новым) и его ключи"""
+    chunk.plans = rows
+    chunk.plans_count = len(rows)
+    chunk.oldest_created, chunk.oldest_plan_id = _row_key(rows[0])
+    ids = [row[0] for row in rows]
+    chunk.min_plan_id, chunk.max_plan_id = min(ids), max(ids)
+    return chunk
+
+
+def _user_chunks(user_id):
+    """Снимки пользователя по кускам, от старых к новым"""
+    return reversed(list(PlanArchiveChunk.objects.filter(user_id=user_id).order_by(*CHUNK_ORDER)
+                         .values_list('plans', flat=True)))
+
+
+def _workout_names(plans):
+    """{id плана: названия упражнений} для изменённых планов и планов без версии шаблона"""
+    own = plans.filter(Q(workouts_customized=True) | Q(template_version__isnull=True))
+    exercise_ids = {plan_id: [] for plan_id in own.values_list('id', flat=True)}
+    for plan_id, exercise_id in Workout.objects.filter(plan__in=own).values_list('plan_id', 'exercise_id'):
+        exercise_ids[plan_id].append(exercise_id)
+    # словарь упражнений — одним вызовом: внутри транзакции кэш процесса ещё не пополнен
+    all_ids = [exercise_id for ids in exercise_ids.values() for exercise_id in ids]
+    names = dict(zip(all_ids, exercise_dictionary.names(all_ids)))
+    return {plan_id: [names[exercise_id] for exercise_id in ids] for plan_id, ids in exercise_ids.items()}
+
+
+def _unpack(user_id, row):
+    values = dict(zip(ARCHIVE_FIELDS, row))
+    values['date_created'] = parse_datetime(values['date_created'])
+    plan = Plan(user_id=user_id, **values)
+    # в строках, записанных до хранения упражнений, последнего элемента нет
+    plan.archived_workouts = row[len(ARCHIVE_FIELDS)] if len(row) > len(ARCHIVE_FIELDS) else None
+    return plan
+
+
+def archived_chunks(user_id, before):
+    """Куски пользователя со снимками раньше before, от новых к старым"""
+    chunks = PlanArchiveChunk.objects.filter(user_id=user_id)
+    if before is not None:
+        created, plan_id = before
+        chunks = chunks.filter(Q(oldest_created__lt=created) | Q(oldest_created=created, oldest_plan_id__lt=plan_id))
+    return chunks.order_by(*CHUNK_ORDER).values_list('plans', flat=True)
+
+
+def _chunks_to_read(limit, plans):
+    # первый кусок может оказаться почти весь новее курсора, остальные полные
+    return None if limit is None else (limit - len(plans)) // CHUNK_PLANS + 2
+
+
+def _select_archived(user_id, chunks, before, limit, plans):
+    """
+    Дописывает в plans снимки кусков (от новых к старым) раньше before, не больше limit.
+    Возвращает ключ самого старого снимка прочитанных кусков — границу следующего чтения.
+    """
+    for rows in chunks:
+        for row in reversed(rows):
+            if limit is not None and len(plans) >= limit:
+                break
+            plan = _unpack(user_id, row)
+            if before is None or (plan.date_created, plan.id) < before:
+                plans.append(plan)
+    return _row_key(chunks[-1][0]) if chunks else before
+
+
+def _version_ids(plans):
+    return {plan.template_version_id for plan in plans} - {None}
+
+
+def _attach_versions(plans, versions):
+    for plan in plans:
+        if plan.template_version_id:
+            plan.template_version = versions[plan.template_version_id]
+
+
+def archived_plans(user_id, before=None, limit=None, with_versions=True):
+    """
+    Несохранённые Plan из архива пользователя от новых к старым,
+    строго раньше позиции before=(date_created, id). Читаются только
+    куски, нужные для limit планов; версии шаблонов подставляются
+    одним запросом (with_versions=False — без них).
+    """
+    plans = []
+    while True:
+        count = _chunks_to_read(limit, plans)
+        chunks = archived_chunks(user_id, before)
+        chunks = list(chunks if count is None else chunks[:count])
+        before = _select_archived(user_id, chunks, before, limit, plans)
+        if count is None or len(chunks) < count or len(plans) >= limit:
+            break
+    if with_versions:
+        _attach_versions(plans, TemplateVersion.objects.in_bulk(_version_ids(plans)))
+    return plans
+
+
+async def aarchived_plans(user_id, before=None, limit=None, with_versions=True):
+    """archived_plans для корутин (async_views)"""
+    plans = []
+    while True:
+        count = _chunks_to_read(limit, plans)
+        chunks = archived_chunks(user_id, before)
+        chunks = [rows async for rows in (chunks if count is None else chunks[:count])]
+        before = _select_archived(user_id, chunks, before, limit, plans)
+        if count is None or len(chunks) < count or len(plans) >= limit:
+            break
+    if with_versions:
+        _attach_versions(plans, await TemplateVersion.objects.ain_bulk(_version_ids(plans)))
+    return plans
+
+
+def archived_plan(user_id, plan_id):
+    """Архивный план пользователя по id или None: читается только кусок с подходящим диапазоном id"""
+    chunks = PlanArchiveChunk.objects.filter(user_id=user_id, min_plan_id__lte=plan_id, max_plan_id__gte=plan_id)
+    for rows in chunks.values_list('plans', flat=True):
+        for row in rows:
+            if row[0] == plan_id:
+                plan = _unpack(user_id, row)
+                _attach_versions([plan], TemplateVersion.objects.in_bulk(_version_ids([plan])))
+                return plan
+    return None
+
+
+def _archive_before(rows, cursor):
+    # архив читается после последнего горячего плана страницы или после курсора запроса
+    if rows:
+        last = rows[-1]
+        return (last['date_created'], last['id']) if isinstance(last, dict) else (last.date_created, last.id)
+    return decode_cursor(cursor) if cursor else None
+
+
+def _merge_page(rows, extra, page_size, fields):
+    if fields is not None:
+        extra = [{field: getattr(plan, field) for field in fields} for plan in extra]
+    return split_page(list(rows) + extra, page_size)
+
+
+def extend_with_archive(rows, user_id, cursor, page_size, fields=None):
+    """
+    Дополняет неполную страницу горячих планов архивными.
+    rows — планы страницы (модели или словари с полями fields), cursor —
+    курсор запроса. Возвращает (записи страницы, курсор следующей или None).
+    """
+    extra = archived_plans(user_id, _archive_before(rows, cursor), page_size - len(rows) + 1,
+                           with_versions=fields is None)
+    return _merge_page(rows, extra, page_size, fields)
+
+
+async def aextend_with_archive(rows, user_id, cursor, page_size, fields=None):
+    """extend_with_archive для корутин (async_views)"""
+    extra = await aarchived_plans(user_id, _archive_before(rows, cursor), page_size - len(rows) + 1,
+                                  with_versions=fields is None)
+    return _merge_page(rows, extra, page_size, fields)
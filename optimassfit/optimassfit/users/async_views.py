@@ -0,0 +1,242 @@
+"""
+Асинхронные варианты эндпоинтов для ASGI-развёртывания (asgi.py).
+
+PBKDF2 выполняется в ограниченном пуле потоков (hashlib отпускает GIL),
+поэтому цикл событий продолжает обслуживать другие запросы. Ключ токена
+пользователя кэшируется: повторный вход не делает get_or_create.
+В отличие от api_login/api_register сессия не создаётся — эти точки
+только для клиентов с токеном; сигналы user_logged_in (он же обновляет
+last_login) и user_login_failed отправляются, как при authenticate/login.
+
+Дашборд, история планов и индекс API — корутины без DRF: синхронная
+view под ASGI целиком уходит в поток через sync_to_async, а здесь токен,
+кэш и ORM вызываются асинхронно (aget, afirst, async for) и ответ
+совпадает с синхронным вариантом.
+"""
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException, NotAuthenticated
+
+from .archive import aextend_with_archive
+from .authentication import CachedTokenAuthentication, issued_token_key
+from .dashboard import aget_cached_dashboard, arecord_not_modified
+from .forms import RegisterForm
+from .models import Plan, User
+from .pagination import akeyset_page, get_page_size
+from .routers import replica_reads
+from .serializers import PlanCompactSerializer, PlanListItemSerializer, RegisterDetailSerializer
+
+# Пул ограничивает число одновременных хеширований на процесс
+password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASHER_WORKERS, thread_name_prefix='password-hasher'
+)
+
+
+async def _run_hasher(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+
+
+def _check(password, encoded):
+    """Проверяет пароль; если хеш устарел, возвращает и новый хеш"""
+    upgraded = []
+    ok = check_password(password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return ok, (upgraded[0] if upgraded else None)
+
+
+async def _issue_token(user):
+    """Ключ токена пользователя: из кэша, иначе из БД (создаётся при отсутствии)"""
+    key = await cache.aget(issued_token_key(user.pk))
+    if key is None:
+        key = await Token.objects.filter(user=user).values_list('key', flat=True).afirst()
+        if key is None:
+            key = (await Token.objects.acreate(user=user)).key
+        await cache.aset(issued_token_key(user.pk), key, timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT)
+    return key
+
+
+def post_endpoint(view):
+    """
+    Аналог csrf_exempt + require_POST для корутин: в Django 4.2 эти
+    декораторы оборачивают view синхронной функцией.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        return await view(request, *args, **kwargs)
+
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+def get_endpoint(view):
+    """Аналог require_GET для корутин"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _api_error(exc):
+    detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+    response = JsonResponse(detail, status=exc.status_code)
+    if exc.status_code == 401:
+        response['WWW-Authenticate'] = CachedTokenAuthentication.keyword
+    return response
+
+
+def token_required(view):
+    """
+    Аналог CachedTokenAuthentication + IsAuthenticated для корутин:
+    request.user и request.auth — пользователь и токен из заголовка.
+    Исключения DRF (401, 400 от ValidationError) отдаются как в api_views.
+    """
+    authentication = CachedTokenAuthentication()
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            credentials = await authentication.aauthenticate(request)
+            if credentials is None:
+                raise NotAuthenticated()
+            request.user, request.auth = credentials
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            return _api_error(exc)
+
+    return wrapper
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+async def _login_failed(request, username):
+    """Ответ на неверные учётные данные; user_login_failed — как у authenticate(), пароль скрыт"""
+    await sync_to_async(user_login_failed.send)(
+        sender=__name__, credentials={'username': username, 'password': '*' * 20}, request=request,
+    )
+    return JsonResponse({'error': 'Invalid credentials'}, status=400)
+
+
+@post_endpoint
+async def api_login(request):
+    """Вход по логину и паролю, возвращает токен (асинхронный вариант /api/login/)"""
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    username, password = data.get('username'), data.get('password')
+    if not username or not password:
+        return await _login_failed(request, username)
+
+    user = await User.objects.filter(username=username).afirst()
+    if user is None:
+        # как ModelBackend: хешируем и для несуществующего логина, чтобы не выдавать его временем ответа
+        await _run_hasher(make_password, password)
+        return await _login_failed(request, username)
+
+    ok, new_hash = await _run_hasher(_check, password, user.password)
+    if not ok or not user.is_active:
+        return await _login_failed(request, username)
+    if new_hash:
+        user.password = new_hash
+        await user.asave(update_fields=['password'])
+    # как login(): приёмник update_last_login из django.contrib.auth сохраняет last_login
+    await sync_to_async(user_logged_in.send)(sender=user.__class__, request=request, user=user)
+
+    return JsonResponse({
+        'token': await _issue_token(user),
+        'username': user.username,
+        'password_hash': user.password,
+    })
+
+
+@post_endpoint
+async def api_register(request):
+    """Регистрация нового пользователя (асинхронный вариант /api/register/)"""
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    form = RegisterForm(data)
+    # проверка уникальности обращается к БД синхронно
+    if not await sync_to_async(form.is_valid)():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    user = form.instance
+    user.password = await _run_hasher(make_password, form.cleaned_data['password1'])
+    await user.asave()
+    return JsonResponse({
+        'token': await _issue_token(user),
+        'user': RegisterDetailSerializer(user).data,
+    }, status=201)
+
+
+@get_endpoint
+async def api_index(request):
+    """Точка входа в API (асинхронный вариант /api/)"""
+    return JsonResponse({'message': 'Welcome to OptiMassFit API'})
+
+
+@get_endpoint
+@token_required
+@replica_reads
+async def api_user_dashboard(request):
+    """Дашборд пользователя с ETag (асинхронный вариант /api/dashboard/)"""
+    etag, body = await aget_cached_dashboard(request.user)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        await arecord_not_modified()
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+@get_endpoint
+@token_required
+@replica_reads
+async def api_user_plans(request):
+    """История планов с keyset-пагинацией и архивом (асинхронный вариант /api/plans/)"""
+    params = request.GET
+    plans = Plan.objects.filter(user_id=request.user.id)
+    compact = params.get('view') == 'compact'
+    if compact:
+        plans = plans.values(*PlanCompactSerializer.Meta.fields)
+    else:
+        plans = plans.select_related('template_version')
+
+    page_size = get_page_size(params.get('page_size'))
+    rows, next_cursor = await akeyset_page(plans, params.get('cursor'), page_size)
+    if next_cursor is None:
+        rows, next_cursor = await aextend_with_archive(
+            rows, request.user.id, params.get('cursor'), page_size,
+            PlanCompactSerializer.Meta.fields if compact else None,
+        )
+    item_serializer = PlanCompactSerializer if compact else PlanListItemSerializer
+    return JsonResponse({
+        'plans': item_serializer(rows, many=True).data,
+        'next_cursor': next_cursor,
+    })
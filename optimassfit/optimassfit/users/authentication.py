@@ -0,0 +1,140 @@
+"""
+Аутентификация по токену с кэшем в памяти процесса.
+
+TokenAuthentication на каждый запрос делает JOIN authtoken_token и
+users_user. CachedTokenAuthentication хранит ограниченный LRU-словарь
+«ключ токена → снимок строки пользователя» с TTL. Снимок сверяется с
+версией пользователя из dashboard (её поднимают save() пользователя,
+запись и удаление планов, смена и удаление токена), поэтому при общем
+кэше Django (REDIS_URL) изменения видны всем процессам, а повторные
+запросы с тем же токеном не обращаются к базе. С кэшем процесса другие
+воркеры узнают об изменении только через AUTH_TOKEN_CACHE_TIMEOUT
+(по умолчанию 5 с вместо 300). aauthenticate — тот же путь для корутин
+async_views на асинхронном ORM и асинхронном API кэша.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+from .dashboard import aget_dashboard_version, get_dashboard_version
+from .models import User
+
+_FIELD_NAMES = [field.attname for field in User._meta.concrete_fields]
+
+
+class TokenCache:
+    """Потокобезопасный LRU с TTL: ключ токена → (id пользователя, версия, значения полей, срок)"""
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[3] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, user_id, version, values):
+        with self._lock:
+            self._entries[key] = (user_id, version, values, time.monotonic() + self.timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+
+
+def issued_token_key(user_id):
+    """Ключ кэша Django с выданным токеном пользователя (async_views)"""
+    return f'auth:issued:{user_id}'
+
+
+def forget_token(key):
+    """Убирает токен из кэша текущего процесса (выход, смена токена)"""
+    token_cache.forget(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Замена TokenAuthentication: снимок пользователя берётся из token_cache"""
+
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is not None:
+            user_id, version, values = entry[:3]
+            if version == get_dashboard_version(user_id):
+                return self._cached_credentials(key, values)
+            token_cache.forget(key)
+
+        # версию читаем до запроса: bump во время чтения даст промах, а не устаревший снимок
+        user_id = self.get_model().objects.filter(key=key).values_list('user_id', flat=True).first()
+        version = get_dashboard_version(user_id) if user_id is not None else None
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user.pk, version, [getattr(user, name) for name in _FIELD_NAMES])
+        return user, token
+
+    def _cached_credentials(self, key, values):
+        # каждый запрос получает свой экземпляр: изменения в view не попадут в кэш
+        user = User.from_db(DEFAULT_DB_ALIAS, _FIELD_NAMES, values)
+        return user, self.get_model()(key=key, user=user)
+
+    async def aauthenticate(self, request):
+        """authenticate() для корутин: (user, token) или None, если заголовка с токеном нет"""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. '
+                                                    'Token string should not contain invalid characters.'))
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is not None:
+            user_id, version, values = entry[:3]
+            if version == await aget_dashboard_version(user_id):
+                return self._cached_credentials(key, values)
+            token_cache.forget(key)
+
+        user_id = await self.get_model().objects.filter(key=key).values_list('user_id', flat=True).afirst()
+        if user_id is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        version = await aget_dashboard_version(user_id)
+        token = await self.get_model().objects.select_related('user').filter(key=key).afirst()
+        if token is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        token_cache.set(key, token.user.pk, version, [getattr(token.user, name) for name in _FIELD_NAMES])
+        return token.user, token
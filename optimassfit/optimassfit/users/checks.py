@@ -0,0 +1,57 @@
+"""
+Системные проверки приложения users.
+
+Дашборд (users.dashboard), кэш токенов и закрепление чтений за основной
+базой сверяются с версиями в кэше Django. В LocMemCache каждого процесса
+свои версии: запись в одном воркере не видна другим, и они отдают
+устаревший дашборд (и 304 на него) до истечения DASHBOARD_CACHE_TIMEOUT.
+С репликой то же касается закрепления чтений после записи: другие воркеры
+его не видят и читают с отстающей реплики, поэтому реплика без общего
+кэша — ошибка и при DEBUG.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from .routers import REPLICA_DB
+
+PER_PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def _shared_cache_errors():
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PER_PROCESS_CACHES:
+        return []
+    return [Error(
+        f'Кэш по умолчанию {backend} у каждого процесса свой: версии дашборда, '
+        'токенов и закрепления за основной базой не видны другим воркерам.',
+        hint='Задайте REDIS_URL — общий кэш для всех процессов.',
+        id='users.E001',
+    )]
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    # локальная разработка и тесты работают в одном процессе
+    if settings.DEBUG:
+        return []
+    return _shared_cache_errors()
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache_deploy(app_configs, **kwargs):
+    # с DEBUG=False ошибку уже вернула check_shared_cache
+    return _shared_cache_errors() if settings.DEBUG else []
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_pin_cache(app_configs, **kwargs):
+    backend = settings.CACHES['default']['BACKEND']
+    if REPLICA_DB not in settings.DATABASES or backend not in PER_PROCESS_CACHES:
+        return []
+    return [Error(
+        f'Настроена реплика, а кэш по умолчанию {backend} у каждого процесса свой: '
+        'закрепление чтений за основной базой после записи (READ_YOUR_WRITES_SECONDS) '
+        'видит только записавший воркер, остальные читают устаревшие данные с реплики.',
+        hint='Задайте REDIS_URL — закрепление хранится в общем кэше.',
+        id='users.E002',
+    )]
@@ -0,0 +1,217 @@
+"""
+Дашборд пользователя и его кэш.
+
+Готовый JSON дашборда хранится в кэше Django под ключом с версией
+пользователя. Версия меняется (bump_dashboard_version) при каждой записи
+плана или профиля, поэтому устаревшие записи просто перестают читаться.
+Новая версия выставляется после коммита записи: иначе параллельный GET
+успел бы прочитать старые строки и закэшировать их под новой версией
+и ETag, отдавая устаревшее тело и 304 до следующей записи.
+По содержимому считается строгий ETag: на совпавший If-None-Match
+отвечаем 304, не обращаясь к таблицам планов.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .exercises import exercise_dictionary
+from .models import Plan
+from .routers import pin_all_to_primary, pin_to_primary
+from .utils import calculate_calories, calculate_macros, get_age_category
+
+GENERATION_KEY = 'dashboard:generation'
+STATS = ('hits', 'misses', 'not_modified')
+
+
+def current_plan_rows(plan_id):
+    """План, его версия шаблона и изменённые админом тренировки — одним запросом"""
+    return (
+        Plan.objects.filter(pk=plan_id)
+        .order_by('workouts__id')
+        .values_list(
+            'calories', 'macros', 'training_recommendations',
+            'template_version__description', 'template_version__workouts',
+            'workouts_customized', 'workouts__exercise_id',
+        )
+    )
+
+
+def _exercise_ids(rows):
+    """id упражнений, названия которых нужны дашборду: изменённые или собственные тренировки плана"""
+    if not rows:
+        return []
+    *_, template_workouts, customized, _ = rows[0]
+    if customized or template_workouts is None:
+        return [exercise_id for *_, exercise_id in rows if exercise_id is not None]
+    return []
+
+
+def _dashboard(user, rows, exercise_names):
+    if rows:
+        calories, macros, own_description, description, template_workouts, customized, _ = rows[0]
+        if template_workouts is None:
+            # план без версии шаблона (создан вручную)
+            description = own_description
+        workouts = exercise_names if customized or template_workouts is None else list(template_workouts)
+    else:
+        age_cat = get_age_category(user.age)
+        calories = calculate_calories(user, user.training_level)
+        macros = calculate_macros(user.weight, age_cat, user.goal, user.gender)
+        description = ''
+        workouts = []
+
+    return {
+        'calories': calories,
+        'macros': macros,
+        'training_description': description,
+        'workouts': workouts,
+        'age_category': get_age_category(user.age),
+        'training_level': user.training_level,
+        'plans_count': user.plans_count
+    }
+
+
+def build_dashboard(user):
+    """Собирает данные дашборда: текущий план (или расчёт по профилю) и тренировки"""
+    rows = []
+    if user.current_plan_id:
+        rows = list(current_plan_rows(user.current_plan_id))
+    return _dashboard(user, rows, exercise_dictionary.names(_exercise_ids(rows)))
+
+
+async def abuild_dashboard(user):
+    """build_dashboard для корутин (async_views)"""
+    rows = []
+    if user.current_plan_id:
+        rows = [row async for row in current_plan_rows(user.current_plan_id)]
+    return _dashboard(user, rows, await exercise_dictionary.anames(_exercise_ids(rows)))
+
+
+def _version_key(user_id):
+    return f'dashboard:version:{user_id}'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def get_dashboard_version(user_id):
+    """Текущая версия дашборда: общее поколение + версия пользователя"""
+    keys = [GENERATION_KEY, _version_key(user_id)]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # ключ вытеснен или ещё не создан — заводим новую версию (гарантированный промах)
+            values[key] = _new_version()
+            cache.add(key, values[key], timeout=None)
+    return f'{values[GENERATION_KEY]}.{values[keys[1]]}'
+
+
+async def aget_dashboard_version(user_id):
+    """get_dashboard_version для корутин"""
+    keys = [GENERATION_KEY, _version_key(user_id)]
+    values = await cache.aget_many(keys)
+    for key in keys:
+        if key not in values:
+            values[key] = _new_version()
+            await cache.aadd(key, values[key], timeout=None)
+    return f'{values[GENERATION_KEY]}.{values[keys[1]]}'
+
+
+def bump_dashboard_version(*user_ids):
+    """Инвалидирует кэш дашборда указанных пользователей после коммита текущей транзакции"""
+    transaction.on_commit(lambda: _bump(user_ids))
+
+
+def _bump(user_ids):
+    # пока реплика догоняет, новая версия собирается с основной базы: закрепляем до смены версии
+    pin_to_primary(*user_ids)
+    version = _new_version()
+    cache.set_many({_version_key(user_id): version for user_id in user_ids}, timeout=None)
+
+
+def invalidate_all_dashboards():
+    """Инвалидирует кэш дашборда всех пользователей (массовые операции) после коммита"""
+    transaction.on_commit(_invalidate_all)
+
+
+def _invalidate_all():
+    pin_all_to_primary()
+    cache.set(GENERATION_KEY, _new_version(), timeout=None)
+
+
+def _payload_key(user_id, version):
+    return f'dashboard:payload:{user_id}:{version}'
+
+
+def _entry(payload):
+    body = json.dumps(payload, cls=DjangoJSONEncoder).encode()
+    return '"%s"' % hashlib.sha256(body).hexdigest()[:32], body
+
+
+def get_cached_dashboard(user):
+    """Возвращает (etag, тело JSON в байтах), собирая дашборд только при промахе кэша"""
+    key = _payload_key(user.id, get_dashboard_version(user.id))
+    entry = cache.get(key)
+    if entry is not None:
+        _count('hits')
+        return entry
+
+    _count('misses')
+    entry = _entry(build_dashboard(user))
+    cache.set(key, entry, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+    return entry
+
+
+async def aget_cached_dashboard(user):
+    """get_cached_dashboard для корутин: кэш через асинхронный API, сборка — через async ORM"""
+    key = _payload_key(user.id, await aget_dashboard_version(user.id))
+    entry = await cache.aget(key)
+    if entry is not None:
+        await _acount('hits')
+        return entry
+
+    await _acount('misses')
+    entry = _entry(await abuild_dashboard(user))
+    await cache.aset(key, entry, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+    return entry
+
+
+def record_not_modified():
+    _count('not_modified')
+
+
+async def arecord_not_modified():
+    await _acount('not_modified')
+
+
+def _count(name):
+    key = f'dashboard:stats:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+async def _acount(name):
+    key = f'dashboard:stats:{name}'
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, timeout=None):
+            await cache.aincr(key)
+
+
+def dashboard_cache_stats():
+    """Счётчики попаданий и промахов кэша дашборда (для мониторинга)"""
+    values = cache.get_many([f'dashboard:stats:{name}' for name in STATS])
+    stats = {name: values.get(f'dashboard:stats:{name}', 0) for name in STATS}
+    requests = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / requests, 4) if requests else None
+    return stats
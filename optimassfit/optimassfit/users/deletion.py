@@ -0,0 +1,141 @@
+"""
+Массовое удаление планов и пользователей.
+
+Вместо каскада Django, который сначала загружает в память каждый Plan
+и Workout, удаление идёт наборами: id планов выбираются пачками,
+и каждая пачка удаляется двумя DELETE ... WHERE id IN (...) в своей
+короткой транзакции. Большие выборки выполняются в фоне (DeletionTask)
+с сохранением прогресса после каждой пачки.
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .dashboard import bump_dashboard_version
+from .models import DeletionTask, Plan, PlanArchiveChunk, PlanJob, User, Workout
+from .services import refresh_plan_counters
+
+DEFAULT_CHUNK_SIZE = 1000
+# Выборки, в которых больше планов, удаляются в фоне
+BACKGROUND_THRESHOLD = 10000
+
+
+def delete_plans(user_ids, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Удаляет все планы и тренировки пользователей пачками по chunk_size планов, затем их архивы.
+    progress(deleted) вызывается после каждой пачки. Возвращает число удалённых планов.
+    """
+    user_ids = list(user_ids)
+    deleted = 0
+    while True:
+        plan_ids = list(
+            Plan.objects.filter(user_id__in=user_ids).order_by().values_list('id', flat=True)[:chunk_size]
+        )
+        if not plan_ids:
+            break
+        with transaction.atomic():
+            # ссылки на удаляемые планы снимаем в той же транзакции
+            User.objects.filter(current_plan_id__in=plan_ids).update(current_plan=None)
+            PlanJob.objects.filter(plan_id__in=plan_ids).update(plan=None)
+            # _raw_delete — один DELETE без сборщика каскада и сигналов
+            Workout.objects.filter(plan_id__in=plan_ids)._raw_delete(connection.alias)
+            deleted += Plan.objects.filter(id__in=plan_ids)._raw_delete(connection.alias)
+        if progress:
+            progress(deleted)
+    PlanArchiveChunk.objects.filter(user_id__in=user_ids)._raw_delete(connection.alias)
+
+    for start in range(0, len(user_ids), chunk_size):
+        refresh_plan_counters(User.objects.filter(pk__in=user_ids[start:start + chunk_size]))
+    bump_dashboard_version(*user_ids)
+    return deleted
+
+
+def delete_users(user_ids, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Удаляет пользователей вместе с планами. Сначала планы удаляются наборами,
+    после чего каскаду Django остаются только лёгкие связи (токены, задания, группы).
+    Возвращает (удалено пользователей, удалено планов).
+    """
+    user_ids = list(user_ids)
+    deleted_plans = delete_plans(user_ids, chunk_size, progress)
+    deleted_users = 0
+    for start in range(0, len(user_ids), chunk_size):
+        with transaction.atomic():
+            _, per_model = User.objects.filter(pk__in=user_ids[start:start + chunk_size]).delete()
+        deleted_users += per_model.get(User._meta.label, 0)
+    return deleted_users, deleted_plans
+
+
+def start_deletion_task(user_ids, delete_users=False):
+    """Создаёт DeletionTask и запускает её в фоновом потоке после фиксации транзакции"""
+    user_ids = list(user_ids)
+    task = DeletionTask.objects.create(
+        user_ids=user_ids,
+        delete_users=delete_users,
+        total_plans=Plan.objects.filter(user_id__in=user_ids).count(),
+    )
+    transaction.on_commit(
+        lambda: threading.Thread(target=_run_in_thread, args=(task.id,), daemon=True).start()
+    )
+    return task
+
+
+def _run_in_thread(task_id):
+    try:
+        run_deletion_task(task_id)
+    finally:
+        close_old_connections()
+        connection.close()
+
+
+def claimable_tasks(resume=False):
+    """
+    Задачи, которые можно забрать: ожидающие, а при resume=True ещё и running
+    с истёкшей арендой — их исполнитель (поток веб-процесса или команда)
+    перестал продлевать heartbeat, например после перезапуска.
+    """
+    condition = Q(status=DeletionTask.STATUS_PENDING)
+    if resume:
+        expired = timezone.now() - timedelta(seconds=settings.DELETION_TASK_LEASE_SECONDS)
+        condition |= Q(status=DeletionTask.STATUS_RUNNING) & (Q(heartbeat__lt=expired) | Q(heartbeat__isnull=True))
+    return DeletionTask.objects.filter(condition)
+
+
+def run_deletion_task(task_id, chunk_size=DEFAULT_CHUNK_SIZE, resume=False):
+    """
+    Выполняет задачу удаления. Задача забирается атомарно, поэтому поток
+    и команда run_deletion_tasks не выполнят её дважды; resume=True
+    подхватывает задачу в статусе running с истёкшей арендой (claimable_tasks).
+    Удаление идемпотентно: повторный запуск лишь дочищает оставшееся.
+    """
+    claimed = claimable_tasks(resume).filter(pk=task_id).update(
+        status=DeletionTask.STATUS_RUNNING, heartbeat=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    task = DeletionTask.objects.get(pk=task_id)
+    already_deleted = task.deleted_plans
+
+    def progress(deleted):
+        DeletionTask.objects.filter(pk=task_id).update(
+            deleted_plans=already_deleted + deleted, heartbeat=timezone.now()
+        )
+
+    try:
+        if task.delete_users:
+            deleted_users, _ = delete_users(task.user_ids, chunk_size, progress)
+            DeletionTask.objects.filter(pk=task_id).update(deleted_users=deleted_users)
+        else:
+            delete_plans(task.user_ids, chunk_size, progress)
+    except Exception as exc:
+        DeletionTask.objects.filter(pk=task_id).update(
+            status=DeletionTask.STATUS_FAILED, error=str(exc), date_finished=timezone.now()
+        )
+        raise
+    DeletionTask.objects.filter(pk=task_id).update(status=DeletionTask.STATUS_DONE, date_finished=timezone.now())
+    return True
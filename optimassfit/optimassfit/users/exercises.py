@@ -0,0 +1,77 @@
+"""
+Словарь упражнений (Exercise) и его кэш в памяти процесса.
+
+Workout и WorkoutTemplate хранят не длинное название, а id из словаря.
+Строки Exercise никогда не меняются и не удаляются, поэтому соответствие
+id ↔ название можно держать в процессе без инвалидации; новые записи
+попадают в кэш только после коммита, чтобы откат не оставил в нём чужой id.
+"""
+import threading
+
+from django.db import transaction
+
+from .models import Exercise
+
+
+class ExerciseDictionary:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = {}
+        self._ids = {}
+
+    def _remember(self, pairs):
+        with self._lock:
+            for exercise_id, name in pairs:
+                self._names[exercise_id] = name
+                self._ids[name] = exercise_id
+
+    def names(self, ids):
+        """Названия по списку id (порядок сохраняется); недостающие — одним запросом"""
+        missing = {exercise_id for exercise_id in ids if exercise_id not in self._names}
+        found = {}
+        if missing:
+            # при первом промахе словарь (сотни строк) загружается целиком
+            queryset = Exercise.objects.all() if not self._names else Exercise.objects.filter(id__in=missing)
+            pairs = list(queryset.values_list('id', 'name'))
+            found = dict(pairs)
+            transaction.on_commit(lambda: self._remember(pairs))
+        return [self._names.get(exercise_id) or found.get(exercise_id) for exercise_id in ids]
+
+    async def anames(self, ids):
+        """names() для корутин: вне транзакции запоминаем сразу (on_commit в async-контексте недоступен)"""
+        missing = {exercise_id for exercise_id in ids if exercise_id not in self._names}
+        found = {}
+        if missing:
+            queryset = Exercise.objects.all() if not self._names else Exercise.objects.filter(id__in=missing)
+            pairs = [pair async for pair in queryset.values_list('id', 'name')]
+            found = dict(pairs)
+            self._remember(pairs)
+        return [self._names.get(exercise_id) or found.get(exercise_id) for exercise_id in ids]
+
+    def name(self, exercise_id):
+        if exercise_id is None:
+            return None
+        return self.names([exercise_id])[0]
+
+    def intern(self, names):
+        """
+        Возвращает {название: id}, добавляя в словарь отсутствующие названия:
+        один INSERT ... ON CONFLICT DO NOTHING и один SELECT на всю пачку.
+        """
+        names = set(names)
+        result = {name: self._ids[name] for name in names if name in self._ids}
+        missing = names - result.keys()
+        if missing:
+            Exercise.objects.bulk_create([Exercise(name=name) for name in missing], ignore_conflicts=True)
+            pairs = list(Exercise.objects.filter(name__in=missing).values_list('id', 'name'))
+            result.update((name, exercise_id) for exercise_id, name in pairs)
+            transaction.on_commit(lambda: self._remember(pairs))
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+            self._ids.clear()
+
+
+exercise_dictionary = ExerciseDictionary()
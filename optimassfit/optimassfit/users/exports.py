@@ -0,0 +1,129 @@
+"""
+Потоковая выгрузка пользователей и истории планов (NDJSON / CSV).
+
+Строки читаются через .values().iterator(chunk_size=...) — на PostgreSQL
+это серверный курсор, — и сразу превращаются в текст, поэтому расход
+памяти не зависит от размера таблиц. Генераторы используются и
+StreamingHttpResponse в API, и командой export_data.
+"""
+import csv
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Plan, User
+
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+DEFAULT_CHUNK_SIZE = 2000
+
+USER_FIELDS = (
+    'id', 'username', 'email', 'age', 'height', 'weight', 'gender', 'goal',
+    'training_level', 'target_months', 'date_joined', 'plans_count',
+)
+PLAN_FIELDS = (
+    'id', 'user_id', 'user__username', 'date_created', 'goal_snapshot', 'age_snapshot',
+    'weight_snapshot', 'height_snapshot', 'training_level_snapshot', 'calories', 'macros',
+    'training_recommendations',
+)
+
+
+def parse_bound(value, end=False):
+    """
+    Граница периода: дата (YYYY-MM-DD) или дата-время ISO 8601.
+    Для конца периода дата включается целиком (< начала следующего дня).
+    """
+    if not value:
+        return None
+    try:
+        # сначала дата: parse_datetime на Python 3.11+ принимает и «YYYY-MM-DD» как полночь
+        day = parse_date(value)
+        moment = None if day else parse_datetime(value)
+    except ValueError:
+        day = moment = None
+    if day:
+        if end:
+            day += datetime.timedelta(days=1)
+        moment = datetime.datetime.combine(day, datetime.time.min)
+    elif moment is None:
+        raise ValueError(f'Некорректная дата: {value}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _is_date(value):
+    try:
+        return parse_date(value) is not None
+    except ValueError:
+        return False
+
+
+def filter_period(queryset, field, date_from, date_to):
+    start, end = parse_bound(date_from), parse_bound(date_to, end=True)
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end:
+        # конец, заданный датой, уже сдвинут на следующий день
+        lookup = 'lt' if _is_date(date_to) else 'lte'
+        queryset = queryset.filter(**{f'{field}__{lookup}': end})
+    return queryset
+
+
+def user_rows(date_from=None, date_to=None, goal=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Пользователи по id; фильтры — период регистрации и цель"""
+    queryset = filter_period(User.objects.all(), 'date_joined', date_from, date_to)
+    if goal:
+        queryset = queryset.filter(goal=goal)
+    return queryset.order_by('id').values(*USER_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def plan_rows(date_from=None, date_to=None, goal=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Планы по id; фильтры — период создания и цель на момент плана"""
+    queryset = filter_period(Plan.objects.all(), 'date_created', date_from, date_to)
+    if goal:
+        queryset = queryset.filter(goal_snapshot=goal)
+    rows = queryset.order_by('id').values(*PLAN_FIELDS, 'template_version__description').iterator(chunk_size=chunk_size)
+    return (_with_description(row) for row in rows)
+
+
+def _with_description(row):
+    """Описание рекомендаций берётся из версии шаблона, если план на неё ссылается"""
+    description = row.pop('template_version__description')
+    if description is not None:
+        row['training_recommendations'] = description
+    return row
+
+
+def render_ndjson(rows, fields):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode({field: row[field] for field in fields}) + '\n'
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает записанную строку вместо буферизации"""
+    def write(self, value):
+        return value
+
+
+def render_csv(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[field]) for field in fields])
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, cls=DjangoJSONEncoder)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def render(rows, fields, fmt):
+    return render_csv(rows, fields) if fmt == 'csv' else render_ndjson(rows, fields)
@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import User
 
+
 class RegisterForm(UserCreationForm):
     username = forms.CharField(
         label="Логин",
@@ -73,6 +74,7 @@ class RegisterForm(UserCreationForm):
             'training_level'
         ]
 
+
 class ProfileUpdateForm(forms.ModelForm):
     """Форма обновления профиля пользователя"""
     class Meta:
@@ -86,3 +88,11 @@ class ProfileUpdateForm(forms.ModelForm):
             'training_level': 'Количество тренировок в месяц',
             'target_months': 'Период тренировок'
         }
+
+    def save(self, commit=True):
+        user = super().save(commit=False)
+        if commit:
+            # instance может быть снимком из кэша токенов: current_plan и plans_count в нём
+            # могли устареть, а их ведут services — пишем только поля профиля
+            user.save(update_fields=self._meta.fields)
+        return user
@@ -0,0 +1,158 @@
+"""
+Массовый импорт пользователей (целые залы разом) из CSV или NDJSON.
+
+Строки проверяются правилами RegisterForm, но проверка уникальности
+логина и почты делается одним запросом на пачку, а не по строке.
+Пароли хешируются параллельно (PBKDF2 — основная стоимость регистрации):
+по умолчанию в пуле потоков — hashlib отпускает GIL на время PBKDF2, и
+это безопасно внутри многопоточного веб-сервера; пул процессов через fork
+включает только команда import_users, где в процессе нет чужих потоков.
+Пользователи, токены и стартовые планы пишутся bulk_create пачками.
+Ошибки возвращаются по номерам строк.
+"""
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models.functions import Lower
+from rest_framework.authtoken.models import Token
+
+from .forms import RegisterForm
+from .models import User
+from .services import build_plan, save_plans
+from .utils import calculate_norms_for_profiles
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_BATCH_SIZE = 500
+MACRO_FIELDS = ('proteins', 'fats', 'carbs', 'protein_ratio', 'fat_ratio', 'carb_ratio')
+
+
+class ImportRowForm(RegisterForm):
+    """RegisterForm без запросов к БД: уникальность проверяет import_users для всей пачки"""
+
+    def clean_username(self):
+        return self.cleaned_data.get('username')
+
+    def validate_unique(self):
+        pass
+
+
+def parse_rows(data, fmt):
+    """Разбирает текст выгрузки в словари. Для CSV первая строка — заголовок."""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(data)))
+    if fmt == 'ndjson':
+        rows = []
+        for number, line in enumerate(data.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                raise ValueError(f'строка {number}: некорректный JSON ({exc})')
+            if not isinstance(row, dict):
+                raise ValueError(f'строка {number}: ожидается объект')
+            rows.append(row)
+        return rows
+    raise ValueError(f'формат: ожидается одно из {", ".join(FORMATS)}')
+
+
+def _validate(rows):
+    """Возвращает ([(номер строки, User, пароль)], {номер строки: ошибки})"""
+    valid, errors = [], {}
+    for number, row in enumerate(rows, 1):
+        data = dict(row)
+        # в выгрузках обычно одна колонка password
+        if 'password' in data:
+            data.setdefault('password1', data['password'])
+            data.setdefault('password2', data['password'])
+        form = ImportRowForm(data)
+        if form.is_valid():
+            valid.append((number, form.instance, form.cleaned_data['password1']))
+        else:
+            errors[number] = {field: list(messages) for field, messages in form.errors.items()}
+
+    # Уникальность: против базы одним запросом и внутри самого файла
+    usernames = {user.username.lower() for _, user, _ in valid}
+    emails = {user.email for _, user, _ in valid}
+    taken_usernames = set(
+        User.objects.annotate(username_lower=Lower('username'))
+        .filter(username_lower__in=usernames).values_list('username_lower', flat=True)
+    )
+    taken_emails = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+    unique = []
+    for number, user, password in valid:
+        row_errors = {}
+        if user.username.lower() in taken_usernames:
+            row_errors['username'] = user.unique_error_message(User, ['username']).messages
+        if user.email in taken_emails:
+            row_errors['email'] = user.unique_error_message(User, ['email']).messages
+        if row_errors:
+            errors[number] = row_errors
+            continue
+        taken_usernames.add(user.username.lower())
+        taken_emails.add(user.email)
+        unique.append((number, user, password))
+    return unique, errors
+
+
+def _hash_passwords(passwords, workers, processes=False):
+    """
+    Хеши паролей в исходном порядке. processes=True — пул процессов через fork:
+    только для однопоточного процесса (команда import_users), в веб-сервере
+    fork копирует блокировки, захваченные другими потоками.
+    """
+    if workers <= 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    if processes and 'fork' in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            chunksize = max(1, len(passwords) // (workers * 4))
+            return list(pool.map(make_password, passwords, chunksize=chunksize))
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(make_password, passwords))
+
+
+def import_users(rows, batch_size=DEFAULT_BATCH_SIZE, workers=None, with_plans=True, processes=False):
+    """
+    Импортирует проверенные строки, пропуская ошибочные.
+    processes=True хеширует пароли в пуле процессов (см. _hash_passwords).
+    Возвращает {'imported', 'errors': [{'row', 'errors'}], 'seconds', 'users_per_second'}.
+    """
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    valid, errors = _validate(rows)
+
+    hashes = _hash_passwords([password for _, _, password in valid], workers, processes)
+    users = [user for _, user, _ in valid]
+    for user, password_hash in zip(users, hashes):
+        user.password = password_hash
+
+    imported = 0
+    for start in range(0, len(users), batch_size):
+        batch = users[start:start + batch_size]
+        with transaction.atomic():
+            batch = User.objects.bulk_create(batch)
+            Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in batch])
+            if with_plans:
+                norms = {key: array.tolist() for key, array in calculate_norms_for_profiles(batch).items()}
+                save_plans([
+                    build_plan(user, (norms['calories'][i], {key: norms[key][i] for key in MACRO_FIELDS}))
+                    for i, user in enumerate(batch)
+                ])
+        imported += len(batch)
+
+    seconds = time.perf_counter() - started
+    return {
+        'imported': imported,
+        'errors': [{'row': number, 'errors': errors[number]} for number in sorted(errors)],
+        'seconds': round(seconds, 3),
+        'users_per_second': round(imported / seconds, 1) if seconds else None,
+    }
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...archive import DEFAULT_CHUNK_SIZE, archivable_plans, archive_plans, retention_cutoff
+from ...models import Plan, Workout
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит снимки планов старше срока хранения (PLAN_RETENTION_DAYS) в архив: "
+        "куски PlanArchiveChunk по CHUNK_PLANS снимков, текущий план остаётся на месте"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, default=settings.PLAN_RETENTION_DAYS,
+                            help="Возраст плана в днях, после которого он архивируется")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Пользователей за одну транзакцию")
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать, ничего не перенося")
+        parser.add_argument("--vacuum", action="store_true",
+                            help="После переноса выполнить VACUUM ANALYZE горячих таблиц "
+                                 "(на SQLite — VACUUM всей базы)")
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options["older_than_days"])
+        if options["dry_run"]:
+            count = archivable_plans(cutoff).count()
+            self.stdout.write(f"Планов старше {cutoff:%d.%m.%Y}: {count}")
+            return
+
+        def progress(users, plans):
+            self.stdout.write(f"  пользователей {users}, планов {plans}")
+
+        users, plans = archive_plans(cutoff, options["chunk_size"], progress)
+        self.stdout.write(self.style.SUCCESS(f"В архив перенесено планов: {plans} (пользователей: {users})"))
+
+        if options["vacuum"] and plans:
+            # VACUUM нельзя выполнять в транзакции; команда работает в autocommit
+            with connection.cursor() as cursor:
+                if connection.vendor == "postgresql":
+                    for model in (Plan, Workout):
+                        cursor.execute(f"VACUUM (ANALYZE) {connection.ops.quote_name(model._meta.db_table)}")
+                elif connection.vendor == "sqlite":
+                    # SQLite чистит только файл целиком
+                    cursor.execute("VACUUM")
+                    cursor.execute("ANALYZE")
+            self.stdout.write("VACUUM ANALYZE выполнен")
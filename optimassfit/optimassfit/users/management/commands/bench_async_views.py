@@ -0,0 +1,109 @@
+import asyncio
+import statistics
+import threading
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from rest_framework.authtoken.models import Token
+
+from ...models import User
+from ...services import generate_plan
+from ...sqlite import prepare_memory_database
+
+# эндпоинт: (синхронный DRF, асинхронный из async_views)
+ENDPOINTS = {
+    "index": ("/api/", "/api/async/"),
+    "dashboard": ("/api/dashboard/", "/api/async/dashboard/"),
+    "plans": ("/api/plans/", "/api/async/plans/"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Синхронные и асинхронные варианты /api/, /api/dashboard/ и /api/plans/ в одном ASGI-процессе: "
+        "запросов в секунду, p95, потоков и памяти на запрос в обработке при разной конкурентности"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300, help="Запросов на каждый прогон")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64],
+                            help="Уровни одновременных запросов")
+        parser.add_argument("--plans", type=int, default=30, help="Планов в истории тестового пользователя")
+        parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+
+    def handle(self, *args, **options):
+        prepare_memory_database()
+        username = f"bench_async_{time.time_ns()}"
+        user = User.objects.create_user(
+            username, "Bench-async-password", email=f"{username}@example.com",
+            age=30, height=175, weight=75, gender="male", goal="maintain", training_level="2-3",
+        )
+        try:
+            for _ in range(options["plans"]):
+                generate_plan(user)
+            headers = {"Authorization": f"Token {Token.objects.create(user=user).key}"}
+            self.stdout.write(
+                f"{'эндпоинт':>10} {'вариант':>8} {'конкур.':>8} {'запр/с':>8} {'p95, мс':>8} "
+                f"{'потоков':>8} {'КБ/запрос':>10}"
+            )
+            for name in options["endpoints"]:
+                for concurrency in options["concurrency"]:
+                    for variant, path in zip(("sync", "async"), ENDPOINTS[name]):
+                        rate, p95, threads = asyncio.run(self._run(path, headers, options["requests"], concurrency))
+                        memory = asyncio.run(self._memory(path, headers, options["requests"], concurrency))
+                        self.stdout.write(
+                            f"{name:>10} {variant:>8} {concurrency:>8} {rate:>8.0f} {p95:>8.2f} "
+                            f"{threads:>8} {memory / 1024:>10.1f}"
+                        )
+        finally:
+            user.delete()
+
+    async def _client(self, path, headers):
+        client = AsyncClient()
+        response = await client.get(path, headers=headers)  # прогрев кэшей токена, дашборда и URL
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} вернул {response.status_code}")
+        return client
+
+    async def _load(self, client, path, headers, total, concurrency, on_response=None):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request():
+            async with semaphore:
+                started = time.perf_counter()
+                # AsyncClient в Django 4.2 не передаёт headers из конструктора — задаём их в каждом запросе
+                await client.get(path, headers=headers)
+                if on_response:
+                    on_response()
+                return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(request() for _ in range(total)))
+        return latencies, time.perf_counter() - started
+
+    async def _run(self, path, headers, total, concurrency):
+        """(запросов в секунду, p95 в мс, наибольшее число потоков процесса)"""
+        client = await self._client(path, headers)
+        threads = threading.active_count()
+
+        def sample():
+            nonlocal threads
+            threads = max(threads, threading.active_count())
+
+        latencies, seconds = await self._load(client, path, headers, total, concurrency, sample)
+        return total / seconds, statistics.quantiles(latencies, n=20)[-1], threads
+
+    async def _memory(self, path, headers, total, concurrency):
+        """Пик выделенной памяти сверх исходной после прогрева, делённый на число запросов в обработке, в байтах"""
+        client = await self._client(path, headers)
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            await self._load(client, path, headers, total, concurrency)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return max(peak - baseline, 0) / concurrency
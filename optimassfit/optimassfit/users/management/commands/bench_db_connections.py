@@ -0,0 +1,77 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from ...models import User
+from ...services import generate_plan
+from ...sqlite import prepare_memory_database
+
+MODES = {
+    "reconnect": 0,      # новое соединение на каждый запрос
+    "persistent": 600,   # соединение переиспользуется воркером
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Задержка запроса GET /api/plans/ с новым соединением к базе на каждый запрос "
+        "и с переиспользованием соединения (CONN_MAX_AGE) на текущем бэкенде базы"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300, help="Запросов на каждый режим")
+
+    def handle(self, *args, **options):
+        prepare_memory_database()
+        configured_max_age = connection.settings_dict["CONN_MAX_AGE"]
+        username = f"bench_conn_{time.time_ns()}"
+        user = User.objects.create_user(
+            username, "Bench-conn-password", email=f"{username}@example.com",
+            age=30, height=175, weight=75, gender="male", goal="maintain", training_level="2-3",
+        )
+        try:
+            generate_plan(user)
+            client = Client(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}")
+            self.stdout.write(f"бэкенд: {connection.settings_dict['ENGINE']}")
+            self.stdout.write(f"{'режим':>11} {'соединений':>11} {'среднее, мс':>12} {'p50, мс':>8} {'p95, мс':>8}")
+            for name, max_age in MODES.items():
+                opened, latencies = self._run(client, max_age, options["requests"])
+                p50 = statistics.median(latencies)
+                p95 = statistics.quantiles(latencies, n=20)[-1]
+                self.stdout.write(
+                    f"{name:>11} {opened:>11} {statistics.fmean(latencies):>12.2f} {p50:>8.2f} {p95:>8.2f}"
+                )
+        finally:
+            connection.settings_dict["CONN_MAX_AGE"] = configured_max_age
+            close_old_connections()
+            user.delete()
+
+    def _run(self, client, max_age, total):
+        connection.close()
+        connection.settings_dict["CONN_MAX_AGE"] = max_age
+        opened = 0
+
+        def count(**kwargs):
+            nonlocal opened
+            opened += 1
+
+        connection_created.connect(count)
+        try:
+            client.get("/api/plans/")  # прогрев кэшей токена и URL
+            opened, latencies = 0, []
+            for _ in range(total):
+                started = time.perf_counter()
+                # тестовый клиент не шлёт request_started/finished в close_old_connections —
+                # вызываем как обработчик WSGI
+                close_old_connections()
+                client.get("/api/plans/")
+                close_old_connections()
+                latencies.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection_created.disconnect(count)
+        return opened, latencies
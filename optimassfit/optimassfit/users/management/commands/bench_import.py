@@ -0,0 +1,49 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...imports import import_users
+from ...sqlite import prepare_memory_database
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Замеряет скорость массового импорта (польз./с) при разном числе процессов; данные откатываются"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=2000, help="Пользователей в прогоне")
+        parser.add_argument(
+            "--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}),
+            help="Варианты числа процессов для хеширования",
+        )
+
+    def handle(self, *args, **options):
+        prepare_memory_database()
+        count = options["count"]
+        prefix = f"bench{time.time_ns()}"
+        rows = [
+            {
+                "username": f"{prefix}_{i}", "email": f"{prefix}_{i}@example.com",
+                "password": f"Strong-pass-{i}", "age": 18 + i % 60, "height": 150 + i % 50,
+                "weight": 50 + i % 80, "gender": ("male", "female")[i % 2],
+                "goal": ("lose_weight", "gain_weight", "maintain")[i % 3],
+                "target_months": (1, 3)[i % 2], "training_level": ("1", "2-3", "4-5", "6+")[i % 4],
+            }
+            for i in range(count)
+        ]
+        self.stdout.write(f"{'процессов':>10} {'секунд':>10} {'польз./с':>10} {'ошибок':>8}")
+        for workers in options["workers"]:
+            try:
+                with transaction.atomic():
+                    result = import_users(rows, workers=workers, processes=True)
+                    raise _Rollback
+            except _Rollback:
+                pass
+            self.stdout.write(
+                f"{workers:>10} {result['seconds']:>10.2f} {result['users_per_second']:>10} {len(result['errors']):>8}"
+            )
@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+
+from ...models import User
+from ...sqlite import prepare_memory_database
+
+ENDPOINTS = {
+    "sync": "/api/login/",
+    "async": "/api/async/login/",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест входа в одном ASGI-процессе: логинов в секунду "
+        "для синхронного /api/login/ и асинхронного /api/async/login/"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Входов на каждый вариант")
+        parser.add_argument("--concurrency", type=int, default=16, help="Одновременных запросов")
+
+    def handle(self, *args, **options):
+        prepare_memory_database()
+        username, password = f"bench_login_{time.time_ns()}", "Bench-login-password"
+        user = User.objects.create_user(username, password, email=f"{username}@example.com")
+        try:
+            self.stdout.write(f"{'вариант':>8} {'запросов':>9} {'ошибок':>7} {'секунд':>8} {'входов/с':>9}")
+            for name, path in ENDPOINTS.items():
+                ok, seconds = asyncio.run(
+                    self._run(path, username, password, options["requests"], options["concurrency"])
+                )
+                failed = options["requests"] - ok
+                self.stdout.write(
+                    f"{name:>8} {options['requests']:>9} {failed:>7} {seconds:>8.2f} {ok / seconds:>9.1f}"
+                )
+        finally:
+            user.delete()
+
+    async def _run(self, path, username, password, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def login():
+            async with semaphore:
+                response = await client.post(
+                    path, {"username": username, "password": password}, content_type="application/json"
+                )
+                return response.status_code == 200
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(login() for _ in range(total)))
+        return sum(results), time.perf_counter() - started
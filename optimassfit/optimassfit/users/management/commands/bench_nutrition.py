@@ -0,0 +1,66 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from ...utils import (
+    calculate_calories, calculate_macros, get_age_category, calculate_norms_batch,
+)
+
+
+class Command(BaseCommand):
+    help = "Сравнивает скалярный и пакетный расчёт КБЖУ на случайных профилях"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+            help="Количество профилей в каждом прогоне",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        self.stdout.write(f"{'профилей':>10} {'скалярно, с':>12} {'пакетно, с':>12} {'ускорение':>10}")
+
+        for size in options["sizes"]:
+            columns = {
+                "weight": np.round(rng.uniform(30, 200, size), 1),
+                "height": np.round(rng.uniform(100, 250, size), 1),
+                "age": rng.integers(10, 101, size),
+                "gender": rng.choice(["male", "female"], size).tolist(),
+                "goal": rng.choice(["lose_weight", "gain_weight", "maintain"], size).tolist(),
+                "training_level": rng.choice(["1", "2-3", "4-5", "6+"], size).tolist(),
+            }
+            profiles = [
+                SimpleNamespace(weight=w, height=h, age=a, gender=g, goal=goal)
+                for w, h, a, g, goal in zip(
+                    columns["weight"].tolist(), columns["height"].tolist(), columns["age"].tolist(),
+                    columns["gender"], columns["goal"],
+                )
+            ]
+
+            started = time.perf_counter()
+            scalar = [
+                (calculate_calories(p, level), calculate_macros(p.weight, get_age_category(p.age), p.goal, p.gender))
+                for p, level in zip(profiles, columns["training_level"])
+            ]
+            scalar_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            batch = calculate_norms_batch(**columns)
+            batch_time = time.perf_counter() - started
+
+            self._check(scalar, batch)
+            self.stdout.write(
+                f"{size:>10} {scalar_time:>12.3f} {batch_time:>12.3f} {scalar_time / batch_time:>9.1f}x"
+            )
+
+    def _check(self, scalar, batch):
+        """Проверяет поэлементное совпадение пакетного расчёта со скалярным"""
+        calories = [c for c, _ in scalar]
+        if calories != batch["calories"].tolist():
+            raise CommandError("Калории пакетного расчёта расходятся со скалярными")
+        for key in ("proteins", "fats", "carbs", "protein_ratio", "fat_ratio", "carb_ratio"):
+            if [m[key] for _, m in scalar] != batch[key].tolist():
+                raise CommandError(f"Поле {key} пакетного расчёта расходится со скалярным")
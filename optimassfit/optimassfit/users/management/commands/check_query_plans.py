@@ -0,0 +1,210 @@
+import itertools
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings, setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.authtoken.models import Token
+
+from ... import services
+from ...analytics import macro_aggregates
+from ...archive import archived_chunks
+from ...authentication import token_cache
+from ...dashboard import current_plan_rows
+from ...exercises import exercise_dictionary
+from ...models import Plan, RecommendationTemplate, User, Workout, WorkoutTemplate
+from ...pagination import DEFAULT_PAGE_SIZE, encode_cursor, keyset_queryset
+from ...recommendations import template_registry, upsert_templates
+
+# отдельный кэш, чтобы прогон не трогал версии дашбордов и токены рабочей базы
+ISOLATED_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                               'LOCATION': 'check-query-plans'}}
+
+# запросов на эндпоинт после прогрева; (путь, нужен админ, бюджет)
+QUERY_BUDGETS = {
+    'dashboard':          ('/api/dashboard/', False, 0),
+    'plans':              ('/api/plans/', False, 1),
+    'plans_compact':      ('/api/plans/?view=compact', False, 1),
+    'plans_next_page':    ('/api/plans/?page_size=10&cursor={cursor}', False, 1),
+    # последняя страница горячих планов дочитывает архив (пустой — один запрос)
+    'plans_last_page':    ('/api/plans/?cursor={last_cursor}', False, 2),
+    'admin_dashboard':    ('/api/admin/dashboard/', True, 3),
+    'admin_templates':    ('/api/admin/templates/', True, 2),
+    'admin_macro_stats':  ('/api/admin/analytics/macros/?group_by=goal', True, 1),
+    'admin_plan_workouts': ('/api/admin/plans/{plan_id}/workouts/', True, 2),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Регрессия планов запросов: во временной тестовой базе с засеянными данными "
+        "выполняет EXPLAIN горячих запросов (падает на последовательном сканировании "
+        "и лишней сортировке) и проверяет бюджеты числа запросов на эндпоинт"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=300, help="Пользователей в засеянной базе")
+        parser.add_argument("--plans-per-user", type=int, default=30, help="Планов на пользователя")
+        parser.add_argument("--keepdb", action="store_true", help="Не пересоздавать тестовую базу, если она есть")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict["NAME"]
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options["keepdb"])
+        try:
+            with override_settings(CACHES=ISOLATED_CACHES):
+                self._reset_process_caches()
+                try:
+                    failures = self.run_checks(options["users"], options["plans_per_user"])
+                finally:
+                    self._reset_process_caches()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        if failures:
+            raise CommandError("Проверка не пройдена:\n" + "\n".join(f"  - {failure}" for failure in failures))
+        self.stdout.write(self.style.SUCCESS("Планы запросов и бюджеты в норме"))
+
+    def _reset_process_caches(self):
+        token_cache.clear()
+        exercise_dictionary.clear()
+        template_registry.invalidate()
+        services._version_ids.clear()
+
+    def run_checks(self, users_count, plans_per_user):
+        """Засевает текущую базу и возвращает список нарушений (его же вызывает QueryPlanTests)"""
+        self.stdout.write(f"Засеваем базу: {users_count} пользователей по {plans_per_user} планов…")
+        seed = self._seed(users_count, plans_per_user)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        return self._check_plans(seed) + self._check_budgets(seed)
+
+    def _seed(self, users_count, plans_per_user):
+        genders = [code for code, _ in RecommendationTemplate.GENDER_CHOICES]
+        age_categories = [code for code, _ in RecommendationTemplate.AGE_CATEGORY_CHOICES]
+        goals = [code for code, _ in RecommendationTemplate.GOAL_CHOICES]
+        upsert_templates([
+            {'gender': gender, 'age_category': age_category, 'goal': goal,
+             'description': f"Шаблон {gender}/{age_category}/{goal}",
+             'workouts': [f"Упражнение {n}" for n in range(i % 3, i % 3 + 5)]}
+            for i, (gender, age_category, goal) in enumerate(itertools.product(genders, age_categories, goals))
+        ])
+
+        password = make_password("Check-plans-password")
+        users = User.objects.bulk_create([
+            User(username=f"plans_{i}", email=f"plans_{i}@example.com", password=password,
+                 age=15 + i % 60, height=150 + i % 40, weight=50 + i % 50,
+                 gender=genders[i % 2], goal=goals[i % 3], training_level="2-3", target_months=1)
+            for i in range(users_count)
+        ])
+        admin = User.objects.create_superuser("plans_admin", "Check-plans-password", email="plans_admin@example.com")
+        tokens = Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users + [admin]])
+
+        for chunk in range(0, users_count, 100):
+            plans = [services.build_plan(user) for user in users[chunk:chunk + 100] for _ in range(plans_per_user)]
+            services.save_plans(plans)
+        # часть текущих планов с изменёнными админом тренировками, чтобы таблица Workout не была пустой
+        customized = list(
+            Plan.objects.filter(id__in=User.objects.filter(id__in=[user.id for user in users[::5]])
+                                .values('current_plan_id'))
+            .select_related('template_version')
+        )
+        for plan in customized:
+            services.materialize_workouts(plan)
+        plan = next(plan for plan in customized if plan.user_id == users[0].id)
+
+        return {
+            'user': users[0],
+            'plan': plan,
+            'token': tokens[0].key,
+            'admin_token': tokens[-1].key,
+            'template': RecommendationTemplate.objects.order_by('id').first(),
+        }
+
+    def _hot_queries(self, seed):
+        """(название, queryset, запрос должен отдавать строки без сортировки)"""
+        user, plan, template = seed['user'], seed['plan'], seed['template']
+        history = Plan.objects.filter(user_id=user.id).select_related('template_version')
+        middle = history.order_by('-date_created', '-id')[DEFAULT_PAGE_SIZE]
+        return [
+            ("дашборд: текущий план с тренировками", current_plan_rows(plan.id), False),
+            ("история планов: первая страница", keyset_queryset(history)[:DEFAULT_PAGE_SIZE + 1], True),
+            ("история планов: следующая страница",
+             keyset_queryset(history, encode_cursor(middle.date_created, middle.id))[:DEFAULT_PAGE_SIZE + 1], True),
+            ("архив: куски раньше курсора", archived_chunks(user.id, (plan.date_created, plan.id))[:2], True),
+            ("текущий план пользователя",
+             Plan.objects.filter(user_id=user.id).order_by('-date_created', '-id').values('id')[:1], True),
+            ("тренировки плана", Workout.objects.filter(plan_id=plan.id), True),
+            ("шаблон по ключу", RecommendationTemplate.objects.filter(
+                gender=template.gender, age_category=template.age_category, goal=template.goal), False),
+            ("упражнения шаблона", WorkoutTemplate.objects.filter(recommendation_id=template.id), True),
+            ("токен", Token.objects.select_related('user').filter(key=seed['token']), False),
+            ("аналитика БЖУ за период",
+             Plan.objects.filter(date_created__gte=plan.date_created - timedelta(days=1),
+                                 date_created__lt=plan.date_created)
+             .order_by().values('goal_snapshot').annotate(**macro_aggregates()), False),
+        ]
+
+    def _check_plans(self, seed):
+        failures = []
+        self.stdout.write("EXPLAIN горячих запросов:")
+        for name, queryset, ordered in self._hot_queries(seed):
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    # на маленькой выборке seq scan дешевле; запрещаем его, чтобы увидеть, есть ли индекс
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET LOCAL enable_seqscan = off")
+                plan = queryset.explain()
+            problems = self._plan_problems(plan, ordered)
+            self.stdout.write(f"  {'FAIL' if problems else 'ok':>4}  {name}")
+            if problems:
+                self.stdout.write("        " + plan.replace("\n", "\n        "))
+                failures.append(f"{name}: {', '.join(problems)}")
+        return failures
+
+    def _plan_problems(self, plan, ordered):
+        problems = []
+        if connection.vendor == 'postgresql':
+            if 'Seq Scan' in plan:
+                problems.append("последовательное сканирование")
+            if ordered and any(line.lstrip(' ->').startswith('Sort') for line in plan.splitlines()):
+                problems.append("сортировка вместо обхода индекса")
+        elif connection.vendor == 'sqlite':
+            for line in plan.splitlines():
+                words = line.split()
+                if 'SCAN' in words and 'USING' not in words:
+                    problems.append(f"полное сканирование ({' '.join(words[words.index('SCAN') + 1:])})")
+            if ordered and 'TEMP B-TREE' in plan:
+                problems.append("сортировка вместо обхода индекса")
+        return problems
+
+    def _check_budgets(self, seed):
+        failures = []
+        plans = Plan.objects.filter(user=seed['user']).order_by('-date_created', '-id')
+        middle, last = plans[9], plans[DEFAULT_PAGE_SIZE - 1]
+        paths = {
+            'cursor': encode_cursor(middle.date_created, middle.id),
+            'last_cursor': encode_cursor(last.date_created, last.id),
+            'plan_id': seed['plan'].id,
+        }
+        self.stdout.write("Бюджеты запросов после прогрева:")
+        for name, (path, as_admin, budget) in QUERY_BUDGETS.items():
+            client = Client(HTTP_AUTHORIZATION=f"Token {seed['admin_token' if as_admin else 'token']}")
+            url = path.format(**paths)
+            warmup = client.get(url)
+            if warmup.status_code != 200:
+                failures.append(f"{name}: GET {url} вернул {warmup.status_code}")
+                continue
+            with CaptureQueriesContext(connection) as queries:
+                client.get(url)
+            used = len(queries)
+            self.stdout.write(f"  {'FAIL' if used > budget else 'ok':>4}  {name}: {used} из {budget}")
+            if used > budget:
+                failures.append(f"{name}: {used} запросов при бюджете {budget}")
+                for query in queries.captured_queries:
+                    self.stdout.write(f"        {query['sql']}")
+        return failures
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...exports import (
+    DEFAULT_CHUNK_SIZE, FORMATS, PLAN_FIELDS, USER_FIELDS, plan_rows, render, user_rows,
+)
+
+SOURCES = {
+    "users": (user_rows, USER_FIELDS),
+    "plans": (plan_rows, PLAN_FIELDS),
+}
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка пользователей или истории планов в NDJSON/CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", choices=list(SOURCES))
+        parser.add_argument("--format", dest="fmt", choices=FORMATS, default="ndjson")
+        parser.add_argument("--output", "-o", help="Файл для записи (по умолчанию stdout)")
+        parser.add_argument("--date-from", help="Начало периода (YYYY-MM-DD или ISO 8601)")
+        parser.add_argument("--date-to", help="Конец периода включительно")
+        parser.add_argument("--goal", help="Цель пользователя / цель на момент плана")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        rows_for, fields = SOURCES[options["source"]]
+        try:
+            rows = rows_for(options["date_from"], options["date_to"], options["goal"], options["chunk_size"])
+            chunks = render(rows, fields, options["fmt"])
+            if options["output"]:
+                with open(options["output"], "w", encoding="utf-8", newline="") as fh:
+                    fh.writelines(chunks)
+            else:
+                sys.stdout.writelines(chunks)
+        except ValueError as exc:
+            raise CommandError(exc)
@@ -0,0 +1,38 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...imports import DEFAULT_BATCH_SIZE, FORMATS, import_users, parse_rows
+
+
+class Command(BaseCommand):
+    help = "Массовый импорт пользователей из CSV/NDJSON (пароли хешируются в пуле процессов)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл выгрузки")
+        parser.add_argument("--format", choices=FORMATS, help="По умолчанию — по расширению файла")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Пользователей за одну транзакцию")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Процессов для хеширования паролей")
+        parser.add_argument("--no-plans", action="store_true", help="Не создавать стартовые планы")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "ndjson")
+        try:
+            with open(path, "rb") as fh:
+                rows = parse_rows(fh.read(), fmt)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        result = import_users(
+            rows, batch_size=options["batch_size"], workers=options["workers"], with_plans=not options["no_plans"],
+            processes=True,
+        )
+        for error in result["errors"]:
+            self.stderr.write(f"строка {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Импортировано {result['imported']} из {len(rows)} за {result['seconds']} с "
+            f"({result['users_per_second']} польз./с), ошибок: {len(result['errors'])}"
+        ))
@@ -0,0 +1,148 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import RecommendationTemplate, User
+from ...services import build_plan, save_plans
+from ...utils import GENDERS, TRAINING_LEVELS, calculate_norms_batch
+
+PROFILE_FIELDS = ("weight", "height", "age", "gender", "goal", "training_level")
+MACRO_FIELDS = ("proteins", "fats", "carbs", "protein_ratio", "fat_ratio", "carb_ratio")
+
+# Коды возрастных групп RecommendationTemplate → границы возраста
+AGE_RANGES = {
+    "10-18": {"age__lte": 18},
+    "19-30": {"age__gte": 19, "age__lte": 30},
+    "31-59": {"age__gte": 31, "age__lte": 59},
+    "60+": {"age__gte": 60},
+}
+
+
+def compute_norms(columns):
+    """Считает КБЖУ для пачки профилей (выполняется в процессе пула)"""
+    norms = calculate_norms_batch(**columns)
+    values = {key: array.tolist() for key, array in norms.items()}
+    return [
+        (calories, dict(zip(MACRO_FIELDS, macros)))
+        for calories, *macros in zip(values["calories"], *(values[key] for key in MACRO_FIELDS))
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает планы пользователей после изменения коэффициентов или шаблонов: "
+        "выбирает затронутых пользователей, считает КБЖУ в пуле процессов и пишет планы пачками"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--gender", choices=GENDERS)
+        parser.add_argument("--age-category", choices=list(AGE_RANGES))
+        parser.add_argument("--goal", choices=[code for code, _ in RecommendationTemplate.GOAL_CHOICES])
+        parser.add_argument("--training-level", choices=TRAINING_LEVELS)
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Пользователей в одной пачке")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Процессов для расчёта")
+        parser.add_argument("--checkpoint", default=".recompute_plans.json", help="Файл контрольной точки")
+        parser.add_argument("--restart", action="store_true", help="Игнорировать контрольную точку")
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать, ничего не записывая")
+
+    def handle(self, *args, **options):
+        filters = {
+            key: options[key]
+            for key in ("gender", "age_category", "goal", "training_level")
+            if options[key]
+        }
+        checkpoint = None if options["dry_run"] else options["checkpoint"]
+        last_id, processed = self._load_checkpoint(checkpoint, filters, options["restart"])
+        if last_id:
+            self.stdout.write(f"Продолжаем с id > {last_id} (уже пересчитано: {processed})")
+
+        queryset = self._queryset(filters)
+        started = time.perf_counter()
+        count = 0
+        for users, norms in self._computed_chunks(queryset, last_id, options["chunk_size"], options["workers"]):
+            if not options["dry_run"]:
+                save_plans([build_plan(user, plan_norms) for user, plan_norms in zip(users, norms)])
+                processed += len(users)
+                self._save_checkpoint(checkpoint, filters, users[-1].id, processed)
+            count += len(users)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  id ≤ {users[-1].id}: {count} польз., {count / elapsed:.0f} польз./с")
+
+        elapsed = time.perf_counter() - started
+        verb = "Посчитано (dry-run)" if options["dry_run"] else "Пересчитано"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb}: {count} польз. за {elapsed:.1f} с ({count / elapsed if elapsed else 0:.0f} польз./с)"
+        ))
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    def _queryset(self, filters):
+        queryset = User.objects.filter(age__isnull=False, weight__isnull=False, height__isnull=False)
+        for key in ("gender", "goal", "training_level"):
+            if key in filters:
+                queryset = queryset.filter(**{key: filters[key]})
+        if "age_category" in filters:
+            queryset = queryset.filter(**AGE_RANGES[filters["age_category"]])
+        return queryset.only("id", *PROFILE_FIELDS).order_by("id")
+
+    def _chunks(self, queryset, last_id, chunk_size):
+        """Пачки пользователей по возрастанию id (keyset, без OFFSET)"""
+        while True:
+            users = list(queryset.filter(id__gt=last_id)[:chunk_size])
+            if not users:
+                return
+            yield users
+            last_id = users[-1].id
+
+    def _computed_chunks(self, queryset, last_id, chunk_size, workers):
+        """
+        Отдаёт пары (пользователи, КБЖУ) строго по порядку пачек.
+        Пока пул считает, следующие пачки уже читаются из БД;
+        одновременно в работе не больше 2 × workers пачек.
+        """
+        chunks = self._chunks(queryset, last_id, chunk_size)
+        if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            for users in chunks:
+                yield users, compute_norms(self._columns(users))
+            return
+
+        # fork: дочерним процессам достаётся уже настроенный Django
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+            pending = deque()
+            for users in chunks:
+                pending.append((users, pool.submit(compute_norms, self._columns(users))))
+                if len(pending) >= 2 * workers:
+                    users, future = pending.popleft()
+                    yield users, future.result()
+            while pending:
+                users, future = pending.popleft()
+                yield users, future.result()
+
+    @staticmethod
+    def _columns(users):
+        return {field: [getattr(user, field) for user in users] for field in PROFILE_FIELDS}
+
+    @staticmethod
+    def _load_checkpoint(path, filters, restart):
+        if not path or restart or not os.path.exists(path):
+            return 0, 0
+        with open(path, encoding="utf-8") as fh:
+            state = json.load(fh)
+        if state["filters"] != filters:
+            raise CommandError(
+                f"Контрольная точка {path} записана для других фильтров {state['filters']}; "
+                "используйте --restart или другой --checkpoint"
+            )
+        return state["last_id"], state["processed"]
+
+    @staticmethod
+    def _save_checkpoint(path, filters, last_id, processed):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump({"filters": filters, "last_id": last_id, "processed": processed}, fh)
+        os.replace(tmp_path, path)
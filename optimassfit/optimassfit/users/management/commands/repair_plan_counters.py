@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from ...dashboard import invalidate_all_dashboards
+from ...models import User
+from ...services import refresh_plan_counters
+
+
+class Command(BaseCommand):
+    help = "Пересобирает User.current_plan и User.plans_count по таблице планов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Диапазон id пользователей на один UPDATE")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        max_id = User.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+        updated = 0
+        for start in range(0, max_id + 1, chunk_size):
+            with transaction.atomic():
+                updated += refresh_plan_counters(User.objects.filter(id__gte=start, id__lt=start + chunk_size))
+        invalidate_all_dashboards()
+        self.stdout.write(self.style.SUCCESS(f"Обновлено пользователей: {updated}"))
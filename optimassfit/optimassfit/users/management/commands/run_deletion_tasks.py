@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from ...deletion import DEFAULT_CHUNK_SIZE, claimable_tasks, run_deletion_task
+from ...models import DeletionTask
+
+
+class Command(BaseCommand):
+    help = "Выполняет задачи массового удаления, в том числе брошенные исполнителем (истекла аренда)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Планов за одну транзакцию")
+        parser.add_argument("--no-resume", action="store_true",
+                            help="Не подхватывать задачи в статусе running с истёкшей арендой (только pending)")
+
+    def handle(self, *args, **options):
+        # running с живой арендой выполняет другой исполнитель — их не трогаем
+        task_ids = list(claimable_tasks(resume=not options["no_resume"]).values_list("id", flat=True))
+        for task_id in task_ids:
+            if run_deletion_task(task_id, options["chunk_size"], resume=not options["no_resume"]):
+                task = DeletionTask.objects.get(pk=task_id)
+                self.stdout.write(
+                    f"Задача {task.id}: удалено планов {task.deleted_plans}, пользователей {task.deleted_users}"
+                )
+        self.stdout.write(self.style.SUCCESS(f"Обработано задач: {len(task_ids)}"))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...services import process_plan_jobs
+
+
+class Command(BaseCommand):
+    help = "Фоновый воркер: разбирает очередь PlanJob и создаёт планы пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Заданий за одну транзакцию")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Пауза (с), когда очередь пуста")
+        parser.add_argument("--once", action="store_true", help="Разобрать очередь и завершиться")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        total = 0
+        try:
+            while True:
+                processed = process_plan_jobs(batch_size)
+                total += processed
+                if processed:
+                    self.stdout.write(f"Обработано заданий: {processed} (всего {total})")
+                elif options["once"]:
+                    break
+                else:
+                    time.sleep(options["sleep"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Воркер остановлен, обработано заданий: {total}"))
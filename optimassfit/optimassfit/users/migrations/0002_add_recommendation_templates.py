@@ -1,29 +1,14 @@
-from django.db import migrations, models
-import django.db.models.deletion
+from django.db import migrations
+
 
 class Migration(migrations.Migration):
+    # Таблицы шаблонов создаются в 0001_initial (с unique_together и BigAutoField);
+    # повторный CreateModel здесь падал на свежей базе и расходился с моделями.
+    # Миграция оставлена пустой, чтобы не ломать цепочку зависимостей; базы, где
+    # таблица всё же создавалась без ограничения, чинит 0008.
 
     dependencies = [
         ('users', '0001_initial'),
     ]
 
-    operations = [
-        migrations.CreateModel(
-            name='RecommendationTemplate',
-            fields=[
-                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
-                ('gender', models.CharField(choices=[('male','Муж.'),('female','Жен.')], max_length=6)),
-                ('age_category', models.CharField()),
-                ('goal', models.CharField()),
-                ('description', models.TextField()),
-            ],
-        ),
-        migrations.CreateModel(
-            name='WorkoutTemplate',
-            fields=[
-                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
-                ('name', models.CharField(max_length=255)),
-                ('recommendation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workouts', to='users.RecommendationTemplate')),
-            ],
-        ),
-    ]
+    operations = []
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.19 on 2026-10-18 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_add_recommendation_templates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10)),
+                ('error', models.TextField(blank=True, default='')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_finished', models.DateTimeField(blank=True, null=True)),
+                ('plan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.plan')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Задание на генерацию плана',
+                'verbose_name_plural': 'Задания на генерацию планов',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='users_planjob_status_id_idx')],
+            },
+        ),
+    ]
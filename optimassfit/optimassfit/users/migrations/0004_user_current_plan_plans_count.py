@@ -0,0 +1,39 @@
+# Generated by Django 4.2.19 on 2026-10-18 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_plan_counters(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Plan = apps.get_model('users', 'Plan')
+    plans = Plan.objects.filter(user_id=OuterRef('pk'))
+    max_id = User.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    for start in range(0, max_id + 1, 5000):
+        User.objects.filter(id__gte=start, id__lt=start + 5000).update(
+            current_plan_id=Subquery(plans.order_by('-date_created', '-id').values('id')[:1]),
+            plans_count=Coalesce(Subquery(plans.order_by().values('user_id').annotate(n=Count('id')).values('n')), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_planjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='current_plan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.plan'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='plans_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_plan_counters, migrations.RunPython.noop),
+    ]
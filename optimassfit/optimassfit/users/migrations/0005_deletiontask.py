@@ -0,0 +1,33 @@
+# Generated by Django 4.2.19 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_current_plan_plans_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_ids', models.JSONField(help_text='id пользователей, чьи планы удаляются')),
+                ('delete_users', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10)),
+                ('total_plans', models.PositiveIntegerField(default=0)),
+                ('deleted_plans', models.PositiveIntegerField(default=0)),
+                ('deleted_users', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_finished', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Задача массового удаления',
+                'verbose_name_plural': 'Задачи массового удаления',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 4.2.19 on 2026-10-18 14:00
+
+import hashlib
+import json
+import logging
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+CHUNK_SIZE = 2000
+
+logger = logging.getLogger(__name__)
+
+
+def hash_content(description, workouts):
+    # копия TemplateVersion.hash_content на момент миграции
+    payload = json.dumps([description, list(workouts)], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def deduplicate_recommendations(apps, schema_editor):
+    """
+    Заменяет скопированные в план описание и упражнения ссылкой на общую
+    TemplateVersion и печатает, сколько данных освободилось.
+    """
+    Plan = apps.get_model('users', 'Plan')
+    Workout = apps.get_model('users', 'Workout')
+    TemplateVersion = apps.get_model('users', 'TemplateVersion')
+
+    versions = {}
+    plans_done = workouts_removed = removed_bytes = 0
+    last_id = 0
+    while True:
+        chunk = list(
+            Plan.objects.filter(id__gt=last_id, template_version__isnull=True)
+            .order_by('id').values_list('id', 'training_recommendations')[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+
+        names = defaultdict(list)
+        for plan_id, name in (
+            Workout.objects.filter(plan_id__in=[plan_id for plan_id, _ in chunk])
+            .order_by('id').values_list('plan_id', 'name')
+        ):
+            names[plan_id].append(name)
+
+        by_version = defaultdict(list)
+        for plan_id, description in chunk:
+            # нестроковые описания (ручные планы) оставляем как есть
+            if description is not None and not isinstance(description, str):
+                continue
+            description = description or ''
+            workouts = names.get(plan_id, [])
+            if not description and not workouts:
+                continue
+            content_hash = hash_content(description, workouts)
+            if content_hash not in versions:
+                versions[content_hash] = TemplateVersion.objects.get_or_create(
+                    content_hash=content_hash, defaults={'description': description, 'workouts': workouts},
+                )[0].id
+            by_version[versions[content_hash]].append(plan_id)
+            removed_bytes += len(description.encode()) + sum(len(name.encode()) for name in workouts)
+
+        for version_id, plan_ids in by_version.items():
+            Plan.objects.filter(id__in=plan_ids).update(template_version_id=version_id, training_recommendations=None)
+            workouts_removed += Workout.objects.filter(plan_id__in=plan_ids).delete()[0]
+            plans_done += len(plan_ids)
+
+    added_bytes = sum(
+        len(description.encode()) + sum(len(name.encode()) for name in workouts)
+        for description, workouts in TemplateVersion.objects.filter(content_hash__in=versions)
+        .values_list('description', 'workouts')
+    )
+    logger.info(
+        "Рекомендации: планов %d, версий шаблонов %d; удалено строк Workout %d; "
+        "данные рекомендаций %.1f КБ -> %.1f КБ (без учёта заголовков строк и индексов)",
+        plans_done, len(versions), workouts_removed, removed_bytes / 1024, added_bytes / 1024,
+    )
+
+
+def restore_recommendations(apps, schema_editor):
+    """Обратная операция: снова копирует описание и упражнения версии в каждый план"""
+    Plan = apps.get_model('users', 'Plan')
+    Workout = apps.get_model('users', 'Workout')
+    TemplateVersion = apps.get_model('users', 'TemplateVersion')
+
+    for version in TemplateVersion.objects.iterator():
+        plans = Plan.objects.filter(template_version=version)
+        for plan_id in plans.filter(workouts_customized=False).values_list('id', flat=True).iterator():
+            Workout.objects.bulk_create([Workout(plan_id=plan_id, name=name) for name in version.workouts])
+        plans.update(training_recommendations=version.description, template_version=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_deletiontask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TemplateVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('description', models.TextField(blank=True)),
+                ('workouts', models.JSONField(default=list, help_text='Названия упражнений по порядку')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Версия шаблона рекомендаций',
+                'verbose_name_plural': 'Версии шаблонов рекомендаций',
+            },
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='template_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='plans', to='users.templateversion'),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='workouts_customized',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(deduplicate_recommendations, restore_recommendations),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 4.2.19 on 2026-10-18 15:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+CHUNK_SIZE = 5000
+
+
+def intern_names(apps, schema_editor):
+    """Переносит названия в словарь Exercise и проставляет ссылки одним UPDATE на таблицу"""
+    Exercise = apps.get_model('users', 'Exercise')
+    for model_name in ('Workout', 'WorkoutTemplate'):
+        model = apps.get_model('users', model_name)
+        names = model.objects.order_by().values_list('name', flat=True).distinct().iterator()
+        batch = []
+        for name in names:
+            batch.append(Exercise(name=name))
+            if len(batch) >= CHUNK_SIZE:
+                Exercise.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Exercise.objects.bulk_create(batch, ignore_conflicts=True)
+
+        model.objects.update(
+            exercise_id=Subquery(Exercise.objects.filter(name=OuterRef('name')).values('id')[:1])
+        )
+
+
+def restore_names(apps, schema_editor):
+    Exercise = apps.get_model('users', 'Exercise')
+    for model_name in ('Workout', 'WorkoutTemplate'):
+        apps.get_model('users', model_name).objects.update(
+            name=Subquery(Exercise.objects.filter(id=OuterRef('exercise_id')).values('name')[:1])
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_templateversion_plan_template_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Exercise',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Упражнение',
+                'verbose_name_plural': 'Упражнения',
+            },
+        ),
+        migrations.AddField(
+            model_name='workout',
+            name='exercise',
+            field=models.ForeignKey(help_text='Упражнение или тренировка', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='users.exercise'),
+        ),
+        migrations.AddField(
+            model_name='workouttemplate',
+            name='exercise',
+            field=models.ForeignKey(help_text='Упражнение шаблона', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='users.exercise'),
+        ),
+        # name временно допускает NULL, чтобы откат миграции мог заново заполнить его
+        migrations.AlterField(
+            model_name='workout',
+            name='name',
+            field=models.CharField(help_text='Название упражнения или тренировки', max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='workouttemplate',
+            name='name',
+            field=models.CharField(help_text='Упражнение шаблона', max_length=255, null=True),
+        ),
+        migrations.RunPython(intern_names, restore_names),
+        migrations.RemoveField(
+            model_name='workout',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='workouttemplate',
+            name='name',
+        ),
+        migrations.AlterField(
+            model_name='workout',
+            name='exercise',
+            field=models.ForeignKey(help_text='Упражнение или тренировка', on_delete=django.db.models.deletion.PROTECT, related_name='+', to='users.exercise'),
+        ),
+        migrations.AlterField(
+            model_name='workouttemplate',
+            name='exercise',
+            field=models.ForeignKey(help_text='Упражнение шаблона', on_delete=django.db.models.deletion.PROTECT, related_name='+', to='users.exercise'),
+        ),
+    ]
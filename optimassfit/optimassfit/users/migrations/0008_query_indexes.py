@@ -0,0 +1,53 @@
+# Generated by Django 4.2.19 on 2026-10-18 17:00
+
+import logging
+
+from django.db import migrations, models
+from django.db.models import Min
+
+TEMPLATE_KEY = ('gender', 'age_category', 'goal')
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_template_unique(apps, schema_editor):
+    """Создаёт unique (gender, age_category, goal), если его нет в базе; дубликаты удаляются, остаётся младший id"""
+    RecommendationTemplate = apps.get_model('users', 'RecommendationTemplate')
+    table = RecommendationTemplate._meta.db_table
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    if any(c['unique'] and set(c['columns']) == set(TEMPLATE_KEY) for c in constraints.values()):
+        return
+
+    keep = (
+        RecommendationTemplate.objects.values(*TEMPLATE_KEY)
+        .annotate(keep_id=Min('id')).values_list('keep_id', flat=True)
+    )
+    removed, _ = RecommendationTemplate.objects.exclude(id__in=list(keep)).delete()
+    if removed:
+        logger.info("Удалено дубликатов шаблонов: %d", removed)
+    schema_editor.alter_unique_together(RecommendationTemplate, [], [TEMPLATE_KEY])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_exercise_dictionary'),
+    ]
+
+    operations = [
+        migrations.RunPython(ensure_template_unique, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='plan',
+            index=models.Index(fields=['user', '-date_created', '-id'], name='users_plan_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['plan', 'id'], name='users_workout_plan_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workouttemplate',
+            index=models.Index(fields=['recommendation', 'id'], name='users_wtpl_recommendation_idx'),
+        ),
+    ]
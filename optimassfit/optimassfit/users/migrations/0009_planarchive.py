@@ -0,0 +1,28 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanArchive',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='plan_archive', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('plans', models.JSONField(default=list)),
+                ('plans_count', models.PositiveIntegerField(default=0)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Архив планов',
+                'verbose_name_plural': 'Архивы планов',
+            },
+        ),
+    ]
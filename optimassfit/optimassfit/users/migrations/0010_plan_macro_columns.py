@@ -0,0 +1,47 @@
+# Generated by Django 4.2.19 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_planarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plan',
+            name='carb_ratio',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='carbs',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='fat_ratio',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='fats',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='protein_ratio',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='plan',
+            name='proteins',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='plan',
+            index=models.Index(fields=['date_created'], name='users_plan_created_idx'),
+        ),
+    ]
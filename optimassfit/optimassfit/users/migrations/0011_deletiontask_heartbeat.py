@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_plan_macro_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deletiontask',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, help_text='Последнее продление аренды исполнителем', null=True),
+        ),
+    ]
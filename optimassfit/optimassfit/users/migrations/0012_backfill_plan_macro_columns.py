@@ -0,0 +1,55 @@
+# Generated by Django 4.2.19 on 2026-10-18 15:00
+
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 2000
+
+# копия Plan.MACRO_FIELDS / MACRO_ALIASES на момент миграции
+MACRO_FIELDS = ('proteins', 'fats', 'carbs', 'protein_ratio', 'fat_ratio', 'carb_ratio')
+MACRO_ALIASES = {'proteins': 'protein', 'fats': 'fat', 'carbs': 'carb'}
+
+
+def macro_columns(macros):
+    # копия Plan.sync_macro_columns на момент миграции
+    macros = macros if isinstance(macros, dict) else {}
+    columns = {}
+    for field in MACRO_FIELDS:
+        value = macros.get(field, macros.get(MACRO_ALIASES.get(field)))
+        is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+        columns[field] = float(value) if is_number else None
+    return columns
+
+
+def fill_macro_columns(apps, schema_editor):
+    """
+    Заполняет числовые столбцы БЖУ планов, созданных до 0010, пачками по id:
+    каждая пачка — своя транзакция, таблица планов не блокируется целиком.
+    """
+    Plan = apps.get_model('users', 'Plan')
+    alias = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        chunk = list(
+            Plan.objects.using(alias).filter(id__gt=last_id, macros__isnull=False, proteins__isnull=True)
+            .order_by('id').only('id', 'macros')[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        for plan in chunk:
+            for field, value in macro_columns(plan.macros).items():
+                setattr(plan, field, value)
+        with transaction.atomic(using=alias):
+            Plan.objects.using(alias).bulk_update(chunk, MACRO_FIELDS, batch_size=500)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0011_deletiontask_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_macro_columns, migrations.RunPython.noop),
+    ]
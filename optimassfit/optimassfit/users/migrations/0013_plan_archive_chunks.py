@@ -0,0 +1,96 @@
+# Generated by Django 4.2.19 on 2026-10-18 16:00
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+from django.utils.dateparse import parse_datetime
+import django.db.models.deletion
+
+# копия archive.CHUNK_PLANS на момент миграции
+CHUNK_PLANS = 100
+USERS_PER_BATCH = 500
+
+
+def row_key(row):
+    return parse_datetime(row[1]), row[0]
+
+
+def split_archives(apps, schema_editor):
+    """Режет строку архива пользователя на куски по CHUNK_PLANS снимков, пачками пользователей"""
+    PlanArchive = apps.get_model('users', 'PlanArchive')
+    PlanArchiveChunk = apps.get_model('users', 'PlanArchiveChunk')
+    alias = schema_editor.connection.alias
+    last_user_id = 0
+    while True:
+        archives = list(
+            PlanArchive.objects.using(alias).filter(user_id__gt=last_user_id)
+            .order_by('user_id').values_list('user_id', 'plans')[:USERS_PER_BATCH]
+        )
+        if not archives:
+            break
+        last_user_id = archives[-1][0]
+        chunks = []
+        for user_id, plans in archives:
+            plans = sorted(plans, key=row_key)
+            for start in range(0, len(plans), CHUNK_PLANS):
+                rows = plans[start:start + CHUNK_PLANS]
+                ids = [row[0] for row in rows]
+                oldest_created, oldest_plan_id = row_key(rows[0])
+                chunks.append(PlanArchiveChunk(
+                    user_id=user_id, plans=rows, plans_count=len(rows), oldest_created=oldest_created,
+                    oldest_plan_id=oldest_plan_id, min_plan_id=min(ids), max_plan_id=max(ids),
+                ))
+        with transaction.atomic(using=alias):
+            PlanArchiveChunk.objects.using(alias).bulk_create(chunks, batch_size=500)
+
+
+def join_chunks(apps, schema_editor):
+    PlanArchive = apps.get_model('users', 'PlanArchive')
+    PlanArchiveChunk = apps.get_model('users', 'PlanArchiveChunk')
+    alias = schema_editor.connection.alias
+    archives = {}
+    for user_id, plans in (
+        PlanArchiveChunk.objects.using(alias)
+        .order_by('user_id', 'oldest_created', 'oldest_plan_id').values_list('user_id', 'plans').iterator()
+    ):
+        archives.setdefault(user_id, []).extend(plans)
+    PlanArchive.objects.using(alias).bulk_create(
+        [PlanArchive(user_id=user_id, plans=plans, plans_count=len(plans)) for user_id, plans in archives.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0012_backfill_plan_macro_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanArchiveChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('oldest_created', models.DateTimeField()),
+                ('oldest_plan_id', models.BigIntegerField()),
+                ('min_plan_id', models.BigIntegerField()),
+                ('max_plan_id', models.BigIntegerField()),
+                ('plans', models.JSONField(default=list)),
+                ('plans_count', models.PositiveIntegerField(default=0)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_archive_chunks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Кусок архива планов',
+                'verbose_name_plural': 'Архив планов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='planarchivechunk',
+            index=models.Index(fields=['user', '-oldest_created', '-oldest_plan_id'], name='users_archive_user_oldest_idx'),
+        ),
+        migrations.RunPython(split_archives, join_chunks),
+        migrations.DeleteModel(
+            name='PlanArchive',
+        ),
+    ]
@@ -1,7 +1,9 @@
+import hashlib
+import json
+
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
 from django.conf import settings
-from django.db import models
 
 
 class UserManager(BaseUserManager):
@@ -29,6 +31,7 @@ class UserManager(BaseUserManager):
     def get_by_natural_key(self, username):
         return self.get(**{self.model.USERNAME_FIELD: username})
 
+
 class User(AbstractBaseUser, PermissionsMixin):
     username = models.CharField(max_length=150, unique=True)
     email = models.EmailField(unique=True, blank=True, null=True)
@@ -51,6 +54,11 @@ class User(AbstractBaseUser, PermissionsMixin):
     )
     date_joined = models.DateTimeField(auto_now_add=True)
 
+    # Денормализация для дашборда: последний план и число планов.
+    # Поддерживаются services.save_plans и сигналами Plan; пересборка — repair_plan_counters
+    current_plan = models.ForeignKey('Plan', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    plans_count = models.PositiveIntegerField(default=0)
+
     is_staff = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
 
@@ -62,7 +70,13 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.username
 
+
 class Plan(models.Model):
+    # Ключи БЖУ в macros и одноимённые числовые столбцы
+    MACRO_FIELDS = ('proteins', 'fats', 'carbs', 'protein_ratio', 'fat_ratio', 'carb_ratio')
+    # Ключи в единственном числе из старых примеров PlanViewSet
+    MACRO_ALIASES = {'protein': 'proteins', 'fat': 'fats', 'carb': 'carbs'}
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='plans')
     date_created = models.DateTimeField(auto_now_add=True)
 
@@ -78,10 +92,118 @@ class Plan(models.Model):
     macros = models.JSONField(null=True, blank=True)
     training_recommendations = models.JSONField(null=True, blank=True)
 
+    # БЖУ (г) и их коэффициенты числовыми столбцами для агрегатов; заполняются
+    # из macros при записи (sync_macro_columns), macros остаётся для совместимости API
+    proteins = models.FloatField(null=True, blank=True)
+    fats = models.FloatField(null=True, blank=True)
+    carbs = models.FloatField(null=True, blank=True)
+    protein_ratio = models.FloatField(null=True, blank=True)
+    fat_ratio = models.FloatField(null=True, blank=True)
+    carb_ratio = models.FloatField(null=True, blank=True)
+
+    # Рекомендации плана — ссылка на общую неизменяемую версию шаблона.
+    # training_recommendations заполнен только у планов без версии (созданных вручную).
+    template_version = models.ForeignKey(
+        'TemplateVersion', on_delete=models.PROTECT, null=True, blank=True, related_name='plans'
+    )
+    # True — админ изменил упражнения плана, они хранятся в Workout (services.materialize_workouts)
+    workouts_customized = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # дашборд, история (keyset) и пересчёт current_plan: планы пользователя от новых к старым
+            models.Index(fields=['user', '-date_created', '-id'], name='users_plan_user_created_idx'),
+            # аналитика и выгрузки за период
+            models.Index(fields=['date_created'], name='users_plan_created_idx'),
+        ]
+
     def __str__(self):
         return f"План от {self.date_created:%d.%m.%Y} для {self.user.username}"
 
-class Workout(models.Model):
+    def save(self, *args, **kwargs):
+        self.sync_macro_columns()
+        super().save(*args, **kwargs)
+
+    def sync_macro_columns(self):
+        """
+        Заполняет числовые столбцы из macros; bulk_create/bulk_update вызывают его явно.
+        Сам macros не меняется; ключ в единственном числе читается, если нет основного.
+        """
+        macros = self.macros if isinstance(self.macros, dict) else {}
+        aliases = {field: alias for alias, field in self.MACRO_ALIASES.items()}
+        for field in self.MACRO_FIELDS:
+            value = macros.get(field, macros.get(aliases.get(field)))
+            is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            setattr(self, field, float(value) if is_number else None)
+
+    @property
+    def recommendation_description(self):
+        """Описание рекомендаций: из версии шаблона или из собственного поля плана"""
+        if self.template_version_id:
+            return self.template_version.description
+        return self.training_recommendations
+
+
+class PlanArchiveChunk(models.Model):
+    """
+    Архив старых снимков планов кусками по archive.CHUNK_PLANS снимков. Снимки
+    лежат в plans компактными списками значений (порядок — archive.ARCHIVE_FIELDS,
+    последним — названия упражнений изменённого плана), от старых к новым.
+    Куски пользователя не пересекаются по (date_created, id), поэтому страница
+    истории читает по индексу только куски раньше курсора, а план по id — кусок
+    с подходящим диапазоном id. Заполняется командой archive_plans (см. users.archive).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='plan_archive_chunks')
+    # ключ самого старого снимка куска
+    oldest_created = models.DateTimeField()
+    oldest_plan_id = models.BigIntegerField()
+    min_plan_id = models.BigIntegerField()
+    max_plan_id = models.BigIntegerField()
+    plans = models.JSONField(default=list)
+    plans_count = models.PositiveIntegerField(default=0)
+    date_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Кусок архива планов'
+        verbose_name_plural = 'Архив планов'
+        indexes = [
+            # история: куски пользователя раньше курсора, от новых к старым
+            models.Index(fields=['user', '-oldest_created', '-oldest_plan_id'], name='users_archive_user_oldest_idx'),
+        ]
+
+    def __str__(self):
+        return f"Архив планов {self.user_id} с {self.oldest_created:%d.%m.%Y}: {self.plans_count}"
+
+
+class Exercise(models.Model):
+    """
+    Словарь названий упражнений. Строки неизменяемы: Workout и WorkoutTemplate
+    ссылаются на них по id, название по id отдаёт exercises.exercise_dictionary.
+    """
+    name = models.CharField(max_length=255, unique=True)
+
+    class Meta:
+        verbose_name = 'Упражнение'
+        verbose_name_plural = 'Упражнения'
+
+    def __str__(self):
+        return self.name
+
+
+class ExerciseNameMixin:
+    """
+    Свойство name поверх exercise_id (через кэш словаря, без JOIN) — только для чтения:
+    названия переводятся в id пачкой при сохранении (exercise_dictionary.intern,
+    serializers.intern_exercise_names), а не запросами на каждое присваивание.
+    """
+
+    @property
+    def name(self):
+        from .exercises import exercise_dictionary
+        return exercise_dictionary.name(self.exercise_id)
+
+
+class Workout(ExerciseNameMixin, models.Model):
     """
     Отдельная модель для каждой тренировки,
     связанная с конкретным планом через ForeignKey.
@@ -91,19 +213,23 @@ class Workout(models.Model):
         on_delete=models.CASCADE,
         related_name='workouts'
     )
-    name = models.CharField(
-        max_length=255,
-        help_text='Название упражнения или тренировки'
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.PROTECT,
+        related_name='+',
+        help_text='Упражнение или тренировка'
     )
 
     class Meta:
         verbose_name = 'Тренировка в плане'
         verbose_name_plural = 'Тренировки в плане'
         ordering = ['id']
+        indexes = [models.Index(fields=['plan', 'id'], name='users_workout_plan_id_idx')]
 
     def __str__(self):
         return f"{self.name} (план {self.plan.id})"
 
+
 class RecommendationTemplate(models.Model):
     GENDER_CHOICES = [('male', 'Мужчина'), ('female', 'Женщина')]
     AGE_CATEGORY_CHOICES = [
@@ -128,15 +254,120 @@ class RecommendationTemplate(models.Model):
         verbose_name = 'Шаблон рекомендаций'
         verbose_name_plural = 'Шаблоны рекомендаций'
 
-class WorkoutTemplate(models.Model):
+
+class WorkoutTemplate(ExerciseNameMixin, models.Model):
     recommendation = models.ForeignKey(
         RecommendationTemplate,
         on_delete=models.CASCADE,
         related_name='workouts'
     )
-    name = models.CharField(max_length=255, help_text='Упражнение шаблона')
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.PROTECT,
+        related_name='+',
+        help_text='Упражнение шаблона'
+    )
 
     class Meta:
         ordering = ['id']
+        indexes = [models.Index(fields=['recommendation', 'id'], name='users_wtpl_recommendation_idx')]
         verbose_name = 'Упражнение шаблона'
-        verbose_name_plural = 'Упражнения шаблона'
\ No newline at end of file
+        verbose_name_plural = 'Упражнения шаблона'
+
+
+class TemplateVersion(models.Model):
+    """
+    Неизменяемый снимок рекомендаций (описание + упражнения), адресуемый
+    хешем содержимого. Планы с одинаковыми рекомендациями ссылаются на одну
+    версию вместо копирования описания и упражнений в каждый план.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    description = models.TextField(blank=True)
+    workouts = models.JSONField(default=list, help_text='Названия упражнений по порядку')
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Версия шаблона рекомендаций'
+        verbose_name_plural = 'Версии шаблонов рекомендаций'
+
+    def __str__(self):
+        return f"Версия {self.content_hash[:12]}"
+
+    @staticmethod
+    def hash_content(description, workouts):
+        payload = json.dumps([description, list(workouts)], ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Версия шаблона неизменяема: создайте новую')
+        super().save(*args, **kwargs)
+
+
+class PlanJob(models.Model):
+    """
+    Задание на фоновую генерацию плана.
+    Создаётся при асинхронном обновлении профиля и выбирается
+    воркером (manage.py run_plan_worker) через SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='plan_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    plan = models.ForeignKey(Plan, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    error = models.TextField(blank=True, default='')
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['status', 'id'], name='users_planjob_status_id_idx')]
+        verbose_name = 'Задание на генерацию плана'
+        verbose_name_plural = 'Задания на генерацию планов'
+
+    def __str__(self):
+        return f"Задание {self.id} ({self.status}) для {self.user_id}"
+
+
+class DeletionTask(models.Model):
+    """
+    Фоновое массовое удаление планов (и, при delete_users, самих пользователей).
+    Прогресс и heartbeat (аренда исполнителя) обновляются после каждой пачки,
+    см. deletion.run_deletion_task.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    user_ids = models.JSONField(help_text='id пользователей, чьи планы удаляются')
+    delete_users = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    total_plans = models.PositiveIntegerField(default=0)
+    deleted_plans = models.PositiveIntegerField(default=0)
+    deleted_users = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    heartbeat = models.DateTimeField(null=True, blank=True, help_text='Последнее продление аренды исполнителем')
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Задача массового удаления'
+        verbose_name_plural = 'Задачи массового удаления'
+
+    def __str__(self):
+        return f"Удаление {self.id} ({self.status}): {self.deleted_plans}/{self.total_plans} планов"
@@ -0,0 +1,84 @@
+"""
+Keyset-пагинация истории планов по (date_created, id).
+
+Курсор — позиция последней отданной записи, поэтому следующая страница
+выбирается условием WHERE (date_created, id) < (курсор) по индексу
+и не зависит от глубины истории, в отличие от OFFSET.
+"""
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(date_created, pk):
+    raw = f'{date_created.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        date_part, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        date_created = parse_datetime(date_part)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        date_created = None
+    if date_created is None:
+        raise ValidationError({'cursor': 'Некорректный курсор'})
+    return date_created, pk
+
+
+def get_page_size(value):
+    """Размер страницы из запроса, ограниченный MAX_PAGE_SIZE"""
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(value)
+    except ValueError:
+        raise ValidationError({'page_size': 'Ожидается целое число'})
+    if page_size < 1:
+        raise ValidationError({'page_size': 'Должно быть больше нуля'})
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def keyset_queryset(queryset, cursor=None):
+    """queryset от новых к старым, начиная после курсора (без среза)"""
+    queryset = queryset.order_by('-date_created', '-id')
+    if cursor:
+        date_created, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(date_created__lt=date_created) | Q(date_created=date_created, id__lt=pk))
+    return queryset
+
+
+def keyset_page(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Возвращает (записи страницы, курсор следующей страницы или None)
+    для queryset, отсортированного от новых к старым.
+    Работает и с моделями, и с .values() (тогда в выборке нужны date_created и id).
+    """
+    return split_page(list(keyset_queryset(queryset, cursor)[:page_size + 1]), page_size)
+
+
+async def akeyset_page(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """keyset_page для корутин (async_views): выборка через асинхронную итерацию"""
+    return split_page([row async for row in keyset_queryset(queryset, cursor)[:page_size + 1]], page_size)
+
+
+def split_page(rows, page_size):
+    """
+    Делит выборку из page_size + 1 записей на страницу и курсор следующей
+    страницы (None, если лишней записи нет).
+    """
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last['date_created'], last['id'])
+    return rows, encode_cursor(last.date_created, last.id)
@@ -0,0 +1,182 @@
+"""
+Реестр шаблонов рекомендаций в памяти процесса.
+
+Все RecommendationTemplate вместе с упражнениями загружаются одним запросом
+и хранятся по каноническим кодам модели (gender, '19-30', goal).
+Отсутствующие комбинации тоже запоминаются, поэтому после прогрева
+разрешение шаблона не обращается к БД. Реестр сбрасывается сигналами
+при любой записи шаблона или его упражнений (см. signals.py).
+
+upsert_templates() загружает каталог шаблонов пачкой: упражнения
+сравниваются с текущими, и пишется только разница.
+"""
+import threading
+from collections import Counter, namedtuple
+from functools import reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .exercises import exercise_dictionary
+from .models import RecommendationTemplate, WorkoutTemplate
+
+Recommendation = namedtuple('Recommendation', ['template_id', 'description', 'workouts'])
+
+
+class TemplateRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = None
+        self._generation = 0
+
+    def resolve(self, gender, age_category, goal):
+        """Возвращает Recommendation или None, если шаблона с такими кодами нет"""
+        entries = self._entries
+        if entries is None:
+            entries = self._load()
+        key = (gender, age_category, goal)
+        try:
+            return entries[key]
+        except KeyError:
+            # негативное кэширование: промах тоже запоминаем
+            entries[key] = None
+            return None
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = None
+            self._generation += 1
+
+    def _load(self):
+        generation = self._generation
+        rows = (
+            RecommendationTemplate.objects
+            .order_by('id', 'workouts__id')
+            .values_list('id', 'gender', 'age_category', 'goal', 'description', 'workouts__exercise_id')
+        )
+        templates = {}
+        for template_id, gender, age_category, goal, description, exercise_id in rows:
+            key = (gender, age_category, goal)
+            if key not in templates:
+                templates[key] = (template_id, description, [])
+            if exercise_id is not None:
+                templates[key][2].append(exercise_id)
+
+        entries = {
+            key: Recommendation(template_id, description, tuple(exercise_dictionary.names(exercise_ids)))
+            for key, (template_id, description, exercise_ids) in templates.items()
+        }
+        with self._lock:
+            # если шаблоны поменялись во время загрузки, результат не сохраняем
+            if self._generation == generation:
+                self._entries = entries
+        return entries
+
+
+template_registry = TemplateRegistry()
+
+
+def diff_workouts(template_id, existing, exercise_ids):
+    """
+    Сравнивает упражнения шаблона с желаемым списком.
+    existing — пары (id, exercise_id) текущих упражнений в порядке id,
+    exercise_ids — желаемые упражнения (id словаря Exercise) по порядку.
+    Совпавшие строки остаются, лишние удаляются, недостающие добавляются в конец.
+    Возвращает (id на удаление, новые WorkoutTemplate, число оставленных).
+    """
+    wanted = Counter(exercise_ids)
+    to_delete = []
+    for workout_id, exercise_id in existing:
+        if wanted[exercise_id] > 0:
+            wanted[exercise_id] -= 1
+        else:
+            to_delete.append(workout_id)
+    to_create = []
+    for exercise_id in exercise_ids:
+        if wanted[exercise_id] > 0:
+            wanted[exercise_id] -= 1
+            to_create.append(WorkoutTemplate(recommendation_id=template_id, exercise_id=exercise_id))
+    return to_delete, to_create, len(existing) - len(to_delete)
+
+
+def apply_workout_diff(to_delete, to_create):
+    """Два запроса на любую пачку: DELETE по id и bulk_create; реестр сбрасывается после коммита"""
+    if to_delete:
+        # _raw_delete — без сборщика каскада и сигнала на каждую строку
+        WorkoutTemplate.objects.filter(id__in=to_delete)._raw_delete(connection.alias)
+    if to_create:
+        WorkoutTemplate.objects.bulk_create(to_create)
+    transaction.on_commit(template_registry.invalidate)
+
+
+def upsert_templates(items):
+    """
+    Создаёт или обновляет шаблоны по ключу (gender, age_category, goal) в одной транзакции.
+    items — словари с полями шаблона и списком названий упражнений в 'workouts'.
+    Число запросов не зависит от количества шаблонов и упражнений.
+    Возвращает итоги и сводку изменений по каждому шаблону.
+    """
+    keys = [(item['gender'], item['age_category'], item['goal']) for item in items]
+    if not keys:
+        return {'created': 0, 'updated': 0, 'unchanged': 0, 'workouts_added': 0, 'workouts_removed': 0, 'templates': []}
+
+    with transaction.atomic():
+        templates = {
+            (tpl.gender, tpl.age_category, tpl.goal): tpl
+            for tpl in RecommendationTemplate.objects.select_for_update().filter(
+                reduce(or_, (Q(gender=g, age_category=a, goal=goal) for g, a, goal in keys))
+            )
+        }
+        current = {}
+        for workout_id, template_id, exercise_id in (
+            WorkoutTemplate.objects.filter(recommendation__in=list(templates.values()))
+            .order_by('id').values_list('id', 'recommendation_id', 'exercise_id')
+        ):
+            current.setdefault(template_id, []).append((workout_id, exercise_id))
+        exercise_ids = exercise_dictionary.intern(name for item in items for name in item['workouts'])
+
+        statuses, created, changed = {}, [], []
+        for key, item in zip(keys, items):
+            tpl = templates.get(key)
+            if tpl is None:
+                tpl = templates[key] = RecommendationTemplate(
+                    gender=key[0], age_category=key[1], goal=key[2], description=item['description'],
+                )
+                created.append(tpl)
+                statuses[key] = 'created'
+            elif tpl.description != item['description']:
+                tpl.description = item['description']
+                changed.append(tpl)
+                statuses[key] = 'updated'
+            else:
+                statuses[key] = 'unchanged'
+        RecommendationTemplate.objects.bulk_create(created)
+        RecommendationTemplate.objects.bulk_update(changed, ['description'])
+
+        summary, to_delete, to_create = [], [], []
+        for key, item in zip(keys, items):
+            tpl = templates[key]
+            removed, added, kept = diff_workouts(
+                tpl.id, current.get(tpl.id, []), [exercise_ids[name] for name in item['workouts']]
+            )
+            to_delete += removed
+            to_create += added
+            if statuses[key] == 'unchanged' and (removed or added):
+                statuses[key] = 'updated'
+            summary.append({
+                'id': tpl.id, 'gender': tpl.gender, 'age_category': tpl.age_category, 'goal': tpl.goal,
+                'status': statuses[key], 'workouts_added': len(added),
+                'workouts_removed': len(removed), 'workouts_kept': kept,
+            })
+        apply_workout_diff(to_delete, to_create)
+
+    totals = Counter(statuses.values())
+    return {
+        'created': totals['created'],
+        'updated': totals['updated'],
+        'unchanged': totals['unchanged'],
+        'workouts_added': len(to_create),
+        'workouts_removed': len(to_delete),
+        'templates': summary,
+    }
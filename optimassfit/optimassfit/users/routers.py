@@ -0,0 +1,108 @@
+"""
+Чтение с реплики для тяжёлых GET-эндпоинтов.
+
+ReplicaRouter по умолчанию отправляет всё на основную базу; на реплику
+уходят только чтения внутри read_from_replica() (декоратор replica_reads
+для view). Реплика отстаёт от основной базы, поэтому после записи данных
+пользователя (bump_dashboard_version) его чтения на короткое окно
+READ_YOUR_WRITES_SECONDS закрепляются за основной базой — иначе дашборд
+собрался бы из старых данных и попал в кэш под новой версией.
+Закрепление хранится в кэше Django и должно быть видно всем воркерам,
+поэтому реплика требует общего кэша (REDIS_URL, проверка users.E002).
+Без алиаса REPLICA_DB в DATABASES всё работает с основной базой.
+"""
+import asyncio
+import contextvars
+import functools
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB = 'replica'
+PIN_ALL_KEY = 'replica:pin:all'
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def _pin_key(user_id):
+    return f'replica:pin:{user_id}'
+
+
+def pin_to_primary(*user_ids):
+    """Закрепляет чтения пользователей за основной базой на READ_YOUR_WRITES_SECONDS"""
+    if REPLICA_DB in settings.DATABASES:
+        cache.set_many(dict.fromkeys(map(_pin_key, user_ids), True), timeout=settings.READ_YOUR_WRITES_SECONDS)
+
+
+def pin_all_to_primary():
+    """То же для всех пользователей (массовые операции)"""
+    if REPLICA_DB in settings.DATABASES:
+        cache.set(PIN_ALL_KEY, True, timeout=settings.READ_YOUR_WRITES_SECONDS)
+
+
+def replica_alias(user_id=None):
+    """Алиас для чтений пользователя: реплика или основная база, если реплики нет или действует закрепление"""
+    if REPLICA_DB not in settings.DATABASES:
+        return DEFAULT_DB_ALIAS
+    keys = [PIN_ALL_KEY] if user_id is None else [PIN_ALL_KEY, _pin_key(user_id)]
+    return DEFAULT_DB_ALIAS if cache.get_many(keys) else REPLICA_DB
+
+
+async def areplica_alias(user_id=None):
+    """replica_alias для корутин"""
+    if REPLICA_DB not in settings.DATABASES:
+        return DEFAULT_DB_ALIAS
+    keys = [PIN_ALL_KEY] if user_id is None else [PIN_ALL_KEY, _pin_key(user_id)]
+    return DEFAULT_DB_ALIAS if await cache.aget_many(keys) else REPLICA_DB
+
+
+@contextmanager
+def read_from_replica(user_id=None):
+    """Чтения ORM внутри блока идут на реплику (с учётом закрепления user_id)"""
+    token = _read_alias.set(replica_alias(user_id))
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def replica_reads(view):
+    """
+    Декоратор view: читать с реплики. Пользователь аутентифицируется до
+    переключения, чтобы только что выданный токен не искался на отстающей реплике.
+    Корутины (async_views) тоже поддерживаются: async ORM выполняет запросы
+    в потоке с копией контекста, поэтому роутер видит выбранный алиас.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _read_alias.set(await areplica_alias(request.user.id))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with read_from_replica(request.user.id):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплика — копия основной базы, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схему реплике приносит репликация
+        return db != REPLICA_DB
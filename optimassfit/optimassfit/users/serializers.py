@@ -3,16 +3,21 @@ from rest_framework import serializers
 from .models import Plan, User
 from .models import Workout
 from .models import RecommendationTemplate, WorkoutTemplate
+from .models import PlanJob, DeletionTask
+from .exercises import exercise_dictionary
+from .recommendations import apply_workout_diff, diff_workouts
 
 
 class LoginRequestSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField()
 
+
 class LoginResponseSerializer(serializers.Serializer):
     token = serializers.CharField()
     username = serializers.CharField()
 
+
 class RegisterRequestSerializer(serializers.Serializer):
     username       = serializers.CharField(max_length=150)
     email          = serializers.EmailField()
@@ -31,6 +36,7 @@ class RegisterRequestSerializer(serializers.Serializer):
             raise serializers.ValidationError("Пароли не совпадают")
         return data
 
+
 class RegisterResponseSerializer(LoginResponseSerializer):
     pass
 
@@ -43,7 +49,6 @@ class LogoutResponseSerializer(serializers.Serializer):
     status = serializers.CharField(default="logged out")
 
 
-
 class ProfileUpdateRequestSerializer(serializers.Serializer):
 
     age            = serializers.IntegerField(required=False)
@@ -53,18 +58,43 @@ class ProfileUpdateRequestSerializer(serializers.Serializer):
     training_level = serializers.CharField(required=False)
     target_months = serializers.ChoiceField(choices=[1, 3], required=False)
 
+
 class GenericStatusSerializer(serializers.Serializer):
     status = serializers.CharField()
 
 
-class PlanShortSerializer(serializers.Serializer):
+class PlanJobQueuedSerializer(serializers.Serializer):
+    status     = serializers.CharField(default="queued")
+    job_id     = serializers.IntegerField()
+    status_url = serializers.CharField()
+
+
+class PlanJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PlanJob
+        fields = ['id', 'status', 'plan', 'error', 'date_created', 'date_finished']
+        read_only_fields = fields
+
+
+class DeletionQueuedSerializer(serializers.Serializer):
+    status     = serializers.CharField(default="queued")
+    task_id    = serializers.IntegerField()
+    status_url = serializers.CharField()
+
+
+class DeletionTaskSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeletionTask
+        fields = ['id', 'status', 'delete_users', 'total_plans', 'deleted_plans', 'deleted_users',
+                  'error', 'date_created', 'date_finished']
+        read_only_fields = fields
+
+
+class PlanShortSerializer(serializers.ModelSerializer):
     class Meta:
         model = Plan
         fields = ("id", "date_created", "calories")
 
-class PlansListSerializer(serializers.Serializer):
-    plans = PlanShortSerializer(many=True)
-
 
 class DashboardSerializer(serializers.Serializer):
     calories = serializers.FloatField()
@@ -76,57 +106,149 @@ class DashboardSerializer(serializers.Serializer):
     plans_count = serializers.IntegerField()
 
 
+class DashboardCacheStatsSerializer(serializers.Serializer):
+    hits         = serializers.IntegerField()
+    misses       = serializers.IntegerField()
+    not_modified = serializers.IntegerField()
+    hit_ratio    = serializers.FloatField(allow_null=True)
+
+
+class CacheStatsSerializer(serializers.Serializer):
+    dashboard = DashboardCacheStatsSerializer()
+
+
+class ImportRowErrorSerializer(serializers.Serializer):
+    row    = serializers.IntegerField()
+    errors = serializers.DictField(child=serializers.ListField(child=serializers.CharField()))
+
+
+class ImportResultSerializer(serializers.Serializer):
+    imported         = serializers.IntegerField()
+    errors           = ImportRowErrorSerializer(many=True)
+    seconds          = serializers.FloatField()
+    users_per_second = serializers.FloatField(allow_null=True)
+
+
+class MacroStatsRowSerializer(serializers.Serializer):
+    group             = serializers.JSONField(allow_null=True)
+    plans             = serializers.IntegerField()
+    calories_avg      = serializers.FloatField(allow_null=True)
+    proteins_avg      = serializers.FloatField(allow_null=True)
+    proteins_min      = serializers.FloatField(allow_null=True)
+    proteins_max      = serializers.FloatField(allow_null=True)
+    fats_avg          = serializers.FloatField(allow_null=True)
+    fats_min          = serializers.FloatField(allow_null=True)
+    fats_max          = serializers.FloatField(allow_null=True)
+    carbs_avg         = serializers.FloatField(allow_null=True)
+    carbs_min         = serializers.FloatField(allow_null=True)
+    carbs_max         = serializers.FloatField(allow_null=True)
+    protein_ratio_avg = serializers.FloatField(allow_null=True)
+    fat_ratio_avg     = serializers.FloatField(allow_null=True)
+    carb_ratio_avg    = serializers.FloatField(allow_null=True)
+
+
+class MacroStatsSerializer(serializers.Serializer):
+    group_by = serializers.CharField(allow_null=True)
+    groups   = MacroStatsRowSerializer(many=True)
+
+
 class UsersListItemSerializer(serializers.Serializer):
     username = serializers.CharField()
     email    = serializers.EmailField()
 
+
 class UsersListSerializer(serializers.Serializer):
     users = UsersListItemSerializer(many=True)
 
 
-
-
 class AdminUserSerializer(serializers.ModelSerializer):
-    """Полная информация для admin‑панели"""
-    current_plan = serializers.SerializerMethodField()
-    plan_history = PlanShortSerializer(source="plans", many=True)
+    """
+    Полная информация для admin‑панели.
+    Ожидает queryset с select_related("current_plan") и планами,
+    предзагруженными в recent_plans (последние N, см. api_custom_admin_dashboard).
+    """
+    current_plan = PlanShortSerializer(read_only=True, allow_null=True)
+    plan_history = PlanShortSerializer(source="recent_plans", many=True, read_only=True)
 
     class Meta:
         model  = User
         fields = (
-            "username", "email",
-            "age", "goal", "training_level",
+            "id", "username", "email",
+            "age", "goal", "training_level", "date_joined", "plans_count",
             "current_plan", "plan_history",
         )
 
 
-    def get_current_plan(self, obj):
-        plan = obj.plans.order_by("-date_created").first()
-        return PlanShortSerializer(plan).data if plan else None
+class AdminUsersPageSerializer(serializers.Serializer):
+    """Страница AdminUserPagination (PageNumberPagination)"""
+    count    = serializers.IntegerField()
+    next     = serializers.URLField(allow_null=True)
+    previous = serializers.URLField(allow_null=True)
+    results  = AdminUserSerializer(many=True)
+
+
+class ExerciseNameField(serializers.CharField):
+    """
+    Название упражнения ↔ id словаря Exercise; названия берутся из кэша процесса, без JOIN.
+    При валидации в validated_data под exercise_id остаётся название: в id его
+    переводит create/update сериализатора (intern_exercise_names), поэтому
+    отклонённый запрос не добавляет упражнений в словарь.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'exercise_id')
+        kwargs.setdefault('max_length', 255)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return exercise_dictionary.name(value)
+
+
+def intern_exercise_names(*items):
+    """Заменяет названия из ExerciseNameField на id словаря одной пачкой (validated_data на месте)"""
+    items = [item for item in items if 'exercise_id' in item]
+    ids = exercise_dictionary.intern(item['exercise_id'] for item in items)
+    for item in items:
+        item['exercise_id'] = ids[item['exercise_id']]
 
 
 class WorkoutSerializer(serializers.ModelSerializer):
+    name = ExerciseNameField()
+
     class Meta:
         model = Workout
         fields = ['id', 'plan', 'name']
         read_only_fields = ['id', 'plan']
 
+    def create(self, validated_data):
+        intern_exercise_names(validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        intern_exercise_names(validated_data)
+        return super().update(instance, validated_data)
+
+
 class PlanSerializer(serializers.ModelSerializer):
     class Meta:
         model = Plan
         fields = [
             'id', 'user', 'date_created',
-            'goal_snapshot','age_snapshot','height_snapshot','weight_snapshot',
-            'training_level_snapshot','calories','macros'
+            'goal_snapshot', 'age_snapshot', 'height_snapshot', 'weight_snapshot',
+            'training_level_snapshot', 'calories', 'macros'
         ]
-        read_only_fields = ['id','date_created','user']
+        read_only_fields = ['id', 'date_created', 'user']
+
 
 class WorkoutTemplateSerializer(serializers.ModelSerializer):
+    name = ExerciseNameField()
+
     class Meta:
         model = WorkoutTemplate
         fields = ['id', 'name']
         read_only_fields = ['id']
 
+
 class RecommendationTemplateSerializer(serializers.ModelSerializer):
     workouts = WorkoutTemplateSerializer(many=True)
 
@@ -144,23 +266,70 @@ class RecommendationTemplateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         workouts_data = validated_data.pop('workouts')
+        intern_exercise_names(*workouts_data)
         rec = RecommendationTemplate.objects.create(**validated_data)
-        for w in workouts_data:
-            WorkoutTemplate.objects.create(recommendation=rec, **w)
+        apply_workout_diff([], [WorkoutTemplate(recommendation=rec, **w) for w in workouts_data])
         return rec
 
     def update(self, instance, validated_data):
         workouts_data = validated_data.pop('workouts', [])
+        intern_exercise_names(*workouts_data)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
-        # полностью пересоздаём упражнения
-        instance.workouts.all().delete()
-        for w in workouts_data:
-            WorkoutTemplate.objects.create(recommendation=instance, **w)
+        # пишем только разницу: совпавшие упражнения остаются на месте
+        to_delete, to_create, _ = diff_workouts(
+            instance.id, list(instance.workouts.values_list('id', 'exercise_id')),
+            [w['exercise_id'] for w in workouts_data]
+        )
+        apply_workout_diff(to_delete, to_create)
         return instance
 
+
+class TemplateUpsertWorkoutSerializer(serializers.Serializer):
+    # названия переводятся в id словаря одной пачкой в upsert_templates
+    name = serializers.CharField(max_length=255)
+
+
+class TemplateUpsertItemSerializer(serializers.Serializer):
+    gender       = serializers.ChoiceField(choices=RecommendationTemplate.GENDER_CHOICES)
+    age_category = serializers.ChoiceField(choices=RecommendationTemplate.AGE_CATEGORY_CHOICES)
+    goal         = serializers.ChoiceField(choices=RecommendationTemplate.GOAL_CHOICES)
+    description  = serializers.CharField()
+    workouts     = TemplateUpsertWorkoutSerializer(many=True)
+
+
+class TemplateBulkUpsertSerializer(serializers.Serializer):
+    templates = TemplateUpsertItemSerializer(many=True, allow_empty=False)
+
+    def validate_templates(self, value):
+        keys = [(t['gender'], t['age_category'], t['goal']) for t in value]
+        if len(set(keys)) != len(keys):
+            raise serializers.ValidationError('Комбинация gender/age_category/goal повторяется.')
+        return value
+
+
+class TemplateUpsertEntrySerializer(serializers.Serializer):
+    id               = serializers.IntegerField()
+    gender           = serializers.CharField()
+    age_category     = serializers.CharField()
+    goal             = serializers.CharField()
+    status           = serializers.ChoiceField(choices=['created', 'updated', 'unchanged'])
+    workouts_added   = serializers.IntegerField()
+    workouts_removed = serializers.IntegerField()
+    workouts_kept    = serializers.IntegerField()
+
+
+class TemplateUpsertResultSerializer(serializers.Serializer):
+    created          = serializers.IntegerField()
+    updated          = serializers.IntegerField()
+    unchanged        = serializers.IntegerField()
+    workouts_added   = serializers.IntegerField()
+    workouts_removed = serializers.IntegerField()
+    templates        = TemplateUpsertEntrySerializer(many=True)
+
+
 class RegisterDetailSerializer(serializers.ModelSerializer):
     password_hash = serializers.CharField(source='password', read_only=True)
 
@@ -171,8 +340,11 @@ class RegisterDetailSerializer(serializers.ModelSerializer):
                   'date_joined', 'password_hash']
         read_only_fields = fields
 
+
 class PlanListItemSerializer(serializers.ModelSerializer):
     """Список планов пользователя с КБЖУ и рекомендациями"""
+    training_recommendations = serializers.JSONField(source='recommendation_description', read_only=True)
+
     class Meta:
         model = Plan
         fields = [
@@ -189,5 +361,15 @@ class PlanListItemSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = fields
 
+
+class PlanCompactSerializer(serializers.ModelSerializer):
+    """Облегчённый элемент истории планов (view=compact)"""
+    class Meta:
+        model = Plan
+        fields = ['id', 'date_created', 'goal_snapshot', 'weight_snapshot', 'calories']
+        read_only_fields = fields
+
+
 class PlansListSerializer(serializers.Serializer):
-    plans = PlanListItemSerializer(many=True)
\ No newline at end of file
+    plans = PlanListItemSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True)
@@ -0,0 +1,219 @@
+"""
+Генерация планов.
+
+Единая точка создания Plan для всех входов (API, HTML-формы, служебные
+команды). Снимок профиля и КБЖУ считаются в памяти, шаблон берётся из
+реестра. Рекомендации не копируются: план ссылается на неизменяемую
+TemplateVersion, а строки Workout появляются только когда админ меняет
+упражнения плана (materialize_workouts). Пачка планов пишется одним INSERT.
+
+Вместе с планами поддерживаются денормализованные User.current_plan
+и User.plans_count (attach_plans / refresh_plan_counters).
+
+Асинхронный режим: enqueue_plan() только ставит PlanJob в очередь,
+а process_plan_jobs() (команда run_plan_worker) разбирает её пачками.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .dashboard import bump_dashboard_version
+from .exercises import exercise_dictionary
+from .models import Plan, PlanArchiveChunk, PlanJob, TemplateVersion, User, Workout
+from .utils import calculate_calories, calculate_macros, get_age_category, get_training_recommendations
+
+
+_version_ids = {}
+
+
+def template_version_id(description, workouts):
+    """
+    id неизменяемой версии рекомендаций с таким содержимым; версия создаётся
+    при первом обращении. Соответствие кэшируется в процессе, а для новой
+    версии — только после коммита, чтобы откат не оставил в кэше чужой id.
+    """
+    key = (description, tuple(workouts))
+    version_id = _version_ids.get(key)
+    if version_id is None:
+        version, created = TemplateVersion.objects.get_or_create(
+            content_hash=TemplateVersion.hash_content(*key),
+            defaults={'description': description, 'workouts': list(workouts)},
+        )
+        version_id = version.id
+        if created:
+            transaction.on_commit(lambda: _version_ids.setdefault(key, version_id))
+        else:
+            _version_ids[key] = version_id
+    return version_id
+
+
+def build_plan(user, norms=None):
+    """
+    Считает снимок профиля и возвращает несохранённый Plan со ссылкой на версию рекомендаций.
+    norms — заранее посчитанная пара (calories, macros), например пакетным расчётом.
+    """
+    age_cat = get_age_category(user.age)
+    rec = get_training_recommendations(user.gender, age_cat, user.goal)
+    if norms is None:
+        norms = (
+            calculate_calories(user, user.training_level),
+            calculate_macros(user.weight, age_cat, user.goal, user.gender),
+        )
+    calories, macros = norms
+    return Plan(
+        user=user,
+        goal_snapshot=user.goal,
+        age_snapshot=user.age,
+        height_snapshot=user.height,
+        weight_snapshot=user.weight,
+        training_level_snapshot=user.training_level,
+        calories=calories,
+        macros=macros,
+        template_version_id=template_version_id(rec.get('description', ''), rec.get('workouts', [])),
+    )
+
+
+def save_plans(plans):
+    """Сохраняет планы одним INSERT в транзакции вместе с обновлением их владельцев"""
+    for plan in plans:
+        plan.sync_macro_columns()
+    with transaction.atomic():
+        plans = Plan.objects.bulk_create(plans)
+        attach_plans(plans)
+    return plans
+
+
+def materialize_workouts(plan):
+    """
+    Копирует упражнения версии шаблона в Workout, чтобы админ мог их менять.
+    Выполняется один раз на план: дальше упражнения читаются из Workout.
+    """
+    if plan.workouts_customized:
+        return
+    with transaction.atomic():
+        # условный UPDATE защищает от двойного копирования при параллельных запросах
+        if Plan.objects.filter(pk=plan.pk, workouts_customized=False).update(workouts_customized=True):
+            if plan.template_version_id:
+                names = plan.template_version.workouts
+                exercise_ids = exercise_dictionary.intern(names)
+                Workout.objects.bulk_create([
+                    Workout(plan=plan, exercise_id=exercise_ids[name]) for name in names
+                ])
+    plan.workouts_customized = True
+
+
+def plan_workout_names(plan):
+    """
+    Упражнения плана: из строки архива (users.archive), изменённые админом
+    или собственные (Workout), иначе — из версии шаблона.
+    """
+    archived = getattr(plan, 'archived_workouts', None)
+    if archived is not None:
+        return list(archived)
+    if plan.workouts_customized or not plan.template_version_id:
+        return exercise_dictionary.names(list(Workout.objects.filter(plan=plan).values_list('exercise_id', flat=True)))
+    return list(plan.template_version.workouts)
+
+
+def attach_plans(plans):
+    """
+    Делает новые планы текущими и увеличивает plans_count их владельцев —
+    одним UPDATE на всю пачку. Планы передаются в порядке создания.
+    """
+    latest, added = {}, Counter()
+    for plan in plans:
+        latest[plan.user_id] = plan.id
+        added[plan.user_id] += 1
+        if Plan.user.is_cached(plan):
+            plan.user.current_plan = plan
+            plan.user.plans_count = (plan.user.plans_count or 0) + 1
+    if not latest:
+        return
+    bump_dashboard_version(*latest)
+    User.objects.filter(pk__in=latest).update(
+        current_plan_id=Case(*(When(pk=user_id, then=Value(plan_id)) for user_id, plan_id in latest.items())),
+        plans_count=F('plans_count') + Case(*(When(pk=user_id, then=Value(n)) for user_id, n in added.items())),
+    )
+
+
+def refresh_plan_counters(users):
+    """Пересчитывает current_plan и plans_count по фактическим планам для queryset пользователей"""
+    plans = Plan.objects.filter(user_id=OuterRef('pk'))
+    return users.update(
+        current_plan_id=Subquery(plans.order_by('-date_created', '-id').values('id')[:1]),
+        # архивные снимки тоже входят в историю
+        plans_count=Coalesce(
+            Subquery(plans.order_by().values('user_id').annotate(n=Count('id')).values('n')),
+            0,
+        ) + Coalesce(Subquery(
+            PlanArchiveChunk.objects.filter(user_id=OuterRef('pk')).order_by().values('user_id')
+            .annotate(n=Sum('plans_count')).values('n')
+        ), 0),
+    )
+
+
+def generate_plans(users):
+    """Создаёт по новому плану для каждого пользователя"""
+    return save_plans([build_plan(user) for user in users])
+
+
+def generate_plan(user):
+    """Создаёт новый план по текущему профилю пользователя"""
+    return generate_plans([user])[0]
+
+
+def enqueue_plan(user):
+    """Ставит генерацию плана в очередь; план создаст воркер"""
+    return PlanJob.objects.create(user=user)
+
+
+def _lock_queue():
+    # SQLite не блокирует строки и игнорирует FOR UPDATE: пустой UPDATE сразу берёт
+    # блокировку записи базы, и воркеры разбирают очередь по одному, а не одни и те же задания
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {connection.ops.quote_name(PlanJob._meta.db_table)} SET id = id WHERE 0 = 1")
+
+
+def process_plan_jobs(batch_size=100):
+    """
+    Забирает пачку ожидающих заданий через SELECT ... FOR UPDATE SKIP LOCKED
+    и создаёт по одному плану на пользователя. Всё происходит в одной
+    транзакции: если воркер упадёт, задания вернутся в очередь.
+    Возвращает количество обработанных заданий.
+    """
+    with transaction.atomic():
+        if not connection.features.has_select_for_update_skip_locked:
+            _lock_queue()
+        jobs = list(
+            PlanJob.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('user')
+            .filter(status=PlanJob.STATUS_PENDING)
+            .order_by('id')[:batch_size]
+        )
+        if not jobs:
+            return 0
+
+        # несколько заданий одного пользователя в пачке дают один и тот же снимок
+        built, errors = {}, {}
+        for job in jobs:
+            if job.user_id in built or job.user_id in errors:
+                continue
+            try:
+                built[job.user_id] = build_plan(job.user)
+            except (TypeError, ValueError) as exc:
+                errors[job.user_id] = f'Неполный профиль: {exc}'
+        plans = dict(zip(built, save_plans(list(built.values()))))
+
+        now = timezone.now()
+        for job in jobs:
+            job.date_finished = now
+            if job.user_id in plans:
+                job.status, job.plan = PlanJob.STATUS_DONE, plans[job.user_id]
+            else:
+                job.status, job.error = PlanJob.STATUS_FAILED, errors[job.user_id]
+        PlanJob.objects.bulk_update(jobs, ['status', 'plan', 'error', 'date_finished'])
+    return len(jobs)
@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .models import Plan, RecommendationTemplate, User, WorkoutTemplate
+from .authentication import forget_token, issued_token_key
+from .recommendations import template_registry
+from .dashboard import bump_dashboard_version
+from .services import attach_plans, refresh_plan_counters
+
+
+@receiver(post_save, sender=RecommendationTemplate)
+@receiver(post_delete, sender=RecommendationTemplate)
+@receiver(post_save, sender=WorkoutTemplate)
+@receiver(post_delete, sender=WorkoutTemplate)
+def invalidate_template_registry(sender, **kwargs):
+    """Сбрасывает реестр шаблонов после фиксации транзакции"""
+    transaction.on_commit(template_registry.invalidate)
+
+
+@receiver(post_save, sender=Plan)
+def attach_created_plan(sender, instance, created, **kwargs):
+    """План, созданный через save() (админка, PlanViewSet), становится текущим"""
+    if created:
+        attach_plans([instance])
+    else:
+        bump_dashboard_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Plan)
+def detach_deleted_plan(sender, instance, **kwargs):
+    """После удаления плана пересчитываем указатель и счётчик владельца"""
+    refresh_plan_counters(User.objects.filter(pk=instance.user_id))
+    bump_dashboard_version(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_dashboard(sender, instance, **kwargs):
+    """Профиль изменился — дашборд пользователя нужно пересобрать"""
+    bump_dashboard_version(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """Смена или удаление токена: снимок в кэше других процессов устаревает по версии пользователя"""
+    forget_token(instance.key)
+    cache.delete(issued_token_key(instance.user_id))
+    bump_dashboard_version(instance.user_id)
@@ -0,0 +1,37 @@
+"""
+Настройка соединений SQLite (профиль settings_sqlite).
+
+Файловая база переводится в режим WAL: читатели не ждут писателя, а
+synchronous=NORMAL не делает fsync на каждую фиксацию — для локальных
+бенчмарков этого достаточно. Обработчик подключает settings_sqlite, так
+что профили PostgreSQL его не видят.
+
+База в памяти живёт, пока открыто хотя бы одно соединение процесса.
+Тесты и check_query_plans создают её сами (create_test_db), остальным
+командам схему создаёт prepare_memory_database.
+"""
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_keepalive = {}
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created"""
+    if connection.vendor == 'sqlite' and not connection.is_in_memory_db():
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = WAL')
+            cursor.execute('PRAGMA synchronous = NORMAL')
+
+
+def prepare_memory_database(using=DEFAULT_DB_ALIAS):
+    """
+    Применяет миграции к базе в памяти (SQLITE_PATH=:memory:) один раз за процесс.
+    Отдельное соединение держит базу, пока Django закрывает свои между запросами.
+    Для файловой базы и PostgreSQL ничего не делает.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not connection.is_in_memory_db() or using in _keepalive:
+        return
+    _keepalive[using] = connection.Database.connect(connection.settings_dict['NAME'], uri=True)
+    call_command('migrate', database=using, run_syncdb=True, interactive=False, verbosity=0)
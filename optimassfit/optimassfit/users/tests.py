@@ -0,0 +1,1637 @@
+"""
+Тесты приложения users.
+
+Запуск без PostgreSQL (профиль SQLite, см. settings_test):
+
+    DJANGO_SETTINGS_MODULE=optimassfit.optimassfit.settings_test python manage.py test optimassfit.optimassfit.users
+"""
+import base64
+import csv
+import importlib
+import importlib.util
+import itertools
+import json
+import multiprocessing
+import os
+import runpy
+import tempfile
+import time
+from collections import Counter
+from contextlib import ExitStack
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import psycopg2.extensions
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.admin.sites import site
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.backends.signals import connection_created
+from django.forms.models import model_to_dict
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from ..dbpool import base as dbpool
+from . import analytics, archive, deletion, exports, imports, pagination, routers, services, sqlite
+from .authentication import TokenCache, token_cache
+from .dashboard import dashboard_cache_stats, get_dashboard_version, invalidate_all_dashboards
+from .exercises import exercise_dictionary
+from .management.commands import check_query_plans, recompute_plans
+from .models import (DeletionTask, Exercise, Plan, PlanArchiveChunk, PlanJob, RecommendationTemplate, TemplateVersion,
+                     User, Workout, WorkoutTemplate)
+from .recommendations import diff_workouts, template_registry, upsert_templates
+from .routers import REPLICA_DB
+from . import utils
+from .utils import AGE_CATEGORY_CODES, get_age_category
+
+
+def reset_process_caches():
+    """Кэши процесса и кэш Django между тестами (как в check_query_plans)"""
+    cache.clear()
+    token_cache.clear()
+    exercise_dictionary.clear()
+    template_registry.invalidate()
+    services._version_ids.clear()
+
+
+PROFILE = {'age': 30, 'height': 175, 'weight': 75, 'gender': 'male', 'goal': 'maintain', 'training_level': '2-3',
+           'target_months': 1}
+
+
+def create_user(username, **fields):
+    """Пользователь с заполненным профилем (пароль = логин)"""
+    return User.objects.create_user(username, f'{username}-password', email=f'{username}@example.com',
+                                    **{**PROFILE, **fields})
+
+
+class PrimaryReadsMixin:
+    """
+    Чистые кэши процесса, и чтения replica_reads остаются на основной базе:
+    реплика-зеркало не видит незафиксированных данных теста, а закрепление
+    после записи ставится только по коммиту.
+    """
+
+    def setUp(self):
+        reset_process_caches()
+        self.addCleanup(reset_process_caches)
+        for name, primary in (('replica_alias', mock.Mock(return_value=DEFAULT_DB_ALIAS)),
+                              ('areplica_alias', mock.AsyncMock(return_value=DEFAULT_DB_ALIAS))):
+            patcher = mock.patch.object(routers, name, primary)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class UsersTestCase(PrimaryReadsMixin, TestCase):
+    """TestCase с чистыми кэшами процесса и чтениями с основной базы"""
+
+
+class PlanGenerationQueryCountTests(UsersTestCase):
+    """
+    Создание плана при обновлении профиля: число запросов после прогрева
+    закреплено и не зависит от числа упражнений в шаблоне (services.save_plans).
+    """
+    # проверка токена (или сессия и пользователь), UPDATE профиля;
+    # INSERT плана и UPDATE владельца в транзакции (2 запроса)
+    QUERIES_PER_UPDATE = 7
+    WORKOUT_COUNTS = (1, 12)
+    PROFILE = {'age': 30, 'height': 175, 'goal': 'maintain', 'training_level': '2-3', 'target_months': 1}
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            'plans_query_count', 'Query-count-password', email='plans_query_count@example.com',
+            gender='male', weight=75, **self.PROFILE,
+        )
+        self.api_headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def use_template(self, workouts_count):
+        # в TestCase on_commit сам не срабатывает, а по нему сбрасывается реестр шаблонов
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_templates([{
+                'gender': 'male', 'age_category': AGE_CATEGORY_CODES[get_age_category(self.PROFILE['age'])],
+                'goal': 'maintain', 'description': f'Шаблон на {workouts_count} упражнений',
+                'workouts': self.workouts(workouts_count),
+            }])
+
+    @staticmethod
+    def workouts(count):
+        return [f'Упражнение {n}' for n in range(count)]
+
+    def assertConstantQueries(self, update):
+        for workouts_count in self.WORKOUT_COUNTS:
+            with self.subTest(workouts=workouts_count):
+                self.use_template(workouts_count)
+                # прогрев реестра шаблонов, кэша токена и id новой версии рекомендаций (кэшируется после коммита)
+                with self.captureOnCommitCallbacks(execute=True):
+                    update(70)
+                plans = Plan.objects.count()
+                with self.assertNumQueries(self.QUERIES_PER_UPDATE):
+                    update(71)
+                self.assertEqual(Plan.objects.count(), plans + 1)
+                self.user.refresh_from_db()
+                self.assertEqual(Plan.objects.get(pk=self.user.current_plan_id).template_version.workouts,
+                                 self.workouts(workouts_count))
+
+    def test_api_profile_update(self):
+        def update(weight):
+            response = self.client.post('/api/profile/update/', {**self.PROFILE, 'weight': weight},
+                                        content_type='application/json', **self.api_headers)
+            self.assertEqual(response.status_code, 200)
+
+        self.assertConstantQueries(update)
+
+    def test_api_update_snapshot(self):
+        def update(weight):
+            response = self.client.put('/api/profile/update_snapshot/', {'weight': weight},
+                                       content_type='application/json', **self.api_headers)
+            self.assertEqual(response.status_code, 200)
+
+        self.assertConstantQueries(update)
+
+    def test_profile_saves_keep_plan_counters(self):
+        """Снимок пользователя в кэше токенов не перезаписывает current_plan и plans_count"""
+        updates = [
+            lambda: self.client.post('/api/profile/update/', {**self.PROFILE, 'weight': 72},
+                                     content_type='application/json', **self.api_headers),
+            lambda: self.client.put('/api/profile/update_snapshot/', {'weight': 73},
+                                    content_type='application/json', **self.api_headers),
+        ]
+        for update in updates:
+            with self.captureOnCommitCallbacks(execute=True):
+                update()
+            # снимок пользователя под текущей версией попадает в кэш токенов
+            self.assertEqual(self.client.get('/api/dashboard/', **self.api_headers).status_code, 200)
+            # план добавлен другим воркером, версия пользователя ещё не сменилась
+            User.objects.filter(pk=self.user.pk).update(plans_count=F('plans_count') + 1)
+            expected = User.objects.get(pk=self.user.pk).plans_count + 1
+            self.assertEqual(update().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertEqual(self.user.plans_count, expected)
+
+    def test_profile_update_view(self):
+        self.client.force_login(self.user)
+
+        def update(weight):
+            response = self.client.post(reverse('profile_update'), {**self.PROFILE, 'weight': weight})
+            self.assertEqual(response.status_code, 302)
+
+        self.assertConstantQueries(update)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    ReplicaRouter: тяжёлые GET читают с реплики, записи идут в основную базу,
+    а после записи чтения пользователя закрепляются за основной базой.
+    Реплика в settings_test — зеркало тестовой базы; TransactionTestCase
+    фиксирует записи, иначе соединение реплики не увидело бы их (в SQLite —
+    блокировка таблицы), как реплика не видит незафиксированных транзакций.
+    """
+    databases = {'default', REPLICA_DB}
+    PROFILE = {'age': 30, 'height': 175, 'weight': 75, 'goal': 'maintain', 'training_level': '2-3', 'target_months': 1}
+
+    def setUp(self):
+        reset_process_caches()
+        self.addCleanup(reset_process_caches)
+        self.user = User.objects.create_user(
+            'replica_user', 'Replica-password', email='replica_user@example.com', gender='male', **self.PROFILE,
+        )
+        services.generate_plan(self.user)
+        self.admin = User.objects.create_user(
+            'replica_admin', 'Replica-password', email='replica_admin@example.com', gender='female',
+            is_staff=True, **self.PROFILE,
+        )
+        self.user_headers = self.auth(self.user)
+        self.admin_headers = self.auth(self.admin)
+        # закрепления от записей подготовки не должны влиять на проверки чтений
+        cache.clear()
+
+    @staticmethod
+    def auth(user):
+        return {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=user).key}'}
+
+    def request(self, method, path, headers, **kwargs):
+        """Ответ и SQL, выполненный на основной базе и на реплике"""
+        with ExitStack() as stack:
+            queries = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in ('default', REPLICA_DB)
+            }
+            response = getattr(self.client, method)(path, **kwargs, **headers)
+        sql = {alias: [query['sql'] for query in captured] for alias, captured in queries.items()}
+        return response, sql
+
+    def assertReadFrom(self, alias, path, headers):
+        response, sql = self.request('get', path, headers)
+        self.assertEqual(response.status_code, 200)
+        # аутентификация идёт до переключения на реплику, остальные чтения — только через alias
+        reads = {name: [query for query in queries if '"authtoken_token"' not in query]
+                 for name, queries in sql.items()}
+        self.assertTrue(reads.pop(alias), sql)
+        self.assertEqual(reads, {name: [] for name in reads}, sql)
+
+    def test_reads_go_to_replica(self):
+        cases = [
+            ('/api/dashboard/', self.user_headers),
+            ('/api/plans/', self.user_headers),
+            ('/api/admin/dashboard/', self.admin_headers),
+        ]
+        for path, headers in cases:
+            with self.subTest(path=path):
+                self.assertReadFrom(REPLICA_DB, path, headers)
+
+    def test_writes_go_to_primary(self):
+        response, sql = self.request('post', '/api/profile/update/', self.user_headers,
+                                     data={**self.PROFILE, 'weight': 80}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue([query for query in sql['default'] if query.startswith('INSERT INTO "users_plan"')], sql)
+        self.assertFalse([query for query in sql[REPLICA_DB] if not query.startswith('SELECT')], sql)
+        self.assertEqual(Plan.objects.using(REPLICA_DB).filter(user=self.user, weight_snapshot=80).count(), 1)
+
+    def test_read_your_writes_pin(self):
+        response, _ = self.request('post', '/api/profile/update/', self.user_headers,
+                                   data={**self.PROFILE, 'weight': 80}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # только что записавший пользователь читает с основной базы, остальные — с реплики
+        self.assertReadFrom('default', '/api/dashboard/', self.user_headers)
+        self.assertReadFrom('default', '/api/plans/', self.user_headers)
+        self.assertReadFrom(REPLICA_DB, '/api/admin/dashboard/', self.admin_headers)
+
+        # массовая операция закрепляет всех
+        invalidate_all_dashboards()
+        self.assertReadFrom('default', '/api/admin/dashboard/', self.admin_headers)
+
+        # окно READ_YOUR_WRITES_SECONDS истекло — закрепления в кэше больше нет
+        cache.delete_many(['replica:pin:all', f'replica:pin:{self.user.id}'])
+        self.assertReadFrom(REPLICA_DB, '/api/plans/', self.user_headers)
+
+
+class AdminDashboardTests(UsersTestCase):
+    """GET /api/admin/dashboard/: страница пагинатора и проверка параметра history"""
+
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_user('list_admin', 'List-admin-password', email='list_admin@example.com',
+                                         is_staff=True)
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+
+    def test_paginated_response(self):
+        response = self.client.get('/api/admin/dashboard/', {'history': 0}, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'count', 'next', 'previous', 'results'})
+        self.assertEqual(response.json()['results'][0]['plan_history'], [])
+
+    def test_invalid_history(self):
+        for history in ('-1', 'abc'):
+            with self.subTest(history=history):
+                response = self.client.get('/api/admin/dashboard/', {'history': history}, **self.headers)
+                self.assertEqual(response.status_code, 400)
+
+
+class ExerciseNameFieldTests(UsersTestCase):
+    """Названия упражнений попадают в словарь Exercise только при сохранении"""
+
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_user(
+            'exercise_admin', 'Exercise-admin-password', email='exercise_admin@example.com',
+            age=30, height=175, weight=75, gender='male', goal='maintain', training_level='2-3', is_staff=True,
+        )
+        self.plan = services.generate_plan(admin)
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+
+    def test_rejected_template_adds_no_exercises(self):
+        response = self.client.post('/api/admin/templates/', {
+            'gender': 'unknown', 'age_category': '19-30', 'goal': 'maintain', 'description': 'd',
+            'workouts': [{'name': 'Отклонённое упражнение'}],
+        }, content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Exercise.objects.filter(name='Отклонённое упражнение').exists())
+
+    def test_model_name_is_read_only(self):
+        with self.assertNumQueries(0):
+            with self.assertRaises(AttributeError):
+                Workout(plan=self.plan).name = 'Присвоенное упражнение'
+        self.assertFalse(Exercise.objects.filter(name='Присвоенное упражнение').exists())
+
+    def test_created_workout_interns_name(self):
+        response = self.client.post(f'/api/admin/plans/{self.plan.id}/workouts/', {'name': 'Новое упражнение'},
+                                    content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['name'], 'Новое упражнение')
+        self.assertTrue(Exercise.objects.filter(name='Новое упражнение').exists())
+
+
+class AsyncLoginTests(UsersTestCase):
+    """POST /api/async/login/: last_login и сигналы входа — как у синхронного /api/login/"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('async_login', 'Async-login-password', email='async_login@example.com')
+        self.signals = []
+        for signal in (user_logged_in, user_login_failed):
+            signal.connect(self.record)
+            self.addCleanup(signal.disconnect, self.record)
+
+    def record(self, signal, **kwargs):
+        self.signals.append((signal, kwargs))
+
+    async def login(self, password):
+        return await self.async_client.post('/api/async/login/', {'username': 'async_login', 'password': password},
+                                            content_type='application/json')
+
+    async def test_success_updates_last_login(self):
+        response = await self.login('Async-login-password')
+        self.assertEqual(response.status_code, 200)
+        await self.user.arefresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+        self.assertEqual([(signal, kwargs['user']) for signal, kwargs in self.signals], [(user_logged_in, self.user)])
+
+    async def test_failure_sends_login_failed(self):
+        response = await self.login('wrong-password')
+        self.assertEqual(response.status_code, 400)
+        await self.user.arefresh_from_db()
+        self.assertIsNone(self.user.last_login)
+        [(signal, kwargs)] = self.signals
+        self.assertIs(signal, user_login_failed)
+        self.assertEqual(kwargs['credentials']['username'], 'async_login')
+        self.assertNotEqual(kwargs['credentials']['password'], 'wrong-password')
+
+
+class DashboardCacheTests(UsersTestCase):
+    """Кэш GET /api/dashboard/: версия пользователя, ETag и 304"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('dashboard_user', 'Dashboard-password', email='dashboard_user@example.com',
+                                             age=30, height=175, weight=75, gender='male', goal='maintain',
+                                             training_level='2-3')
+        with self.captureOnCommitCallbacks(execute=True):
+            services.generate_plan(self.user)
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def dashboard(self, **headers):
+        return self.client.get('/api/dashboard/', **self.headers, **headers)
+
+    def test_version_changes_only_after_commit(self):
+        etag = self.dashboard()['ETag']
+        version = get_dashboard_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                services.generate_plan(self.user)
+                # чтение между записью и коммитом идёт под старой версией, а не кэширует данные под новой
+                self.assertEqual(get_dashboard_version(self.user.id), version)
+                self.assertEqual(self.dashboard()['ETag'], etag)
+        self.assertNotEqual(get_dashboard_version(self.user.id), version)
+        response = self.dashboard()
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['plans_count'], 2)
+
+    def test_rollback_keeps_version(self):
+        version = get_dashboard_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                services.generate_plan(self.user)
+                raise RuntimeError
+        self.assertEqual(get_dashboard_version(self.user.id), version)
+
+    def test_not_modified(self):
+        response = self.dashboard()
+        etag = response['ETag']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', response['Vary'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.dashboard(HTTP_IF_NONE_MATCH=f'"other", {etag}')
+        self.assertEqual((response.status_code, response.content, response['ETag']), (304, b'', etag))
+        self.assertFalse([query for query in queries if Plan._meta.db_table in query['sql']])
+        self.assertEqual(self.dashboard(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+        # вытесненная версия даёт промах, но то же содержимое — тот же строгий ETag
+        cache.delete(f'dashboard:version:{self.user.id}')
+        self.assertEqual(self.dashboard(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(dashboard_cache_stats(),
+                         {'hits': 2, 'misses': 2, 'not_modified': 2, 'hit_ratio': 0.5})
+
+    def test_writes_change_etag(self):
+        admin = User.objects.create_superuser('dashboard_admin', 'Admin-password', email='dashboard_admin@example.com')
+        admin_headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+
+        def add_workout():
+            plan_id = User.objects.get(pk=self.user.pk).current_plan_id
+            response = self.client.post(f'/api/admin/plans/{plan_id}/workouts/', {'name': 'Планка'},
+                                        content_type='application/json', **admin_headers)
+            self.assertEqual(response.status_code, 201)
+
+        writes = {
+            'profile': lambda: self.client.post('/api/profile/update/', {**PROFILE, 'weight': 90},
+                                                content_type='application/json', **self.headers),
+            'workout': add_workout,
+            'all': invalidate_all_dashboards,
+            'plan_delete': lambda: Plan.objects.filter(user=self.user).first().delete(),
+        }
+        for name, write in writes.items():
+            with self.subTest(write=name):
+                etag = self.dashboard()['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    write()
+                response = self.dashboard(HTTP_IF_NONE_MATCH=etag)
+                if name == 'all':
+                    # содержимое прежнее: промах кэша, но тот же ETag
+                    self.assertEqual(response.status_code, 304)
+                else:
+                    self.assertEqual(response.status_code, 200)
+                    self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.dashboard().json()['plans_count'], 1)
+
+
+class UserAdminTests(UsersTestCase):
+    """Админка пользователя не выбирает все планы и не перезаписывает денормализацию"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('site_admin', 'Site-admin-password', email='site_admin@example.com',
+                                              is_staff=True)
+        self.user = User.objects.create_user('admin_edited', 'Edited-password', email='admin_edited@example.com',
+                                             age=30, height=175, weight=75, gender='male', goal='maintain',
+                                             training_level='2-3', target_months=1)
+        services.generate_plan(self.user)
+
+    def test_change_form_has_no_plan_select(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:users_user_change', args=[self.user.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'name="current_plan"')
+        self.assertNotContains(response, 'name="plans_count"')
+
+    def test_save_keeps_counters_updated_meanwhile(self):
+        model_admin = site._registry[User]
+        request = RequestFactory().post('/')
+        request.user = self.admin
+        stale = User.objects.get(pk=self.user.pk)
+        services.generate_plan(self.user)  # план создан, пока форма открыта
+
+        form_class = model_admin.get_form(request, stale, change=True)
+        data = {name: value for name, value in model_to_dict(stale, fields=form_class.base_fields).items()
+                if value is not None}
+        form = form_class({**data, 'age': 31}, instance=stale)
+        self.assertTrue(form.is_valid(), form.errors)
+        model_admin.save_model(request, form.save(commit=False), form, change=True)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.age, 31)
+        self.assertEqual(self.user.plans_count, 2)
+        self.assertEqual(self.user.current_plan_id, Plan.objects.filter(user=self.user).latest('id').id)
+
+
+class DeletionTests(UsersTestCase):
+    """Удаление планов и пользователей пачками и жизненный цикл DeletionTask"""
+
+    def setUp(self):
+        super().setUp()
+        self.users = [create_user(f'deleted_{n}') for n in range(2)]
+        self.kept = create_user('kept')
+        for user in self.users + [self.kept]:
+            for _ in range(3):
+                services.generate_plan(user)
+        self.user_ids = [user.id for user in self.users]
+
+    def assertKeptUntouched(self):
+        self.kept.refresh_from_db()
+        self.assertEqual(self.kept.plans_count, 3)
+        self.assertEqual(Plan.objects.filter(user=self.kept).count(), 3)
+
+    def test_delete_plans(self):
+        PlanJob.objects.create(user=self.users[0], plan=self.users[0].current_plan)
+        progress = []
+        self.assertEqual(deletion.delete_plans(self.user_ids, chunk_size=4, progress=progress.append), 6)
+        self.assertEqual(progress, [4, 6])
+        self.assertFalse(Plan.objects.filter(user_id__in=self.user_ids).exists())
+        for user in User.objects.filter(pk__in=self.user_ids):
+            self.assertEqual((user.current_plan_id, user.plans_count), (None, 0))
+        self.assertIsNone(PlanJob.objects.get().plan_id)
+        self.assertKeptUntouched()
+
+    def test_delete_users(self):
+        Token.objects.create(user=self.users[0])
+        self.assertEqual(deletion.delete_users(self.user_ids, chunk_size=4), (2, 6))
+        self.assertFalse(User.objects.filter(pk__in=self.user_ids).exists())
+        self.assertFalse(Token.objects.exists())
+        self.assertKeptUntouched()
+
+    def test_task_lifecycle(self):
+        task = deletion.start_deletion_task(self.user_ids, delete_users=True)
+        self.assertEqual((task.status, task.total_plans), (DeletionTask.STATUS_PENDING, 6))
+
+        self.assertTrue(deletion.run_deletion_task(task.id, chunk_size=4))
+        task.refresh_from_db()
+        self.assertEqual(task.status, DeletionTask.STATUS_DONE)
+        self.assertEqual((task.deleted_plans, task.deleted_users), (6, 2))
+        self.assertIsNotNone(task.heartbeat)
+        self.assertIsNotNone(task.date_finished)
+        # выполненную задачу не забирает ни поток, ни команда
+        self.assertFalse(deletion.run_deletion_task(task.id, resume=True))
+
+    def test_failed_task(self):
+        task = deletion.start_deletion_task(self.user_ids)
+        with mock.patch.object(deletion, 'delete_plans', side_effect=RuntimeError('нет соединения')):
+            with self.assertRaises(RuntimeError):
+                deletion.run_deletion_task(task.id)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.error), (DeletionTask.STATUS_FAILED, 'нет соединения'))
+
+    def test_running_task_is_resumed_only_after_lease_expires(self):
+        task = deletion.start_deletion_task(self.user_ids)
+        DeletionTask.objects.filter(pk=task.id).update(status=DeletionTask.STATUS_RUNNING, heartbeat=timezone.now())
+        # аренду держит поток веб-процесса
+        self.assertFalse(deletion.run_deletion_task(task.id, resume=True))
+        call_command('run_deletion_tasks', stdout=StringIO())
+        self.assertEqual(Plan.objects.filter(user_id__in=self.user_ids).count(), 6)
+
+        expired = timezone.now() - timedelta(seconds=settings.DELETION_TASK_LEASE_SECONDS + 1)
+        DeletionTask.objects.filter(pk=task.id).update(heartbeat=expired, deleted_plans=2)
+        self.assertFalse(deletion.run_deletion_task(task.id))  # без resume running не забирается
+        out = StringIO()
+        call_command('run_deletion_tasks', stdout=out)
+        task.refresh_from_db()
+        self.assertEqual(task.status, DeletionTask.STATUS_DONE)
+        # прогресс продолжает сохранённый, а не начинается заново
+        self.assertEqual(task.deleted_plans, 8)
+        self.assertIn('Обработано задач: 1', out.getvalue())
+        self.assertKeptUntouched()
+
+
+class ImportTests(UsersTestCase):
+    """Массовый импорт: проверка строк, уникальность на пачку, отчёт об ошибках и пул хеширования"""
+
+    def row(self, username, **fields):
+        return {'username': username, 'email': f'{username}@example.com', 'password': f'Strong-pass-{username}',
+                **PROFILE, **fields}
+
+    def test_rows_are_validated_and_errors_reported_by_row(self):
+        rows = [self.row('gym_1'), self.row('gym_2', age=5), self.row('gym_3', password2='other'), self.row('gym_4')]
+        result = imports.import_users(rows, workers=1)
+        self.assertEqual(result['imported'], 2)
+        self.assertEqual([error['row'] for error in result['errors']], [2, 3])
+        self.assertIn('age', result['errors'][0]['errors'])
+        self.assertIn('password2', result['errors'][1]['errors'])
+
+        user = User.objects.get(username='gym_4')
+        self.assertTrue(user.check_password('Strong-pass-gym_4'))
+        self.assertTrue(Token.objects.filter(user=user).exists())
+        self.assertEqual((user.plans_count, user.current_plan.user_id), (1, user.id))
+
+    def test_uniqueness_within_file_and_against_database(self):
+        create_user('existing')
+        rows = [
+            self.row('Existing'),  # логин без учёта регистра
+            self.row('fresh', email='existing@example.com'),
+            self.row('twin'),
+            self.row('TWIN', email='twin2@example.com'),  # повтор внутри файла
+            self.row('twin3', email='twin@example.com'),
+        ]
+        with self.assertNumQueries(2, using=DEFAULT_DB_ALIAS):
+            valid, errors = imports._validate(rows)
+        self.assertEqual([number for number, _, _ in valid], [3])
+        self.assertEqual({number: sorted(row_errors) for number, row_errors in errors.items()},
+                         {1: ['username'], 2: ['email'], 4: ['username'], 5: ['email']})
+
+        result = imports.import_users(rows, workers=1, with_plans=False)
+        self.assertEqual(result['imported'], 1)
+        self.assertEqual([error['row'] for error in result['errors']], [1, 2, 4, 5])
+        self.assertFalse(Plan.objects.exists())
+
+    def test_parse_rows_reports_line_numbers(self):
+        self.assertEqual(imports.parse_rows(b'\xef\xbb\xbfusername,age\ngym,30\n', 'csv'),
+                         [{'username': 'gym', 'age': '30'}])
+        with self.assertRaisesMessage(ValueError, 'строка 3: ожидается объект'):
+            imports.parse_rows('{"username": "a"}\n\n[1]\n', 'ndjson')
+        with self.assertRaisesMessage(ValueError, 'строка 1: некорректный JSON'):
+            imports.parse_rows('{', 'ndjson')
+        with self.assertRaisesMessage(ValueError, 'формат'):
+            imports.parse_rows('', 'xml')
+
+    def test_endpoint_hashes_in_threads(self):
+        admin = create_user('admin', is_staff=True)
+        headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+        body = '\n'.join(json.dumps(self.row(f'gym_{n}')) for n in range(3)) + '\n{"username": "broken"}'
+        with mock.patch.object(imports.os, 'cpu_count', return_value=4), \
+                mock.patch.object(imports, 'ProcessPoolExecutor') as process_pool:
+            response = self.client.post('/api/admin/import/users/', body, content_type='application/x-ndjson',
+                                        **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['imported'], 3)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [4])
+        # fork внутри многопоточного сервера не выполняется
+        process_pool.assert_not_called()
+
+    def test_command_uses_process_pool(self):
+        passwords = ['first', 'second']
+        with mock.patch.object(imports, 'ProcessPoolExecutor') as process_pool:
+            process_pool.return_value.__enter__.return_value.map.side_effect = \
+                lambda function, items, chunksize: map(function, items)
+            hashes = imports._hash_passwords(passwords, 2, processes=True)
+        if 'fork' in multiprocessing.get_all_start_methods():
+            process_pool.assert_called_once()
+        self.assertEqual([check_password(password, hashed) for password, hashed in zip(passwords, hashes)],
+                         [True, True])
+
+
+class MacroColumnsTests(UsersTestCase):
+    """Числовые столбцы БЖУ: заполнение при записи, миграция для старых планов и аналитика"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('macros')
+        admin = create_user('admin', is_staff=True)
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+
+    def test_api_keeps_macros_as_sent(self):
+        macros = {'protein': 120, 'fat': 60, 'carbs': '200 г', 'note': 'ручной план'}
+        response = self.client.post('/api/admin/plans/', {'user': self.user.id, 'calories': 1800, 'macros': macros},
+                                    content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['macros'], macros)
+        plan = Plan.objects.get(pk=response.json()['id'])
+        self.assertEqual(plan.macros, macros)
+        self.assertEqual((plan.proteins, plan.fats, plan.carbs), (120.0, 60.0, None))
+
+    def test_migration_backfills_old_plans(self):
+        generated = services.generate_plan(self.user)
+        manual = Plan.objects.create(user=self.user, macros={'protein': 90, 'fats': True})
+        empty = Plan.objects.create(user=self.user)
+        Plan.objects.update(**dict.fromkeys(Plan.MACRO_FIELDS))
+
+        migration = importlib.import_module(f'{__package__}.migrations.0012_backfill_plan_macro_columns')
+        with mock.patch.object(migration, 'CHUNK_SIZE', 1):
+            migration.fill_macro_columns(apps, mock.Mock(connection=connections[DEFAULT_DB_ALIAS]))
+
+        generated.refresh_from_db()
+        self.assertEqual([getattr(generated, field) for field in Plan.MACRO_FIELDS],
+                         [float(generated.macros[field]) for field in Plan.MACRO_FIELDS])
+        manual.refresh_from_db()
+        self.assertEqual((manual.proteins, manual.fats), (90.0, None))
+        self.assertEqual(manual.macros, {'protein': 90, 'fats': True})
+        empty.refresh_from_db()
+        self.assertIsNone(empty.proteins)
+
+    def test_macro_stats(self):
+        for goal, proteins in (('maintain', 100), ('maintain', 140), ('gain_weight', 180)):
+            Plan.objects.create(user=self.user, goal_snapshot=goal, calories=2000, macros={'proteins': proteins})
+        Plan.objects.create(user=self.user, goal_snapshot='maintain', macros=None)
+
+        (total,) = analytics.macro_stats()
+        self.assertEqual((total['plans'], total['proteins_min'], total['proteins_max']), (3, 100.0, 180.0))
+        by_goal = {row['group']: row for row in analytics.macro_stats(group_by='goal')}
+        self.assertEqual({goal: row['proteins_avg'] for goal, row in by_goal.items()},
+                         {'gain_weight': 180.0, 'maintain': 120.0})
+        self.assertEqual(analytics.macro_stats(goal='gain_weight')[0]['plans'], 1)
+        with self.assertRaisesMessage(ValueError, 'group_by'):
+            analytics.macro_stats(group_by='user')
+
+
+class FakeConnection:
+    """Соединение psycopg2 для пула: статус транзакции и закрытие"""
+
+    def __init__(self, status=psycopg2.extensions.TRANSACTION_STATUS_IDLE, alive=True):
+        self.info = mock.Mock(transaction_status=status)
+        self.closed = 0
+        self.autocommit = True
+        self.rolled_back = False
+        self.alive = alive
+
+    def rollback(self):
+        self.rolled_back = True
+        self.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+    def cursor(self):
+        if not self.alive:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        return mock.MagicMock()
+
+
+class DatabasePoolTests(SimpleTestCase):
+    """Пул соединений dbpool: выдача, возврат, исчерпание и закрытие соединений"""
+
+    def make_pool(self, max_size=2, connect=FakeConnection):
+        self.connect = mock.Mock(side_effect=connect)
+        return dbpool.ConnectionPool(self.connect, max_size, timeout=0.01)
+
+    def test_checkin_reuses_idle_connection(self):
+        pool = self.make_pool()
+        connection = pool.checkout()
+        pool.checkin(connection)
+        self.assertIs(pool.checkout(), connection)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_exhausted_pool_times_out_until_checkin(self):
+        pool = self.make_pool()
+        first, second = pool.checkout(), pool.checkout()
+        with self.assertRaisesMessage(psycopg2.OperationalError, 'Нет свободного соединения'):
+            pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        self.assertIsNot(first, second)
+
+    def test_checkin_rolls_back_open_transaction(self):
+        pool = self.make_pool(max_size=1)
+        connection = pool.checkout()
+        connection.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        pool.checkin(connection)
+        self.assertTrue(connection.rolled_back)
+        self.assertIs(pool.checkout(), connection)
+
+    def test_broken_connections_are_closed_not_reused(self):
+        breaks = {
+            'unknown status': lambda connection: setattr(connection.info, 'transaction_status',
+                                                         psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN),
+            'closed by server': lambda connection: setattr(connection, 'closed', 2),
+            'rollback failed': lambda connection: setattr(connection, 'rollback',
+                                                          mock.Mock(side_effect=psycopg2.InterfaceError)),
+        }
+        for name, break_connection in breaks.items():
+            with self.subTest(name):
+                pool = self.make_pool(max_size=1)
+                connection = pool.checkout()
+                connection.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INERROR
+                break_connection(connection)
+                pool.checkin(connection)
+                self.assertTrue(connection.closed)
+                # слот освобождён, следующее соединение — новое
+                self.assertIsNot(pool.checkout(), connection)
+
+    def test_failed_connect_releases_slot(self):
+        pool = self.make_pool(max_size=1, connect=[psycopg2.OperationalError('нет базы'), FakeConnection()])
+        with self.assertRaises(psycopg2.OperationalError):
+            pool.checkout()
+        self.assertIsInstance(pool.checkout(), FakeConnection)
+
+    def test_wrapper_returns_connection_on_close_and_replaces_dead(self):
+        pool = self.make_pool(max_size=1, connect=[FakeConnection(alive=False), FakeConnection()])
+        wrapper = dbpool.DatabaseWrapper({
+            **connections[DEFAULT_DB_ALIAS].settings_dict, 'ENGINE': 'optimassfit.optimassfit.dbpool',
+            'CONN_HEALTH_CHECKS': True, 'OPTIONS': {},
+        }, alias='pooled')
+        with mock.patch.object(dbpool, 'get_pool', return_value=pool), \
+                mock.patch.object(dbpool.psycopg2.extras, 'register_default_jsonb'):
+            connection = wrapper.get_new_connection({})
+        self.assertTrue(connection.alive)
+        self.assertEqual(self.connect.call_count, 2)
+
+        wrapper.connection = connection
+        wrapper._close()
+        self.assertEqual(pool._idle, [connection])
+
+    def test_statement_timeout_keeps_url_options(self):
+        environ = {'DATABASE_URL': 'postgres://app:secret@db:5432/app?options=-c%20search_path%3Dapp',
+                   'DB_STATEMENT_TIMEOUT': '5000', 'DB_POOL_SIZE': '4'}
+        with mock.patch.dict('os.environ', environ):
+            databases = runpy.run_path(importlib.util.find_spec('optimassfit.optimassfit.settings').origin)['DATABASES']
+        self.assertEqual(databases['default']['OPTIONS']['options'], '-c statement_timeout=5000 -c search_path=app')
+        self.assertEqual(databases['default']['ENGINE'], 'optimassfit.optimassfit.dbpool')
+
+
+class SqliteProfileTests(SimpleTestCase):
+    """Настройка соединений SQLite подключается профилем, а не приложением"""
+    MEMORY_ALIAS = 'memory'
+
+    def test_app_does_not_register_connection_handler(self):
+        self.assertTrue(connection_created.disconnect(dispatch_uid='users.sqlite'))
+        self.addCleanup(connection_created.connect, sqlite.configure_connection, dispatch_uid='users.sqlite')
+        apps.get_app_config('users').ready()
+        self.assertFalse(connection_created.disconnect(dispatch_uid='users.sqlite'))
+
+    def test_prepare_memory_database(self):
+        connections.settings[self.MEMORY_ALIAS] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+            self.MEMORY_ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {'uri': True},
+                                'NAME': 'file:users_tests?mode=memory&cache=shared'},
+        })[self.MEMORY_ALIAS]
+        self.addCleanup(connections.settings.pop, self.MEMORY_ALIAS)
+        self.addCleanup(lambda: sqlite._keepalive.pop(self.MEMORY_ALIAS).close())
+        self.addCleanup(connections.close_all)
+
+        with mock.patch.object(sqlite, 'call_command') as migrate:
+            sqlite.prepare_memory_database(self.MEMORY_ALIAS)
+            sqlite.prepare_memory_database(self.MEMORY_ALIAS)
+        migrate.assert_called_once_with('migrate', database=self.MEMORY_ALIAS, run_syncdb=True, interactive=False,
+                                        verbosity=0)
+        # база переживает закрытие соединений Django
+        with connections[self.MEMORY_ALIAS].cursor() as cursor:
+            cursor.execute('CREATE TABLE kept (id integer)')
+        connections[self.MEMORY_ALIAS].close()
+        with connections[self.MEMORY_ALIAS].cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM kept')
+            self.assertEqual(cursor.fetchone(), (0,))
+
+
+@override_settings(CACHES=check_query_plans.ISOLATED_CACHES)
+class QueryPlanTests(PrimaryReadsMixin, TransactionTestCase):
+    """
+    Регрессия планов запросов в наборе тестов: EXPLAIN горячих запросов и бюджеты
+    на эндпоинт, как в check_query_plans. TransactionTestCase — кэши процесса
+    (словарь упражнений, версии шаблонов) заполняются только по коммиту.
+    """
+
+    def test_hot_queries_use_indexes_and_fit_budgets(self):
+        command = check_query_plans.Command(stdout=StringIO())
+        failures = command.run_checks(users_count=40, plans_per_user=25)
+        self.assertEqual(failures, [], command.stdout.getvalue())
+
+    def test_postgresql_plan_problems(self):
+        command = check_query_plans.Command()
+        seq_scan = 'Seq Scan on users_plan  (cost=0.00..35.50 rows=10 width=8)\n  Filter: (user_id = 1)'
+        sorted_scan = ('Limit  (cost=8.30..8.31 rows=1 width=16)\n'
+                       '  ->  Sort  (cost=8.30..8.31 rows=1 width=16)\n'
+                       '        ->  Bitmap Heap Scan on users_plan  (cost=4.18..8.29 rows=1 width=16)')
+        index_scan = ('Limit  (cost=0.29..2.51 rows=1 width=16)\n'
+                      '  ->  Index Scan using users_plan_user_created_idx on users_plan'
+                      '  (cost=0.29..8.31 rows=1 width=16)')
+        with mock.patch.object(check_query_plans.connection, 'vendor', 'postgresql'):
+            self.assertEqual(command._plan_problems(seq_scan, ordered=False), ['последовательное сканирование'])
+            self.assertEqual(command._plan_problems(sorted_scan, ordered=True), ['сортировка вместо обхода индекса'])
+            self.assertEqual(command._plan_problems(sorted_scan, ordered=False), [])
+            self.assertEqual(command._plan_problems(index_scan, ordered=True), [])
+
+
+@mock.patch.object(archive, 'CHUNK_PLANS', 3)
+class ArchiveTests(UsersTestCase):
+    """Архив планов кусками: перенос, история через горячие планы и архив, план по id"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('archived')
+        self.other = create_user('other')
+        now = timezone.now()
+        for user in (self.user, self.other):
+            for days in range(10, 0, -1):
+                plan = services.generate_plan(user)
+                Plan.objects.filter(pk=plan.pk).update(date_created=now - timedelta(days=days * 30))
+        self.history = list(Plan.objects.filter(user=self.user).order_by('-date_created', '-id')
+                            .values_list('id', flat=True))
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def archive(self, days):
+        return archive.archive_plans(timezone.now() - timedelta(days=days), chunk_size=1)
+
+    def chunk_sizes(self):
+        return list(PlanArchiveChunk.objects.filter(user=self.user).order_by('oldest_created')
+                    .values_list('plans_count', flat=True))
+
+    def fetch_history(self, page_size):
+        ids, cursor = [], None
+        while True:
+            url = f'/api/plans/?page_size={page_size}' + (f'&cursor={cursor}' if cursor else '')
+            data = self.client.get(url, **self.headers).json()
+            ids += [plan['id'] for plan in data['plans']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_round_trip(self):
+        # текущий план (самый новый) остаётся горячим, хотя он старше срока
+        self.assertEqual(self.archive(days=1), (2, 18))
+        self.assertEqual(self.chunk_sizes(), [3, 3, 3])
+        self.assertEqual(list(Plan.objects.filter(user=self.user).values_list('id', flat=True)), self.history[:1])
+        services.refresh_plan_counters(User.objects.filter(pk=self.user.pk))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.plans_count, 10)
+
+        for page_size in (1, 2, 4, 20):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.fetch_history(page_size), self.history)
+
+        plan = archive.archived_plan(self.user.id, self.history[5])
+        self.assertEqual((plan.id, plan.user_id), (self.history[5], self.user.id))
+        self.assertEqual(plan.recommendation_description,
+                         Plan.objects.get(pk=self.history[0]).recommendation_description)
+        self.assertIsNone(archive.archived_plan(self.user.id, self.other.current_plan_id - 1))
+
+    def test_page_reads_only_needed_chunks(self):
+        self.archive(days=1)
+        middle = archive.archived_plans(self.user.id)[3]
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            plans = archive.archived_plans(self.user.id, (middle.date_created, middle.id), limit=2,
+                                           with_versions=False)
+        self.assertEqual([plan.id for plan in plans], self.history[5:7])
+        self.assertEqual(len(queries), 1)
+        # выбираются только куски раньше курсора, не больше limit // CHUNK_PLANS + 2
+        self.assertIn('LIMIT 2', queries[0]['sql'])
+
+    def test_later_runs_fill_newest_chunk(self):
+        self.archive(days=200)
+        self.assertEqual(self.chunk_sizes(), [3, 1])
+        self.archive(days=1)
+        self.assertEqual(self.chunk_sizes(), [3, 3, 3])
+        self.assertEqual(self.fetch_history(4), self.history)
+
+    def test_older_snapshot_rebuilds_chunks(self):
+        self.archive(days=1)
+        late = services.generate_plan(self.user)
+        Plan.objects.filter(pk=late.pk).update(date_created=timezone.now() - timedelta(days=1000))
+        services.generate_plan(self.user)
+        self.archive(days=1)
+        self.assertEqual(self.chunk_sizes(), [3, 3, 3, 2])
+        history = self.fetch_history(3)
+        self.assertEqual(history[-1], late.id)
+        self.assertEqual(history[1:-1], self.history)
+
+
+class NormsBatchTests(SimpleTestCase):
+    """Пакетный расчёт КБЖУ поэлементно совпадает со скалярными функциями"""
+
+    def assertMatchesScalar(self, profiles):
+        batch = utils.calculate_norms_for_profiles(profiles)
+        for i, profile in enumerate(profiles):
+            expected = {
+                'calories': utils.calculate_calories(profile, profile.training_level),
+                **utils.calculate_macros(profile.weight, get_age_category(profile.age), profile.goal, profile.gender),
+            }
+            # сравнение строгое: округление пакета повторяет встроенный round()
+            self.assertEqual({key: float(batch[key][i]) for key in expected}, expected, profile)
+
+    def test_all_coefficient_rows(self):
+        self.assertMatchesScalar([
+            SimpleNamespace(weight=70.5, height=172.5, age=age, gender=gender, goal=goal, training_level=level)
+            for age, gender, goal, level in itertools.product(
+                (10, 18, 19, 30, 31, 59, 60, 100),
+                ('male', 'female', 'other'),
+                utils.GOALS + ('maintain', 'unknown'),
+                utils.TRAINING_LEVELS + ('7',),
+            )
+        ])
+
+    def test_random_profiles_and_rounding_ties(self):
+        rng = np.random.default_rng(20261018)
+        size = 2000
+        weights = np.round(rng.uniform(30, 200, size), 3).tolist()
+        # значения, у которых weight * ratio попадает на «половину» сотой
+        weights[:4] = [1.005, 40.125, 0.285, 2.675]
+        self.assertMatchesScalar([
+            SimpleNamespace(weight=weights[i], height=float(np.round(rng.uniform(100, 250), 2)),
+                            age=int(rng.integers(10, 101)), gender=('male', 'female')[i % 2],
+                            goal=(utils.GOALS + ('maintain',))[i % 4], training_level=utils.TRAINING_LEVELS[i % 4])
+            for i in range(size)
+        ])
+
+    def test_empty_batch(self):
+        norms = utils.calculate_norms_batch([], [], [], [], [], [])
+        self.assertEqual({key: len(values) for key, values in norms.items()}, dict.fromkeys(norms, 0))
+
+
+class CoefficientTableTests(SimpleTestCase):
+    """Таблица COEFFICIENTS повторяет коэффициенты прежних ветвлений calculate_calories/calculate_macros"""
+
+    def profile(self, age, gender='male', goal='gain_weight'):
+        return SimpleNamespace(weight=80, height=180, age=age, gender=gender, goal=goal)
+
+    def test_calorie_factors(self):
+        cases = [
+            # (профиль, уровень тренировок, коэффициент цели, коэффициент тренировок)
+            (self.profile(16), '1', 1.35, 1.15),
+            (self.profile(25, goal='maintain_weight'), '2-3', 1.125, 1.35),
+            (self.profile(45, goal='lose_weight'), '4-5', 0.9, 1.5),
+            (self.profile(70, goal='maintain_weight'), '6+', 1, 1.6),
+            (self.profile(30, gender='female'), '4-5', 1.2, 1.5),
+            (self.profile(65, gender='female', goal='lose_weight'), '1', 0.8, 1.15),
+            # прочие цели и уровни — DEFAULT_FACTOR, прочий пол — женские коэффициенты
+            (self.profile(40, goal='maintain'), '2-3', 1.2, 1.35),
+            (self.profile(40), 'каждый день', 1.25, 1.2),
+            (self.profile(19, gender='other', goal='lose_weight'), '1', 0.95, 1.15),
+        ]
+        for profile, level, goal_factor, training_factor in cases:
+            with self.subTest(age=profile.age, gender=profile.gender, goal=profile.goal, level=level):
+                offset = 5 if profile.gender == 'male' else -165
+                bmr = 10 * profile.weight + 6.25 * profile.height - 5 * profile.age + offset
+                self.assertEqual(utils.calculate_calories(profile, level),
+                                 round(bmr * goal_factor * training_factor, 2))
+
+    def test_macro_ratios(self):
+        cases = [
+            ('male', 'Подростки (10-18 лет)', 'gain_weight', (2.5, 1.5, 3.5)),
+            ('male', 'Молодые (19-30 лет)', 'maintain_weight', (2.25, 1.2, 2.9)),
+            ('male', 'Взрослые (31-59 лет)', 'maintain', (1.65, 0.85, 1.6)),
+            ('male', 'Пожилые (60+ лет)', 'gain_weight', (1.6, 1.1, 2.05)),
+            ('female', 'Молодые (19-30 лет)', 'lose_weight', (1.1, 0.9, 1.2)),
+            ('female', 'Взрослые (31-59 лет)', 'maintain_weight', (1.1, 1.0, 1.15)),
+            ('female', 'Пожилые (60+ лет)', 'maintain_weight', (1.05, 0.85, 1.1)),
+            # неизвестная подпись группы — коэффициенты старшей группы
+            ('male', 'Дети', 'lose_weight', (1.05, 0.8, 1.4)),
+        ]
+        for gender, age_category, goal, ratios in cases:
+            with self.subTest(gender=gender, age_category=age_category, goal=goal):
+                macros = utils.calculate_macros(80, age_category, goal, gender)
+                self.assertEqual((macros['protein_ratio'], macros['fat_ratio'], macros['carb_ratio']), ratios)
+                self.assertEqual((macros['proteins'], macros['fats'], macros['carbs']),
+                                 tuple(round(80 * ratio, 2) for ratio in ratios))
+
+    def test_table_is_read_only(self):
+        with self.assertRaises(ValueError):
+            utils.COEFFICIENTS[0, 0, 0, 0, utils.GOAL_FACTOR] = 2
+
+
+class TemplateRegistryTests(UsersTestCase):
+    """Реестр шаблонов: один запрос на загрузку, негативное кэширование и сброс после коммита"""
+    KEY = ('male', '19-30', 'gain_weight')
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_templates([{'gender': 'male', 'age_category': '19-30', 'goal': 'gain_weight',
+                               'description': 'Силовые', 'workouts': ['Жим лёжа', 'Присед']}])
+        self.template = RecommendationTemplate.objects.get()
+
+    def test_warm_registry_does_not_query(self):
+        with self.assertNumQueries(1):  # названия упражнений уже в словаре процесса
+            recommendation = template_registry.resolve(*self.KEY)
+        self.assertEqual((recommendation.description, recommendation.workouts), ('Силовые', ('Жим лёжа', 'Присед')))
+        with self.assertNumQueries(0):
+            self.assertEqual(template_registry.resolve(*self.KEY), recommendation)
+            self.assertIsNone(template_registry.resolve('female', '60+', 'maintain'))
+            self.assertIsNone(template_registry.resolve('female', '60+', 'maintain'))
+        # подпись возрастной группы переводится в код реестра
+        self.assertEqual(utils.get_training_recommendations('male', 'Молодые (19-30 лет)', 'gain_weight'),
+                         {'description': 'Силовые', 'workouts': ['Жим лёжа', 'Присед']})
+
+    def test_writes_invalidate_after_commit(self):
+        template_registry.resolve(*self.KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.template.description = 'Силовые 2'
+            self.template.save()
+            # до коммита реестр отдаёт прежнее
+            self.assertEqual(template_registry.resolve(*self.KEY).description, 'Силовые')
+        self.assertEqual(template_registry.resolve(*self.KEY).description, 'Силовые 2')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            WorkoutTemplate.objects.filter(recommendation=self.template).first().delete()
+        self.assertEqual(template_registry.resolve(*self.KEY).workouts, ('Присед',))
+
+        # новый шаблон виден после коммита, хотя промах был закэширован
+        key = ('female', '60+', 'maintain')
+        self.assertIsNone(template_registry.resolve(*key))
+        with self.captureOnCommitCallbacks(execute=True):
+            RecommendationTemplate.objects.create(gender=key[0], age_category=key[1], goal=key[2], description='Ходьба')
+        self.assertEqual(template_registry.resolve(*key).description, 'Ходьба')
+
+    def test_invalidation_during_load_is_not_lost(self):
+        names = exercise_dictionary.names
+
+        def names_then_invalidate(ids):
+            # шаблон изменился, пока реестр загружался
+            template_registry.invalidate()
+            return names(ids)
+
+        with mock.patch.object(exercise_dictionary, 'names', side_effect=names_then_invalidate):
+            self.assertEqual(template_registry.resolve(*self.KEY).description, 'Силовые')
+        with self.assertNumQueries(1):
+            template_registry.resolve(*self.KEY)
+
+
+class PlanJobWorkerTests(UsersTestCase):
+    """Очередь PlanJob: асинхронное обновление профиля, пачки воркера и статус задания"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('plan_job_user')
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def test_async_update_queues_job_until_worker_runs(self):
+        response = self.client.post('/api/profile/update/?mode=async', {**PROFILE, 'weight': 80},
+                                    content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 202)
+        job = PlanJob.objects.get(pk=response.json()['job_id'])
+        self.assertEqual(response.json()['status_url'], f'/api/profile/jobs/{job.id}/')
+        self.assertEqual(job.status, PlanJob.STATUS_PENDING)
+        self.assertFalse(Plan.objects.filter(user=self.user).exists())
+
+        self.assertEqual(services.process_plan_jobs(), 1)
+        job.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(job.status, PlanJob.STATUS_DONE)
+        self.assertIsNotNone(job.date_finished)
+        self.assertEqual((job.plan_id, job.plan.weight_snapshot), (self.user.current_plan_id, 80))
+        self.assertEqual(self.user.plans_count, 1)
+
+        status = self.client.get(f'/api/profile/jobs/{job.id}/', **self.headers).json()
+        self.assertEqual((status['status'], status['plan']), (PlanJob.STATUS_DONE, job.plan_id))
+        # чужое задание не видно
+        other = create_user('plan_job_other')
+        other_headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=other).key}'}
+        self.assertEqual(self.client.get(f'/api/profile/jobs/{job.id}/', **other_headers).status_code, 404)
+
+    def test_batch_size_and_one_plan_per_user(self):
+        second = create_user('plan_job_second')
+        jobs = [services.enqueue_plan(user) for user in (self.user, self.user, second)]
+        self.assertEqual(services.process_plan_jobs(batch_size=2), 2)
+        statuses = [job.status for job in PlanJob.objects.order_by('id')]
+        self.assertEqual(statuses, [PlanJob.STATUS_DONE, PlanJob.STATUS_DONE, PlanJob.STATUS_PENDING])
+        # два задания одного пользователя в пачке дают один план
+        self.assertEqual(Plan.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(PlanJob.objects.get(pk=jobs[0].pk).plan_id, PlanJob.objects.get(pk=jobs[1].pk).plan_id)
+
+        self.assertEqual(services.process_plan_jobs(batch_size=2), 1)
+        self.assertEqual(services.process_plan_jobs(batch_size=2), 0)
+        self.assertEqual(Plan.objects.filter(user=second).count(), 1)
+
+    def test_incomplete_profile_fails_job_not_batch(self):
+        incomplete = User.objects.create_user('plan_job_incomplete', 'Incomplete-password', email='inc@example.com')
+        failed, done = services.enqueue_plan(incomplete), services.enqueue_plan(self.user)
+        self.assertEqual(services.process_plan_jobs(), 2)
+        failed.refresh_from_db()
+        done.refresh_from_db()
+        self.assertEqual(failed.status, PlanJob.STATUS_FAILED)
+        self.assertTrue(failed.error.startswith('Неполный профиль'))
+        self.assertIsNone(failed.plan_id)
+        self.assertEqual(done.status, PlanJob.STATUS_DONE)
+
+    def test_worker_command_once(self):
+        for _ in range(3):
+            services.enqueue_plan(self.user)
+        out = StringIO()
+        call_command('run_plan_worker', '--once', '--batch-size=2', stdout=out)
+        self.assertIn('Обработано заданий: 2 (всего 2)', out.getvalue())
+        self.assertIn('Обработано заданий: 1 (всего 3)', out.getvalue())
+        self.assertIn('обработано заданий: 3', out.getvalue())
+        self.assertFalse(PlanJob.objects.filter(status=PlanJob.STATUS_PENDING).exists())
+
+
+class RecomputePlansTests(UsersTestCase):
+    """recompute_plans: фильтры, пачки и продолжение с контрольной точки"""
+
+    def setUp(self):
+        super().setUp()
+        self.users = [create_user(f'recompute_{n}', goal=goal, age=age)
+                      for n, (goal, age) in enumerate([('maintain', 25), ('gain_weight', 25), ('maintain', 65),
+                                                       ('maintain', 40), ('lose_weight', 25)])]
+        self.checkpoint = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'checkpoint.json')
+
+    def recompute(self, *args):
+        out = StringIO()
+        call_command('recompute_plans', '--workers=1', '--chunk-size=2', f'--checkpoint={self.checkpoint}', *args,
+                     stdout=out)
+        return out.getvalue()
+
+    def plans_by_user(self):
+        return dict(Counter(Plan.objects.values_list('user_id', flat=True)))
+
+    def test_filters_and_norms(self):
+        self.recompute('--goal=maintain', '--age-category=19-30')
+        self.assertEqual(self.plans_by_user(), {self.users[0].id: 1})
+        plan = Plan.objects.get()
+        expected = services.build_plan(self.users[0])
+        self.assertEqual((plan.calories, plan.macros), (expected.calories, expected.macros))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_dry_run_writes_nothing(self):
+        output = self.recompute('--dry-run')
+        self.assertIn('Посчитано (dry-run): 5 польз.', output)
+        self.assertFalse(Plan.objects.exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resume_from_checkpoint(self):
+        save_plans = services.save_plans
+        calls = []
+
+        def fail_on_second_chunk(plans):
+            calls.append(len(plans))
+            if len(calls) == 2:
+                raise RuntimeError('обрыв')
+            return save_plans(plans)
+
+        with mock.patch.object(recompute_plans, 'save_plans', side_effect=fail_on_second_chunk), \
+                self.assertRaises(RuntimeError):
+            self.recompute()
+        with open(self.checkpoint, encoding='utf-8') as fh:
+            self.assertEqual(json.load(fh), {'filters': {}, 'last_id': self.users[1].id, 'processed': 2})
+
+        # с другими фильтрами контрольную точку не подхватить
+        with self.assertRaisesMessage(CommandError, 'записана для других фильтров'):
+            self.recompute('--goal=maintain')
+
+        output = self.recompute()
+        self.assertIn(f'Продолжаем с id > {self.users[1].id} (уже пересчитано: 2)', output)
+        self.assertEqual(self.plans_by_user(), {user.id: 1 for user in self.users})
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_restart_ignores_checkpoint(self):
+        with open(self.checkpoint, 'w', encoding='utf-8') as fh:
+            json.dump({'filters': {'goal': 'gain_weight'}, 'last_id': self.users[-1].id, 'processed': 5}, fh)
+        self.recompute('--restart')
+        self.assertEqual(self.plans_by_user(), {user.id: 1 for user in self.users})
+
+
+class PlanHistoryPaginationTests(UsersTestCase):
+    """GET /api/plans/: keyset-курсор, одинаковые даты, размер страницы и некорректные параметры"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('history_user')
+        services.save_plans([services.build_plan(self.user) for _ in range(pagination.MAX_PAGE_SIZE + 5)])
+        # половина планов с одной датой: порядок на стыке страниц держится по id
+        now = timezone.now()
+        Plan.objects.filter(user=self.user, id__lte=Plan.objects.order_by('id')[50].id).update(date_created=now)
+        services.generate_plan(create_user('history_other'))
+        self.expected = list(Plan.objects.filter(user=self.user).order_by('-date_created', '-id')
+                             .values_list('id', flat=True))
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def plans(self, **params):
+        return self.client.get('/api/plans/', params, **self.headers)
+
+    def test_pages_cover_history_once(self):
+        ids, cursor = [], None
+        while True:
+            data = self.plans(page_size=7, view='compact', **({'cursor': cursor} if cursor else {})).json()
+            self.assertLessEqual(len(data['plans']), 7)
+            self.assertEqual(set(data['plans'][0]), {'id', 'date_created', 'goal_snapshot', 'weight_snapshot',
+                                                     'calories'})
+            ids += [plan['id'] for plan in data['plans']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(ids, self.expected)
+
+    def test_page_size(self):
+        self.assertEqual(len(self.plans().json()['plans']), pagination.DEFAULT_PAGE_SIZE)
+        data = self.plans(page_size=1000).json()
+        self.assertEqual(len(data['plans']), pagination.MAX_PAGE_SIZE)
+        self.assertEqual([plan['id'] for plan in data['plans']], self.expected[:pagination.MAX_PAGE_SIZE])
+        self.assertEqual([plan['id'] for plan in self.plans(cursor=data['next_cursor']).json()['plans']],
+                         self.expected[pagination.MAX_PAGE_SIZE:])
+
+    def test_invalid_parameters(self):
+        bad_cursors = ['not-base64!', base64.urlsafe_b64encode(b'no separator').decode(),
+                       base64.urlsafe_b64encode(b'yesterday|1').decode(),
+                       base64.urlsafe_b64encode(b'2024-01-01T00:00:00+00:00|x').decode(),
+                       base64.urlsafe_b64encode(b'\xff\xfe').decode()]
+        for cursor in bad_cursors:
+            with self.subTest(cursor=cursor):
+                response = self.plans(cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.json())
+        for page_size in ('0', '-5', 'ten'):
+            with self.subTest(page_size=page_size):
+                response = self.plans(page_size=page_size)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('page_size', response.json())
+
+
+class ExportTests(UsersTestCase):
+    """Потоковая выгрузка пользователей и планов: форматы, фильтры и ошибки параметров"""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_templates([{'gender': 'male', 'age_category': '19-30', 'goal': 'gain_weight',
+                               'description': 'Силовые, "база"', 'workouts': ['Присед']}])
+        self.gain = create_user('export_gain', goal='gain_weight', age=25)
+        self.keep = create_user('export_keep')
+        User.objects.filter(pk=self.keep.pk).update(date_joined=timezone.make_aware(timezone.datetime(2024, 3, 1)))
+        for user, day in ((self.gain, 10), (self.keep, 11)):
+            plan = services.generate_plan(user)
+            Plan.objects.filter(pk=plan.pk).update(
+                date_created=timezone.make_aware(timezone.datetime(2024, 5, day, 23, 30)))
+        admin = User.objects.create_superuser('export_admin', 'Admin-password', email='export_admin@example.com')
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+
+    def export(self, source, **params):
+        return self.client.get(f'/api/admin/export/{source}/', params, **self.headers)
+
+    @staticmethod
+    def body(response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_users_ndjson(self):
+        response = self.export('users', goal='gain_weight')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="users.ndjson"')
+        rows = [json.loads(line) for line in self.body(response).splitlines()]
+        self.assertEqual([row['username'] for row in rows], ['export_gain'])
+        self.assertEqual(list(rows[0]), list(exports.USER_FIELDS))
+        self.assertEqual(rows[0]['plans_count'], 1)
+
+        rows = self.body(self.export('users', date_from='2024-02-01', date_to='2024-03-01')).splitlines()
+        self.assertEqual([json.loads(line)['username'] for line in rows], ['export_keep'])
+
+    def test_plans_csv(self):
+        response = self.export('plans', fmt='csv', date_to='2024-05-10')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        reader = csv.DictReader(StringIO(self.body(response)))
+        rows = list(reader)
+        self.assertEqual(reader.fieldnames, list(exports.PLAN_FIELDS))
+        # конец периода, заданный датой, включает весь день
+        self.assertEqual([row['user__username'] for row in rows], ['export_gain'])
+        self.assertEqual(rows[0]['training_recommendations'], 'Силовые, "база"')
+        self.assertEqual(json.loads(rows[0]['macros']), Plan.objects.get(user=self.gain).macros)
+
+        # конец, заданный моментом, включается как есть
+        rows = self.body(self.export('plans', date_to='2024-05-10T23:30:00')).splitlines()
+        self.assertEqual([json.loads(line)['user_id'] for line in rows], [self.gain.id])
+        rows = self.body(self.export('plans', date_from='2024-05-11T00:00:00', goal='maintain')).splitlines()
+        self.assertEqual([json.loads(line)['user_id'] for line in rows], [self.keep.id])
+
+    def test_invalid_parameters(self):
+        for params in ({'fmt': 'xml'}, {'date_from': 'вчера'}, {'date_to': '2024-13-01'}):
+            with self.subTest(params=params):
+                response = self.export('plans', **params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        user_headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.keep).key}'}
+        self.assertEqual(self.client.get('/api/admin/export/users/', **user_headers).status_code, 403)
+
+    def test_command(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'users.csv')
+        call_command('export_data', 'users', '--format=csv', f'--output={path}', '--chunk-size=1')
+        with open(path, encoding='utf-8', newline='') as fh:
+            rows = list(csv.DictReader(fh))
+        self.assertEqual([row['username'] for row in rows], ['export_gain', 'export_keep', 'export_admin'])
+        with self.assertRaisesMessage(CommandError, 'Некорректная дата'):
+            call_command('export_data', 'plans', '--date-from=вчера', stdout=StringIO())
+
+
+class TokenCacheTests(UsersTestCase):
+    """Кэш токенов: LRU и TTL, сверка с версией пользователя и отзыв токена"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('token_user')
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+
+    def plans(self):
+        return self.client.get('/api/plans/', **self.headers)
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.plans().status_code, 200)
+        return [query for query in queries if Token._meta.db_table in query['sql']]
+
+    def test_lru_and_ttl(self):
+        tokens = TokenCache(max_size=2, timeout=5)
+        with mock.patch('time.monotonic', return_value=100):
+            tokens.set('a', 1, 'v', [])
+            tokens.set('b', 2, 'v', [])
+            tokens.get('a')
+            tokens.set('c', 3, 'v', [])
+            # вытесняется давно не читанный ключ
+            self.assertIsNone(tokens.get('b'))
+            self.assertEqual([tokens.get(key)[0] for key in 'ac'], [1, 3])
+        with mock.patch('time.monotonic', return_value=105.5):
+            self.assertIsNone(tokens.get('a'))
+        self.assertEqual(len(tokens), 1)
+
+    def test_warm_token_skips_database(self):
+        self.assertTrue(self.token_queries())
+        self.assertFalse(self.token_queries())
+        # профиль изменился — снимок перечитывается
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(pk=self.user.pk).save()
+        self.assertTrue(self.token_queries())
+        self.assertFalse(self.token_queries())
+
+    def test_deleted_token_is_rejected(self):
+        self.plans()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertEqual(self.plans().status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.plans()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.plans().status_code, 401)
+
+    def test_logout_forgets_token(self):
+        self.plans()
+        self.assertEqual(self.client.post('/api/logout/', **self.headers).status_code, 200)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_write_without_signals_waits_for_ttl(self):
+        self.plans()
+        # UPDATE в обход save() не меняет версию: снимок живёт до конца TTL
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.plans().status_code, 200)
+        with mock.patch('time.monotonic', return_value=time.monotonic() + token_cache.timeout + 1):
+            self.assertEqual(self.plans().status_code, 401)
+
+
+class TemplateUpsertTests(UsersTestCase):
+    """upsert_templates и bulk-upsert: пишется только разница упражнений, число запросов постоянно"""
+
+    @staticmethod
+    def item(goal='gain_weight', description='Силовые', workouts=('Жим лёжа', 'Присед'), age_category='19-30'):
+        return {'gender': 'male', 'age_category': age_category, 'goal': goal, 'description': description,
+                'workouts': list(workouts)}
+
+    def workout_rows(self, goal='gain_weight'):
+        return list(WorkoutTemplate.objects.filter(recommendation__goal=goal).order_by('id')
+                    .values_list('id', 'exercise__name'))
+
+    def test_diff_workouts(self):
+        existing = [(1, 10), (2, 20), (3, 10), (4, 30)]
+        to_delete, to_create, kept = diff_workouts(7, existing, [10, 30, 40, 40])
+        self.assertEqual((to_delete, kept), ([2, 3], 2))
+        self.assertEqual([(w.recommendation_id, w.exercise_id) for w in to_create], [(7, 40), (7, 40)])
+
+    def test_statuses_and_workout_diff(self):
+        result = upsert_templates([self.item(), self.item(goal='maintain', workouts=['Бег'])])
+        self.assertEqual({key: result[key] for key in ('created', 'updated', 'unchanged', 'workouts_added')},
+                         {'created': 2, 'updated': 0, 'unchanged': 0, 'workouts_added': 3})
+        before = self.workout_rows()
+
+        result = upsert_templates([
+            self.item(workouts=['Присед', 'Тяга']),
+            self.item(goal='maintain', workouts=['Бег']),
+            self.item(goal='lose_weight', description='Кардио', workouts=[]),
+        ])
+        self.assertEqual([(t['goal'], t['status'], t['workouts_added'], t['workouts_removed'], t['workouts_kept'])
+                          for t in result['templates']],
+                         [('gain_weight', 'updated', 1, 1, 1), ('maintain', 'unchanged', 0, 0, 1),
+                          ('lose_weight', 'created', 0, 0, 0)])
+        # совпавшее упражнение осталось той же строкой
+        self.assertEqual(self.workout_rows(), [before[1], (self.workout_rows()[1][0], 'Тяга')])
+
+        result = upsert_templates([self.item(description='Силовые 2', workouts=['Присед', 'Тяга'])])
+        self.assertEqual((result['updated'], result['workouts_added'], result['workouts_removed']), (1, 0, 0))
+        self.assertEqual(RecommendationTemplate.objects.get(goal='gain_weight').description, 'Силовые 2')
+        self.assertEqual(upsert_templates([])['templates'], [])
+
+    def test_constant_queries(self):
+        def catalog(age_categories, goal, count):
+            # у каждого шаблона новое описание, а последнее упражнение убирается
+            return [self.item(age_category=age_category, goal=goal, description=f'Описание {count}',
+                              workouts=[f'Упражнение {n}' for n in range(count)])
+                    for age_category in age_categories]
+
+        counts = []
+        for age_categories, count in ((['10-18'], 1), (['19-30', '31-59', '60+'], 6)):
+            upsert_templates(catalog(age_categories, 'maintain', count + 1))
+            with CaptureQueriesContext(connection) as queries:
+                result = upsert_templates(catalog(age_categories, 'maintain', count)
+                                          + catalog(age_categories, 'lose_weight', count))
+            self.assertEqual((result['created'], result['updated'], result['workouts_removed']),
+                             (len(age_categories), len(age_categories), len(age_categories)))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bulk_upsert_endpoint(self):
+        admin = User.objects.create_superuser('templates_admin', 'Admin-password', email='templates_admin@example.com')
+        headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+        url = '/api/admin/templates/bulk-upsert/'
+        payload = {'templates': [{**self.item(), 'workouts': [{'name': 'Присед'}]}]}
+        response = self.client.post(url, payload, content_type='application/json', **headers)
+        self.assertEqual((response.status_code, response.json()['created']), (200, 1))
+        self.assertEqual(self.workout_rows()[0][1], 'Присед')
+
+        payload['templates'][0]['goal'] = 'fly'
+        self.assertEqual(self.client.post(url, payload, content_type='application/json', **headers).status_code, 400)
+
+
+class TemplateVersionTests(UsersTestCase):
+    """Версии шаблонов: общая версия по хешу содержимого, неизменяемость и материализация упражнений"""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_templates([{'gender': 'male', 'age_category': '19-30', 'goal': 'gain_weight',
+                               'description': 'Силовые', 'workouts': ['Жим лёжа', 'Присед']}])
+        self.users = [create_user(f'version_user_{n}', goal='gain_weight', age=25) for n in range(2)]
+
+    def test_plans_share_version(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            plans = [services.generate_plan(user) for user in self.users]
+        self.assertEqual(TemplateVersion.objects.count(), 1)
+        self.assertEqual(len({plan.template_version_id for plan in plans}), 1)
+        self.assertFalse(Workout.objects.exists())
+        self.assertEqual(services.plan_workout_names(plans[0]), ['Жим лёжа', 'Присед'])
+        # версия уже в кэше процесса
+        with self.assertNumQueries(0):
+            self.assertEqual(services.template_version_id('Силовые', ['Жим лёжа', 'Присед']),
+                             plans[0].template_version_id)
+
+        # шаблон изменился: новые планы получают новую версию, старые сохраняют прежнее содержимое
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_templates([{'gender': 'male', 'age_category': '19-30', 'goal': 'gain_weight',
+                               'description': 'Силовые 2', 'workouts': ['Жим лёжа', 'Присед', 'Тяга']}])
+        newer = services.generate_plan(self.users[0])
+        self.assertNotEqual(newer.template_version_id, plans[0].template_version_id)
+        plans[0].refresh_from_db()
+        self.assertEqual((plans[0].recommendation_description, services.plan_workout_names(plans[0])),
+                         ('Силовые', ['Жим лёжа', 'Присед']))
+
+    def test_rolled_back_version_is_not_cached(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            services.template_version_id('Откат', ['Планка'])
+            raise RuntimeError
+        self.assertEqual(services._version_ids, {})
+        self.assertFalse(TemplateVersion.objects.filter(description='Откат').exists())
+
+    def test_version_is_immutable(self):
+        version = TemplateVersion.objects.get(pk=services.template_version_id('Силовые', ['Присед']))
+        version.description = 'Другое'
+        with self.assertRaisesMessage(ValueError, 'неизменяема'):
+            version.save()
+        self.assertNotEqual(TemplateVersion.hash_content('a', ['b', 'c']),
+                            TemplateVersion.hash_content('a', ['c', 'b']))
+
+    def test_workouts_materialized_only_on_change(self):
+        plan = services.generate_plan(self.users[0])
+        admin = User.objects.create_superuser('version_admin', 'Admin-password', email='version_admin@example.com')
+        headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+        url = f'/api/admin/plans/{plan.id}/workouts/'
+
+        response = self.client.get(url, **headers)
+        self.assertEqual([(row['id'], row['name']) for row in response.json()], [(None, 'Жим лёжа'), (None, 'Присед')])
+        plan.refresh_from_db()
+        self.assertFalse(plan.workouts_customized)
+        self.assertFalse(Workout.objects.exists())
+
+        self.assertEqual(self.client.post(url, {'name': 'Планка'}, content_type='application/json',
+                                          **headers).status_code, 201)
+        plan.refresh_from_db()
+        self.assertTrue(plan.workouts_customized)
+        self.assertEqual(services.plan_workout_names(plan), ['Жим лёжа', 'Присед', 'Планка'])
+        # версия шаблона не изменилась
+        self.assertEqual(plan.template_version.workouts, ['Жим лёжа', 'Присед'])
+
+
+class AsyncViewsTests(UsersTestCase):
+    """Корутины /api/async/: ответы совпадают с синхронными эндпоинтами"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('async_views')
+        now = timezone.now()
+        for days in range(6, 0, -1):
+            plan = services.generate_plan(self.user)
+            Plan.objects.filter(pk=plan.pk).update(date_created=now - timedelta(days=days * 30))
+        archive.archive_plans(now - timedelta(days=100))
+        self.key = Token.objects.create(user=self.user).key
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {self.key}'}
+
+    async def get(self, path, data=None, **headers):
+        # AsyncClient в Django 4.2 принимает заголовки только через headers=
+        return await self.async_client.get(path, data, headers={'Authorization': f'Token {self.key}', **headers})
+
+    async def test_same_responses_as_sync(self):
+        paths = ['', 'dashboard/', 'plans/', 'plans/?view=compact&page_size=2']
+        for path in paths:
+            with self.subTest(path=path):
+                sync_response = await sync_to_async(self.client.get)(f'/api/{path}', **self.headers)
+                # дашборд собирается заново асинхронным ORM, а не берётся из кэша синхронного ответа
+                await cache.aclear()
+                response = await self.get(f'/api/async/{path}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), sync_response.json())
+                if path == 'dashboard/':
+                    self.assertEqual(response['ETag'], sync_response['ETag'])
+
+    async def test_plans_continue_into_archive(self):
+        self.assertTrue(await PlanArchiveChunk.objects.filter(user=self.user).aexists())
+        ids, cursor = [], None
+        while True:
+            params = {'page_size': 4, **({'cursor': cursor} if cursor else {})}
+            data = (await self.get('/api/async/plans/', params)).json()
+            ids += [plan['id'] for plan in data['plans']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        sync_ids = [plan['id'] for plan in (await sync_to_async(self.client.get)(
+            '/api/plans/', {'page_size': 100}, **self.headers)).json()['plans']]
+        self.assertEqual(ids, sync_ids)
+        self.assertEqual(len(ids), 6)
+
+    async def test_dashboard_not_modified(self):
+        etag = (await self.get('/api/async/dashboard/'))['ETag']
+        response = await self.get('/api/async/dashboard/', **{'If-None-Match': etag})
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    async def test_errors(self):
+        response = await self.async_client.get('/api/async/dashboard/')
+        self.assertEqual((response.status_code, response['WWW-Authenticate']), (401, 'Token'))
+        response = await self.get('/api/async/plans/', Authorization='Token missing')
+        self.assertEqual(response.status_code, 401)
+        response = await self.get('/api/async/plans/', {'cursor': 'bad'})
+        self.assertEqual((response.status_code, list(response.json())), (400, ['cursor']))
+        response = await self.async_client.post('/api/async/plans/', headers={'Authorization': f'Token {self.key}'})
+        self.assertEqual(response.status_code, 405)
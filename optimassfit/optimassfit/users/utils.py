@@ -1,140 +1,141 @@
+import numpy as np
 from .models import RecommendationTemplate
-from django.core.exceptions import ObjectDoesNotExist
+from .recommendations import template_registry
 
-def calculate_calories(profile, training_level):
-    """Рассчитывает дневную норму калорий с учетом возраста, цели и уровня тренировок"""
-    age_category = get_age_category(profile.age)
+# ───── Таблица коэффициентов ─────
+#
+# Все коэффициенты расчёта КБЖУ собраны в одну таблицу COEFFICIENTS,
+# которая строится один раз при импорте и индексируется малыми целыми кодами:
+#   COEFFICIENTS[пол, возрастная группа, цель, уровень тренировок] → строка COLUMNS.
+# Скалярные функции и пакетный расчёт читают одну и ту же таблицу.
 
-    # Основной обмен веществ (BMR) для мужчин 
-    if profile.gender == 'male':
-        bmr = (10 * profile.weight) + (6.25 * profile.height) - (5 * profile.age) + 5
-    else:  # Для женщин
-        bmr = (10 * profile.weight) + (6.25 * profile.height) - (5 * profile.age) - 165
-
-    # Коэффициенты для разных целей и возрастных групп (для мужчин)
-    male_factors = {
-        "Подростки (10-18 лет)": {"gain_weight": 1.35, "maintain_weight": 1.2, "lose_weight": 1.05},
-        "Молодые (19-30 лет)": {"gain_weight": 1.3, "maintain_weight": 1.125, "lose_weight": 0.975},
-        "Взрослые (31-59 лет)": {"gain_weight": 1.25, "maintain_weight": 1.075, "lose_weight": 0.9},
-        "Пожилые (60+ лет)": {"gain_weight": 1.175, "maintain_weight": 1, "lose_weight": 0.85}
-    }
+GENDERS = ("male", "female")                     # всё, кроме 'male', считается по женским коэффициентам
+AGE_CATEGORIES = (
+    "Подростки (10-18 лет)",
+    "Молодые (19-30 лет)",
+    "Взрослые (31-59 лет)",
+    "Пожилые (60+ лет)",
+)
+# Подпись возрастной группы → код, под которым она хранится в RecommendationTemplate
+AGE_CATEGORY_CODES = dict(zip(AGE_CATEGORIES, (code for code, _ in RecommendationTemplate.AGE_CATEGORY_CHOICES)))
+GOALS = ("gain_weight", "maintain_weight", "lose_weight")   # прочие цели (в т.ч. 'maintain') — код OTHER_GOAL
+TRAINING_LEVELS = ("1", "2-3", "4-5", "6+")                  # прочие значения — код OTHER_TRAINING_LEVEL
+OTHER_GOAL = len(GOALS)
+OTHER_TRAINING_LEVEL = len(TRAINING_LEVELS)
 
-    # Коэффициенты для разных целей и возрастных групп (для женщин)
-    female_factors = {
-        "Подростки (10-18 лет)": {"gain_weight": 1.25, "maintain_weight": 1.1, "lose_weight": 1},
-        "Молодые (19-30 лет)": {"gain_weight": 1.2, "maintain_weight": 1.05, "lose_weight": 0.95},
-        "Взрослые (31-59 лет)": {"gain_weight": 1.125, "maintain_weight": 1, "lose_weight": 0.875},
-        "Пожилые (60+ лет)": {"gain_weight": 1.05, "maintain_weight": 0.95, "lose_weight": 0.8}
-    }
+COLUMNS = ("goal_factor", "training_factor", "protein_ratio", "fat_ratio", "carb_ratio")
+GOAL_FACTOR, TRAINING_FACTOR, PROTEIN_RATIO, FAT_RATIO, CARB_RATIO = range(len(COLUMNS))
 
-    # Коэффициенты уровня активности (тренировки)
-    training_factors = {
-        "1": 1.15,
-        "2-3": 1.35,
-        "4-5": 1.50,
-        "6+": 1.60
-    }
+# Коэффициент по умолчанию для неизвестной цели или уровня тренировок
+DEFAULT_FACTOR = 1.2
 
+# Поправка BMR по полу (Миффлин — Сан-Жеор)
+BMR_OFFSETS = (5, -165)
 
-    if profile.gender == 'male':
-        goal_factor = male_factors[age_category].get(profile.goal, 1.2)
-    else:
-        goal_factor = female_factors[age_category].get(profile.goal, 1.2)
+# Коэффициенты калорийности: пол → возрастная группа → (набор, поддержание, похудение)
+_CALORIE_GOAL_FACTORS = {
+    "male": (
+        (1.35, 1.2, 1.05),
+        (1.3, 1.125, 0.975),
+        (1.25, 1.075, 0.9),
+        (1.175, 1, 0.85),
+    ),
+    "female": (
+        (1.25, 1.1, 1),
+        (1.2, 1.05, 0.95),
+        (1.125, 1, 0.875),
+        (1.05, 0.95, 0.8),
+    ),
+}
 
-    training_factor = training_factors.get(training_level, 1.2)
+# Коэффициенты уровня активности (тренировки)
+_TRAINING_FACTORS = (1.15, 1.35, 1.50, 1.60)
 
-    # Итоговый расчет
-    return round(bmr * goal_factor * training_factor, 2)
+# Коэффициенты БЖУ (г на кг веса): пол → возрастная группа →
+# (белки, жиры, углеводы) для набора, поддержания и всех прочих целей
+_MACRO_RATIOS = {
+    "male": (
+        ((2.5, 1.5, 3.5), (2.25, 1.2, 2.9), (2.0, 1.0, 2.2)),
+        ((2.5, 1.5, 3.5), (2.25, 1.2, 2.9), (2.0, 1.0, 2.2)),
+        ((2.2, 1.25, 2.2), (1.95, 1.0, 2.0), (1.65, 0.85, 1.6)),
+        ((1.6, 1.1, 2.05), (1.35, 1.0, 1.85), (1.05, 0.8, 1.4)),
+    ),
+    "female": (
+        ((1.3, 1.25, 1.8), (1.2, 1.05, 1.4), (1.1, 0.9, 1.2)),
+        ((1.3, 1.25, 1.8), (1.2, 1.05, 1.4), (1.1, 0.9, 1.2)),
+        ((1.25, 1.2, 1.65), (1.1, 1.0, 1.15), (1.05, 0.95, 1.15)),
+        ((1.2, 1.15, 1.6), (1.05, 0.85, 1.1), (1, 0.8, 1.1)),
+    ),
+}
 
 
-def calculate_macros(weight, age_category, goal, gender):
-    """Рассчитывает БЖУ на основе возраста, пола и фитнес-цели"""
+def _build_coefficients():
+    """Собирает таблицу коэффициентов [пол, возраст, цель, уровень, столбец]"""
+    table = np.empty((len(GENDERS), len(AGE_CATEGORIES), len(GOALS) + 1, len(TRAINING_LEVELS) + 1, len(COLUMNS)))
+    for g, gender in enumerate(GENDERS):
+        for a in range(len(AGE_CATEGORIES)):
+            goal_factors = _CALORIE_GOAL_FACTORS[gender][a] + (DEFAULT_FACTOR,)
+            gain, maintain, other = _MACRO_RATIOS[gender][a]
+            for k, ratios in enumerate((gain, maintain, other, other)):
+                for t, training_factor in enumerate(_TRAINING_FACTORS + (DEFAULT_FACTOR,)):
+                    table[g, a, k, t] = (goal_factors[k], training_factor) + ratios
+    table.setflags(write=False)
+    return table
 
-    if gender == 'male':
-        if age_category in ["Подростки (10-18 лет)", "Молодые (19-30 лет)"]:
-            if goal == "gain_weight":
-                protein_ratio = 2.5
-                fat_ratio = 1.5
-                carb_ratio = 3.5
-            elif goal == "maintain_weight":
-                protein_ratio = 2.25
-                fat_ratio = 1.2
-                carb_ratio = 2.9
-            else:
-                protein_ratio = 2.0
-                fat_ratio = 1.0
-                carb_ratio = 2.2
 
-        elif age_category == "Взрослые (31-59 лет)":
-            if goal == "gain_weight":
-                protein_ratio = 2.2
-                fat_ratio = 1.25
-                carb_ratio = 2.2
-            elif goal == "maintain_weight":
-                protein_ratio = 1.95
-                fat_ratio = 1.0
-                carb_ratio = 2.0
-            else:
-                protein_ratio = 1.65
-                fat_ratio = 0.85
-                carb_ratio = 1.6
+COEFFICIENTS = _build_coefficients()
+# Та же таблица в виде вложенных списков Python: для скалярных вызовов
+# индексация списков быстрее и возвращает обычные float
+_COEFFICIENT_ROWS = COEFFICIENTS.tolist()
 
-        else:
-            if goal == "gain_weight":
-                protein_ratio = 1.6
-                fat_ratio = 1.1
-                carb_ratio = 2.05
-            elif goal == "maintain_weight":
-                protein_ratio = 1.35
-                fat_ratio = 1.0
-                carb_ratio = 1.85
-            else:
-                protein_ratio = 1.05
-                fat_ratio = 0.8
-                carb_ratio = 1.4
+_GENDER_CODES = {gender: i for i, gender in enumerate(GENDERS)}
+_AGE_CATEGORY_CODES = {category: i for i, category in enumerate(AGE_CATEGORIES)}
+_GOAL_CODES = {goal: i for i, goal in enumerate(GOALS)}
+_TRAINING_LEVEL_CODES = {level: i for i, level in enumerate(TRAINING_LEVELS)}
 
-    else:
-        if age_category in ["Подростки (10-18 лет)", "Молодые (19-30 лет)"]:
-            if goal == "gain_weight":
-                protein_ratio = 1.3
-                fat_ratio = 1.25
-                carb_ratio = 1.8
-            elif goal == "maintain_weight":
-                protein_ratio = 1.2
-                fat_ratio = 1.05
-                carb_ratio = 1.4
-            else:
-                protein_ratio = 1.1
-                fat_ratio = 0.9
-                carb_ratio = 1.2
 
-        elif age_category == "Взрослые (31-59 лет)":
-            if goal == "gain_weight":
-                protein_ratio = 1.25
-                fat_ratio = 1.2
-                carb_ratio = 1.65
-            elif goal == "maintain_weight":
-                protein_ratio = 1.1
-                fat_ratio = 1.0
-                carb_ratio = 1.15
-            else:
-                protein_ratio = 1.05
-                fat_ratio = 0.95
-                carb_ratio = 1.15
+def gender_code(gender):
+    return 0 if gender == "male" else 1
 
-        else:
-            if goal == "gain_weight":
-                protein_ratio = 1.2
-                fat_ratio = 1.15
-                carb_ratio = 1.6
-            elif goal == "maintain_weight":
-                protein_ratio = 1.05
-                fat_ratio = 0.85
-                carb_ratio = 1.1
-            else:
-                protein_ratio = 1
-                fat_ratio = 0.8
-                carb_ratio = 1.1
+
+def age_category_code(age):
+    """Код возрастной группы, согласованный с get_age_category"""
+    if age <= 18:
+        return 0
+    elif 19 <= age <= 30:
+        return 1
+    elif 31 <= age <= 59:
+        return 2
+    return 3
+
+
+def goal_code(goal):
+    return _GOAL_CODES.get(goal, OTHER_GOAL)
+
+
+def training_level_code(training_level):
+    return _TRAINING_LEVEL_CODES.get(training_level, OTHER_TRAINING_LEVEL)
+
+
+def calculate_calories(profile, training_level):
+    """Рассчитывает дневную норму калорий с учетом возраста, цели и уровня тренировок"""
+    g = gender_code(profile.gender)
+    row = _COEFFICIENT_ROWS[g][age_category_code(profile.age)][goal_code(profile.goal)][
+        training_level_code(training_level)]
+
+    # Основной обмен веществ (BMR)
+    bmr = (10 * profile.weight) + (6.25 * profile.height) - (5 * profile.age) + BMR_OFFSETS[g]
+
+    # Итоговый расчет
+    return round(bmr * row[GOAL_FACTOR] * row[TRAINING_FACTOR], 2)
+
+
+def calculate_macros(weight, age_category, goal, gender):
+    """Рассчитывает БЖУ на основе возраста, пола и фитнес-цели"""
+    # неизвестная возрастная группа считается по коэффициентам старшей группы
+    a = _AGE_CATEGORY_CODES.get(age_category, len(AGE_CATEGORIES) - 1)
+    row = _COEFFICIENT_ROWS[gender_code(gender)][a][goal_code(goal)][OTHER_TRAINING_LEVEL]
+    protein_ratio, fat_ratio, carb_ratio = row[PROTEIN_RATIO], row[FAT_RATIO], row[CARB_RATIO]
 
     # Рассчитываем БЖУ
     proteins = round(weight * protein_ratio, 2)
@@ -149,35 +150,97 @@ def calculate_macros(weight, age_category, goal, gender):
 
 def get_age_category(age):
     """Определяет возрастную группу пользователя"""
-    if age <= 18:
-        return "Подростки (10-18 лет)"
-    elif 19 <= age <= 30:
-        return "Молодые (19-30 лет)"
-    elif 31 <= age <= 59:
-        return "Взрослые (31-59 лет)"
-    else:
-        return "Пожилые (60+ лет)"
+    return AGE_CATEGORIES[age_category_code(age)]
+
+
+# ───── Пакетный (векторизованный) расчёт ─────
+
+def _encode(values, codes, missing):
+    """Переводит столбец строковых значений в коды; неизвестные значения — missing"""
+    return np.fromiter((codes.get(v, missing) for v in values), dtype=np.intp, count=len(values))
+
+
+def _round2(values):
+    """
+    Округление до 2 знаков, совпадающее со встроенным round().
+    np.round считает rint(x * 100), а произведение x * 100 неточно: если оно
+    попало ровно на «половину», направление решает знак ошибки умножения,
+    которая вычисляется точно по схеме Деккера (x раскладывается на две
+    половины мантиссы, каждая умножается на 100 без потерь).
+    """
+    scaled = values * 100
+    rounded = np.rint(scaled)
+    ties = np.flatnonzero(scaled - np.floor(scaled) == 0.5)
+    if ties.size:
+        x, p = values[ties], scaled[ties]
+        split = x * 134217729.0  # 2**27 + 1
+        high = split - (split - x)
+        error = (high * 100 - p) + (x - high) * 100
+        rounded[ties] = np.where(error == 0, rounded[ties], np.floor(p) + (error > 0))
+    return rounded / 100
+
+
+def calculate_norms_batch(weight, height, age, gender, goal, training_level):
+    """
+    Векторизованный аналог calculate_calories + calculate_macros.
+    Принимает столбцы (NumPy-массивы или последовательности) одинаковой длины,
+    возвращает словарь массивов: calories, proteins, fats, carbs и коэффициенты БЖУ.
+    Результат поэлементно совпадает со скалярными функциями.
+    """
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    age = np.asarray(age, dtype=np.float64)
+
+    g = _encode(gender, _GENDER_CODES, 1)
+    a = np.select(
+        [age <= 18, (19 <= age) & (age <= 30), (31 <= age) & (age <= 59)],
+        [0, 1, 2],
+        default=3,
+    )
+    rows = COEFFICIENTS[g, a, _encode(goal, _GOAL_CODES, OTHER_GOAL),
+                        _encode(training_level, _TRAINING_LEVEL_CODES, OTHER_TRAINING_LEVEL)]
+
+    bmr = (10 * weight) + (6.25 * height) - (5 * age) + np.take(BMR_OFFSETS, g)
+    calories = _round2(bmr * rows[:, GOAL_FACTOR] * rows[:, TRAINING_FACTOR])
+
+    protein_ratio, fat_ratio, carb_ratio = rows[:, PROTEIN_RATIO], rows[:, FAT_RATIO], rows[:, CARB_RATIO]
+    return {
+        "calories": calories,
+        "proteins": _round2(weight * protein_ratio),
+        "fats": _round2(weight * fat_ratio),
+        "carbs": _round2(weight * carb_ratio),
+        "protein_ratio": protein_ratio,
+        "fat_ratio": fat_ratio,
+        "carb_ratio": carb_ratio,
+    }
+
+
+def calculate_norms_for_profiles(profiles):
+    """Пакетный расчёт КБЖУ для списка профилей (User или любых объектов с теми же полями)"""
+    profiles = list(profiles)
+    return calculate_norms_batch(
+        weight=[p.weight for p in profiles],
+        height=[p.height for p in profiles],
+        age=[p.age for p in profiles],
+        gender=[p.gender for p in profiles],
+        goal=[p.goal for p in profiles],
+        training_level=[p.training_level for p in profiles],
+    )
 
 
 def get_training_recommendations(gender: str, age_category: str, goal: str) -> dict:
     """
     Возвращает рекомендации по тренировкам:
-    1) Сначала пытаемся взять шаблон из БД (RecommendationTemplate + WorkoutTemplate).
+    1) Сначала пытаемся взять шаблон из БД (RecommendationTemplate + WorkoutTemplate) через реестр.
     2) Если шаблона нет — используем «жёстко прописанный» запасной набор.
     """
-    # 1) Попытка из БД
-    try:
-        tpl = RecommendationTemplate.objects.get(
-            gender=gender,
-            age_category=age_category,
-            goal=goal
-        )
+    # 1) Попытка из реестра шаблонов (принимает и подпись группы, и её код)
+    tpl = template_registry.resolve(gender, AGE_CATEGORY_CODES.get(age_category, age_category), goal)
+    if tpl is not None:
         return {
             'description': tpl.description,
-            'workouts': [wt.name for wt in tpl.workouts.all()]
+            'workouts': list(tpl.workouts)
         }
-    except ObjectDoesNotExist:
-        pass
 
     recommendations = {}
 
@@ -224,13 +287,19 @@ def get_training_recommendations(gender: str, age_category: str, goal: str) -> d
                 ]
         elif age_category == "Взрослые (31-59 лет)":
             if goal == "gain_weight":
-                recommendations['description'] = "Силовые тренировки с акцентом на сохранение мышечной массы, 3-4 раза в неделю."
+                recommendations['description'] = (
+                    "Силовые тренировки с акцентом на сохранение мышечной массы, "
+                    "3-4 раза в неделю."
+                )
                 recommendations['workouts'] = [
                     "Жим штанги лежа — 3 подхода по 8 повторений",
                     "Тяга блока к груди — 3 подхода по 10 повторений"
                 ]
             elif goal == "maintain":
-                recommendations['description'] = "Сбалансированные тренировки с упором на восстановление, 3-4 раза в неделю."
+                recommendations['description'] = (
+                    "Сбалансированные тренировки с упором на восстановление, "
+                    "3-4 раза в неделю."
+                )
                 recommendations['workouts'] = [
                     "Легкое кардио — 20 минут",
                     "Комплекс упражнений на растяжку и легкие силовые упражнения — 3 подхода"
@@ -242,7 +311,10 @@ def get_training_recommendations(gender: str, age_category: str, goal: str) -> d
                 ]
         else:  # Пожилые (60+ лет)
             if goal == "gain_weight":
-                recommendations['description'] = "Силовые тренировки с низкой нагрузкой и поддержанием баланса, 2-3 раза в неделю."
+                recommendations['description'] = (
+                    "Силовые тренировки с низкой нагрузкой и поддержанием баланса, "
+                    "2-3 раза в неделю."
+                )
                 recommendations['workouts'] = [
                     "Упражнения с эспандером — 2 подхода по 10 повторений",
                     "Легкие приседания с опорой — 2 подхода по 10 повторений"
@@ -262,7 +334,10 @@ def get_training_recommendations(gender: str, age_category: str, goal: str) -> d
     else:  # Для женщин
         if age_category == "Подростки (10-18 лет)":
             if goal == "gain_weight":
-                recommendations['description'] = "Умеренные силовые тренировки, 3-4 раза в неделю с акцентом на технику."
+                recommendations['description'] = (
+                    "Умеренные силовые тренировки, "
+                    "3-4 раза в неделю с акцентом на технику."
+                )
                 recommendations['workouts'] = [
                     "Отжимания от стены или колен — 3 подхода по 10 повторений",
                     "Приседания с собственным весом — 3 подхода по 12 повторений",
@@ -315,16 +390,23 @@ def get_training_recommendations(gender: str, age_category: str, goal: str) -> d
                     "Легкие силовые упражнения с собственным весом — 2 подхода по 10 повторений"
                 ]
             else:
-                recommendations['description'] = "Легкий кардио режим с функциональными упражнениями, 3-4 раза в неделю."
+                recommendations['description'] = (
+                    "Легкий кардио режим с функциональными упражнениями, "
+                    "3-4 раза в неделю."
+                )
                 recommendations['workouts'] = [
                     "Быстрая ходьба — 30 минут",
                     "Упражнения на гибкость и баланс — 2 подхода по 10 повторений"
                 ]
         else:  # Пожилые (60+ лет)
             if goal == "gain_weight":
-                recommendations['description'] = "Легкие силовые тренировки, 2-3 раза в неделю с акцентом на стабильность и баланс."
+                recommendations['description'] = (
+                    "Легкие силовые тренировки, "
+                    "2-3 раза в неделю с акцентом на стабильность и баланс."
+                )
                 recommendations['workouts'] = [
-                    "Упражнения с собственным весом (сидячие приседания, отжимания от стены) — 2 подхода по 10 повторений",
+                    ("Упражнения с собственным весом (сидячие приседания, отжимания от стены)"
+                     " — 2 подхода по 10 повторений"),
                     "Легкие упражнения с эспандером — 2 подхода по 10 повторений"
                 ]
             elif goal == "maintain":